@@ -0,0 +1,255 @@
+# -*- coding: iso-8859-1 -*-
+import sys
+import copy
+import numpy as np
+
+import pygmin.accept_tests.metropolis as metropolis
+from pygmin.optimize import lbfgs_batch
+
+__all__ = ["MultiWalkerBasinHopping"]
+
+
+class _Walker(object):
+    """
+    the state of one basin hopping Markov chain in MultiWalkerBasinHopping
+
+    This has the attributes of BasinHopping that the takestep and accept
+    test classes access through driver=self
+    """
+    def __init__(self, index, coords, energy, takeStep, acceptTest):
+        self.index = index
+        self.coords = coords
+        self.markovE = energy
+        self.markovE_old = energy
+        self.takeStep = takeStep
+        self.acceptTest = acceptTest
+        self.temperature = acceptTest.temperature
+        self.trial_coords = coords
+        self.trial_energy = energy
+        self.acceptstep = True
+        self.stepnum = 0
+        self.naccepted = 0
+        self.rms = 0.
+        self.funcalls = 0
+
+
+class MultiWalkerBasinHopping(object):
+    """
+    advance many independent basin hopping runs in lockstep
+
+    For small systems most of the time in BasinHopping is spent in python
+    overhead rather than in the potential.  Here every step the trial
+    structures of all walkers are quenched together with one batched quench,
+    so the overhead is shared by all walkers.
+
+    Parameters
+    ----------
+    coords : array of shape (nwalkers, ndof)
+        the initial coordinates of each walker
+    potential :
+        the potential object.  It should implement a vectorized
+        getEnergyGradientMultiple(), otherwise there is no speedup
+    takeStep :
+        the step taking class.  Each walker gets its own deep copy so
+        that adaptive step sizes are adjusted independently.
+    storage : callable, optional
+        called from this process as storage(energy, coords) for accepted
+        steps of all walkers, e.g. Database.minimum_adder()
+    event_after_step : list of callables, optional
+        called after each step of each walker as
+        event(energy, coords, acceptstep)
+    acceptTest : callable, optional
+        the accept test.  Each walker gets its own deep copy.
+        If None, Metropolis is used.
+    temperature : float, optional
+        the temperature used in the metropolis criterion.
+    quenchRoutine : callable, optional
+        a batched quench with the interface of lbfgs_batch::
+
+            coords2d, energies, rms, funcalls = quenchRoutine(coords2d, potential, **quenchParameters)[:4]
+
+    quenchParameters : dict, optional
+        parameters passed to the quench routine
+    confCheck : list of callables, optional
+        see MonteCarlo
+    outstream : open file object, optional
+        where to print the quench information.  None for no printing
+    insert_rejected : bool
+        insert the rejected structures into the storage class
+
+    Attributes
+    ----------
+    walkers : list
+        the state of each Markov chain.  walkers[i].coords and walkers[i].markovE
+        are the current coords and energy of walker i
+
+    See Also
+    --------
+    pygmin.basinhopping.BasinHopping : a single walker
+    pygmin.optimize.LBFGSBatch : the batched quench
+    """
+    def __init__(self, coords, potential, takeStep, storage=None, event_after_step=[],
+                 acceptTest=None,
+                 temperature=1.0,
+                 quenchRoutine=lbfgs_batch,
+                 quenchParameters=dict(),
+                 confCheck=[],
+                 outstream=sys.stdout,
+                 insert_rejected=False
+                 ):
+        coords = np.array(coords, dtype=np.float64)
+        if coords.ndim != 2:
+            raise ValueError("coords must be a 2d array of shape (nwalkers, ndof)")
+        self.nwalkers = coords.shape[0]
+        self.potential = potential
+        self.storage = storage
+        self.event_after_step = copy.copy(event_after_step)
+        self.quenchRoutine = quenchRoutine
+        self.quenchParameters = quenchParameters
+        self.confCheck = confCheck
+        self.outstream = outstream
+        self.printfrq = 1
+        self.insert_rejected = insert_rejected
+        self.stepnum = 0
+
+        if acceptTest is None:
+            acceptTest = metropolis.Metropolis(temperature)
+
+        #########################################################################
+        #do initial quench
+        #########################################################################
+        ret = self.quenchRoutine(coords, self.potential, **self.quenchParameters)
+        newcoords, energies = ret[0], ret[1]
+
+        self.walkers = []
+        for i in range(self.nwalkers):
+            walker = _Walker(i, newcoords[i].copy(), energies[i],
+                             copy.deepcopy(takeStep), copy.deepcopy(acceptTest))
+            walker.rms = ret[2][i]
+            walker.funcalls = ret[3][i]
+            self.walkers.append(walker)
+            if self.storage:
+                self.storage(walker.markovE, walker.coords)
+            self.printStep(walker)
+
+    def setPrinting(self, ostream="default", frq=None):
+        """change how the printing is done.  See MonteCarlo.setPrinting"""
+        if ostream != "default":
+            self.outstream = ostream
+        if frq is not None:
+            self.printfrq = frq
+
+    def addEventAfterStep(self, event):
+        """add an even to the list event_after_step """
+        self.event_after_step.append( event )
+
+    def run(self, nsteps):
+        """do nsteps basin hopping steps for each walker"""
+        for istep in xrange(nsteps):
+            self.takeOneStep()
+
+    def takeOneStep(self):
+        """one basin hopping step for all walkers"""
+        self.stepnum += 1
+
+        #########################################################################
+        #take step
+        #########################################################################
+        trial = np.array([w.coords for w in self.walkers])
+        for w in self.walkers:
+            w.takeStep.takeStep(trial[w.index], driver=w)
+
+        #########################################################################
+        #quench all walkers at once
+        #########################################################################
+        ret = self.quenchRoutine(trial, self.potential, **self.quenchParameters)
+
+        for w in self.walkers:
+            w.stepnum = self.stepnum
+            w.markovE_old = w.markovE
+            w.trial_coords = ret[0][w.index].copy()
+            w.trial_energy = ret[1][w.index]
+            w.rms = ret[2][w.index]
+            w.funcalls = ret[3][w.index]
+
+            #check if step is a valid configuration, otherwise reject
+            w.acceptstep = True
+            for check in self.confCheck:
+                if not check(w.trial_energy, w.trial_coords, driver=w):
+                    w.acceptstep = False
+
+            #check whether step is accepted with user defined tests.
+            if w.acceptstep:
+                w.acceptstep = w.acceptTest(w.markovE, w.trial_energy, w.coords, w.trial_coords)
+
+            self.printStep(w)
+            w.takeStep.updateStep(w.acceptstep, driver=w)
+            if self.storage and (self.insert_rejected or w.acceptstep):
+                self.storage(w.trial_energy, w.trial_coords)
+
+            if w.acceptstep:
+                w.coords = w.trial_coords
+                w.markovE = w.trial_energy
+                w.naccepted += 1
+            for event in self.event_after_step:
+                event(w.markovE, w.coords, w.acceptstep)
+
+    def printStep(self, w):
+        if self.stepnum % self.printfrq == 0:
+            if self.outstream != None:
+                self.outstream.write( "Qu   " + str(self.stepnum) + " walker= " + str(w.index) + " E= " + str(w.trial_energy) + " quench_steps= " + str(w.funcalls) + " RMS= " + str(w.rms) + " Markov E= " + str(w.markovE_old) + " accepted= " + str(w.acceptstep) + "\n" )
+
+
+import unittest
+class _AcceptLower(object):
+    """accept only steps which lower the energy"""
+    temperature = 1.
+    def __call__(self, markovE, trial_energy, coords, trial_coords):
+        return trial_energy < markovE
+
+class TestMultiWalkerBasinHopping(unittest.TestCase):
+    def test_step(self):
+        from pygmin.systems import LJCluster
+        np.random.seed(0)
+        nwalkers = 4
+        system = LJCluster(13)
+        pot = system.get_potential()
+        coords = np.array([system.get_random_configuration() for i in range(nwalkers)])
+        stored = []
+        bh = MultiWalkerBasinHopping(coords, pot, system.get_takestep(),
+                                     storage=lambda E, x: stored.append(E),
+                                     acceptTest=_AcceptLower(), outstream=None)
+        self.assertEqual(len(stored), nwalkers)
+        naccepted = 0
+        for step in range(5):
+            old = [(w.markovE, w.coords.copy()) for w in bh.walkers]
+            bh.takeOneStep()
+            for w, (E, x) in zip(bh.walkers, old):
+                self.assertAlmostEqual(w.trial_energy, pot.getEnergy(w.trial_coords), 8)
+                self.assertEqual(w.acceptstep, w.trial_energy < E)
+                if w.acceptstep:
+                    naccepted += 1
+                    self.assertEqual(w.markovE, w.trial_energy)
+                    self.assertTrue(np.all(w.coords == w.trial_coords))
+                else:
+                    self.assertEqual(w.markovE, E)
+                    self.assertTrue(np.all(w.coords == x))
+        self.assertGreater(naccepted, 0)
+        self.assertEqual(len(stored), nwalkers + naccepted)
+        self.assertEqual(naccepted, sum(w.naccepted for w in bh.walkers))
+
+
+if __name__ == "__main__":
+    import time
+    from pygmin.systems import LJCluster
+    natoms = 13
+    nwalkers = 32
+    system = LJCluster(natoms)
+    db = system.create_database()
+    coords = np.array([system.get_random_configuration() for i in range(nwalkers)])
+    bh = MultiWalkerBasinHopping(coords, system.get_potential(), system.get_takestep(),
+                                 storage=db.minimum_adder(), outstream=None)
+    t0 = time.time()
+    bh.run(50)
+    print "%d quenches in %.3g seconds" % (nwalkers * 50, time.time() - t0)
+    print "lowest energy found", db.minima()[0].energy
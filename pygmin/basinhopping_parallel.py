@@ -0,0 +1,184 @@
+# -*- coding: iso-8859-1 -*-
+from collections import deque
+import multiprocessing as mp
+
+#this import fixes some bugs in how multiprocessing deals with exceptions
+import pygmin.utils.fix_multiprocessing
+
+from pygmin.basinhopping import BasinHopping
+
+__all__ = ["ParallelBasinHopping"]
+
+#the potential and quench routine for the worker processes.  These are set
+#once per worker by _initWorker so the potential is only pickled when the
+#pool is started and not for every quench.
+_worker_potential = None
+_worker_quenchRoutine = None
+_worker_quenchParameters = None
+
+def _initWorker(potential, quenchRoutine, quenchParameters):
+    global _worker_potential, _worker_quenchRoutine, _worker_quenchParameters
+    _worker_potential = potential
+    _worker_quenchRoutine = quenchRoutine
+    _worker_quenchParameters = quenchParameters
+
+def _quenchWorker(coords):
+    """quench coords in a worker process and return coords, energy, rms, funcalls"""
+    ret = _worker_quenchRoutine(coords, _worker_potential.getEnergyGradient,
+                                **_worker_quenchParameters)
+    return ret[:4]
+
+
+class ParallelBasinHopping(BasinHopping):
+    """
+    basin hopping with the quenches done in parallel by a pool of worker processes
+
+    Parameters
+    ----------
+    inherited params :
+        all required and optional parameters from BasinHopping are also accepted
+    ncores : int, optional
+        the number of worker processes.  This is also the number of trial
+        quenches kept in flight at any one time.
+
+    Notes
+    -----
+    The trial steps are generated in the master process from the current
+    Markov state and the quenches are sent to the pool.  As soon as the oldest
+    quench returns it is processed exactly as a step of BasinHopping
+    (accept test, storage, takestep update, events) and a new trial
+    is sent to the pool starting from the (possibly updated) Markov state.
+    The results are always processed in the order the trials were generated,
+    so, for a given random seed, the sequence of steps does not depend on
+    the timing of the workers.  All minima are passed to `storage` in the
+    master process, so e.g. a Database only ever has one writer.
+
+    Because ncores trials are in flight, a trial can be started from a Markov
+    state which is up to ncores-1 steps old.  This is harmless for global
+    optimization, but note the chain does not strictly satisfy detailed balance.
+
+    The worker pool is started on the first call to run() and must be
+    stopped with close() when you are done.
+
+    See Also
+    --------
+    BasinHopping : base class
+    """
+    def __init__(self, *args, **kwargs):
+        self.ncores = kwargs.pop("ncores", 4)
+        self._pool = None
+        self._trials = deque()
+        super(ParallelBasinHopping, self).__init__(*args, **kwargs)
+
+    def _startPool(self):
+        self._pool = mp.Pool(self.ncores, _initWorker,
+                             (self.potential, self.quenchRoutine, self.quenchParameters))
+
+    def close(self):
+        """stop the worker processes.  Any trial quenches in flight are discarded"""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._trials.clear()
+
+    def _submitTrial(self):
+        coords_after_step = self.coords.copy()
+        self.takeStep.takeStep(coords_after_step, driver=self)
+        self._trials.append( self._pool.apply_async(_quenchWorker, (coords_after_step,)) )
+
+    def _mcStep(self):
+        """
+        take one basin hopping step using the oldest quench in the pool
+
+        overload the BasinHopping step
+        """
+        if self._pool is None:
+            self._startPool()
+        #keep the pool full
+        while len(self._trials) < self.ncores:
+            self._submitTrial()
+
+        #########################################################################
+        #wait for the oldest quench
+        #########################################################################
+        ret = self._trials.popleft().get()
+        self.trial_coords = ret[0]
+        self.trial_energy = ret[1]
+        self.rms = ret[2]
+        self.funcalls = ret[3]
+
+        #########################################################################
+        # check if step is a valid configuration, otherwise reject
+        #########################################################################
+        self.acceptstep = True
+        for check in self.confCheck:
+            if not check(self.trial_energy, self.trial_coords, driver=self):
+                self.acceptstep=False
+
+        #########################################################################
+        #check whether step is accepted with user defined tests.
+        #########################################################################
+        if self.acceptstep:
+            self.acceptstep = self.acceptTest(self.markovE, self.trial_energy, self.coords, self.trial_coords)
+
+        return self.acceptstep, self.trial_coords, self.trial_energy
+
+    def run(self, nsteps):
+        """do multiple iterations
+
+        The worker pool is terminated if an exception is raised
+        """
+        try:
+            super(ParallelBasinHopping, self).run(nsteps)
+        except:
+            print "exception raised while running ParallelBasinHopping, terminating pool"
+            self.close()
+            raise
+
+    def __getstate__(self):
+        ddict = super(ParallelBasinHopping, self).__getstate__()
+        del ddict["_pool"]
+        del ddict["_trials"]
+        return ddict
+
+    def __setstate__(self, dct):
+        super(ParallelBasinHopping, self).__setstate__(dct)
+        self._pool = None
+        self._trials = deque()
+
+
+import unittest
+class TestParallelBasinHopping(unittest.TestCase):
+    def run_chain(self, seed, ncores=2, nsteps=12):
+        import numpy as np
+        from pygmin.systems import LJCluster
+        np.random.seed(seed)
+        system = LJCluster(13)
+        db = system.create_database()
+        bh = system.get_basinhopping(database=db, parallel=True, ncores=ncores, outstream=None)
+        chain = []
+        bh.addEventAfterStep(lambda E, coords, accepted: chain.append((E, accepted)))
+        try:
+            bh.run(nsteps)
+        finally:
+            bh.close()
+        return chain
+
+    def test_reproducible(self):
+        """the same seed and ncores give the same Markov chain"""
+        chain1 = self.run_chain(1)
+        chain2 = self.run_chain(1)
+        self.assertEqual(len(chain1), 12)
+        self.assertEqual(chain1, chain2)
+
+
+if __name__ == "__main__":
+    from pygmin.systems import LJCluster
+    natoms = 38
+    sys = LJCluster(natoms)
+    db = sys.create_database()
+    bh = sys.get_basinhopping(database=db, parallel=True, ncores=4)
+    bh.run(100)
+    bh.close()
+    print "found", len(db.minima()), "minima.  lowest", db.minima()[0].energy
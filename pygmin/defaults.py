@@ -78,7 +78,7 @@ The following are sections of the code which should have default settings in thi
 
 """
 
-quenchRoutine = quench.lbfgs_py
+quenchRoutine = quench.lbfgs_fast
 quenchParams = dict()
 
 #tsSearchRoutine = pygmin.transition_states.findTransitionState #  was causing cyclical import problems 
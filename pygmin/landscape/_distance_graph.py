@@ -1,10 +1,105 @@
+import multiprocessing as mp
 import networkx as nx
 import numpy as np
 
+#this import fixes some bugs in how multiprocessing deals with exceptions
+import pygmin.utils.fix_multiprocessing
+
 from pygmin.landscape import Graph
 
 __all__ = []
 
+#the mindist function for the worker processes.  It is set once per worker
+#by _initWorker so it is only pickled when the pool is started.
+_worker_mindist = None
+
+def _initWorker(mindist):
+    global _worker_mindist
+    _worker_mindist = mindist
+
+def _mindistWorker(coords):
+    """return the distance between coords[0] and coords[1]"""
+    return _worker_mindist(coords[0], coords[1])[0]
+
+class _DistanceStore(object):
+    """
+    the known distances between minima
+    
+    The distances are keyed by the pair of minimum ids, in either order.
+    Most of the distances are kept in a sorted array of keys and an array of
+    distances, 16 bytes per distance, and are found by bisection.  New 
+    distances go into a dictionary which is merged into the arrays when it
+    holds merge_size distances.
+    
+    Parameters
+    ----------
+    pairs : int array, shape (n, 2), optional
+        the ids of the minima
+    dists : float array, optional
+        the distances
+    merge_size : int
+    """
+    def __init__(self, pairs=None, dists=None, merge_size=10000):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.dists = np.zeros(0)
+        self.recent = dict()
+        self.merge_size = merge_size
+        if pairs is not None and len(pairs) > 0:
+            pairs = np.asarray(pairs, dtype=np.int64).reshape(-1,2)
+            self._merge(self._pair_keys(pairs), np.asarray(dists, dtype=np.float64))
+    
+    def __len__(self):
+        return len(self.keys) + len(self.recent)
+    
+    @staticmethod
+    def _key(id1, id2):
+        if id1 > id2:
+            id1, id2 = id2, id1
+        return (id1 << 32) + id2
+
+    @staticmethod
+    def _pair_keys(pairs):
+        return (pairs.min(axis=1) << 32) + pairs.max(axis=1)
+    
+    def _merge(self, keys, dists):
+        """merge keys and dists into the sorted arrays.  The new distances
+        replace old ones with the same key"""
+        keys = np.concatenate((self.keys, keys))
+        dists = np.concatenate((self.dists, dists))
+        order = np.argsort(keys, kind="mergesort")
+        keys = keys[order]
+        dists = dists[order]
+        # mergesort is stable, so the last of equal keys is the newest
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+        self.keys = keys[last]
+        self.dists = dists[last]
+    
+    def _merge_recent(self):
+        if len(self.recent) == 0:
+            return
+        keys = np.fromiter(self.recent.iterkeys(), dtype=np.int64, count=len(self.recent))
+        dists = np.fromiter(self.recent.itervalues(), dtype=np.float64, count=len(self.recent))
+        self.recent = dict()
+        self._merge(keys, dists)
+    
+    def get(self, id1, id2):
+        """return the distance or None if it is not known"""
+        key = self._key(id1, id2)
+        dist = self.recent.get(key)
+        if dist is not None:
+            return dist
+        i = self.keys.searchsorted(key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return float(self.dists[i])
+        return None
+    
+    def set(self, id1, id2, dist):
+        self.recent[self._key(id1, id2)] = dist
+        if len(self.recent) >= self.merge_size:
+            self._merge_recent()
+
+
 class _DistanceGraph(object):
     """
     This graph is used by DoubleEndedConnect to make educated guesses for connecting two minima
@@ -26,6 +121,28 @@ class _DistanceGraph(object):
         distances have been accumulated
     db_update_min : int
         only update the database when at least this many new distances have been found.
+    max_preload_distances : int, optional
+        if the database holds more distances than this, they are not all
+        loaded into memory at the start.  Distances which are not in memory
+        are then looked up in the database.
+    ncores : int, optional
+        if greater than 1, the distances needed when minima are added are
+        calculated in parallel by a pool of this many worker processes.  
+        The pool is started when first needed and stopped with close().
+    distance_bound : callable, optional
+        a cheap lower bound on mindist, e.g. RadialDistanceBound.  It must
+        have the methods profiles(coords) and compare(profile, profiles).
+        If given, minima which the bound shows are further from the start
+        or end minimum than they are from each other are not considered 
+        relevant.  And when a minimum is added, mindist is not called for
+        pairs whose bound is larger than the threshold below.  The bound is
+        used as the edge weight instead, and the exact distance is only
+        calculated if the edge is on the shortest path.
+    defer_fraction : float
+        mindist is deferred for pairs whose bound is larger than
+        defer_fraction times the distance between the start and end minima.
+        With the default, 0, it is deferred for all pairs with non zero
+        bound.
     
     Description
     -----------
@@ -44,16 +161,26 @@ class _DistanceGraph(object):
     them again.  The minimum weight path between min1 and min2 in this graph gives a
     good guess for the best way to try connect min1 and min2.  
 
+    If distance_bound is used, the weight of an edge between minima
+    which are far apart can be bound(u, v)**2 instead.  That is never larger
+    than the true weight, so a shortest path which uses none of these edges
+    is the true shortest path.  shortestPath() calculates the exact
+    distances on the path until that is the case.
+
     """
     def __init__(self, database, graph, mindist, verbosity=0,
-                 defer_database_update=True, db_update_min=300):
+                 defer_database_update=True, db_update_min=300,
+                 max_preload_distances=None, ncores=1, distance_bound=None,
+                 defer_fraction=0.):
         self.database = database
         self.graph = graph
         self.mindist = mindist
         self.verbosity = verbosity
         
         self.Gdist = nx.Graph()
-        self.distance_map = dict() #place to store distances locally for faster lookup
+        self.distance_map = _DistanceStore() #place to store distances locally for faster lookup
+        self.max_preload_distances = max_preload_distances
+        self.distances_preloaded = True
         nx.set_edge_attributes(self.Gdist, "weight", dict())
         self.debug = False
         
@@ -63,6 +190,22 @@ class _DistanceGraph(object):
         self.db_update_min = db_update_min
         
         self.infinite_weight = 1e20
+        
+        self.ncores = ncores
+        self._pool = None
+        
+        self.distance_bound = distance_bound
+        self.defer_fraction = defer_fraction
+        self.defer_threshold = None #set in initialize()
+        self._profiles = dict() #the profiles of distance_bound, keyed by id
+        self._bound_edges = set() #the edges with weight from distance_bound
+    
+    def close(self):
+        """stop the worker processes"""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
 
     def distToWeight(self, dist):
         """
@@ -100,7 +243,7 @@ class _DistanceGraph(object):
             self.new_distances[(min1, min2)] = dist
         else:
             self.database.setDistance(dist, min1, min2)
-        self.distance_map[(min1, min2)] = dist
+        self.distance_map.set(min1._id, min2._id, dist)
         
         #make sure a zeroed edge weight is not overwritten
         #if not self.edge_weight.has_key((min1, min2)):
@@ -112,19 +255,19 @@ class _DistanceGraph(object):
         get distance from local memory.  if it doesn't exist, return None,
         don't calculate it.
         """
-        #first try to get the distance from the dictionary 
-        dist = self.distance_map.get((min1,min2))
-        if dist is not None: return dist
-        dist = self.distance_map.get((min2,min1))
+        #first try to get the distance from memory
+        dist = self.distance_map.get(min1._id, min2._id)
         if dist is not None: return dist
 
-        if False:
-            #this is extremely slow for large databases (> 50% of time spent here)
-            #also, it's not necessary if we load all the distances in initialize()
-            #if that fails, try to get it from the database
+        if not self.distances_preloaded:
+            #this is slow, so it is only done if not all distances could be
+            #loaded in _initializeDistances().  Database.setDistance
+            #doesn't order the ids, so try both
             dist = self.database.getDistance(min1, min2)
-            if dist is not None: 
-                print "distance in database but not in distance_map"
+            if dist is None:
+                dist = self.database.getDistance(min2, min1)
+            if dist is not None:
+                self.distance_map.set(min1._id, min2._id, dist)
                 return dist
         return None
 
@@ -143,6 +286,81 @@ class _DistanceGraph(object):
         self._setDist(min1, min2, dist)
         return dist
     
+    @staticmethod
+    def _edgeKey(min1, min2):
+        return min(min1._id, min2._id), max(min1._id, min2._id)
+
+    def _getProfiles(self, minima):
+        """return the profiles of distance_bound for the minima as an array"""
+        new = [m for m in minima if m._id not in self._profiles]
+        if len(new) > 0:
+            profiles = self.distance_bound.profiles(np.array([m.coords for m in new]))
+            for m, p in zip(new, profiles):
+                self._profiles[m._id] = p
+        return np.array([self._profiles[m._id] for m in minima])
+
+    def _splitByBound(self, pairs):
+        """
+        split pairs into those which need mindist and those whose lower
+        bound is larger than defer_threshold
+        
+        Returns
+        -------
+        near : list
+            the pairs for which mindist should be called
+        far : list
+            the other pairs
+        bounds : list
+            the lower bounds of the distances of far
+        """
+        if self.distance_bound is None or self.defer_threshold is None or len(pairs) == 0:
+            return pairs, [], []
+        p1 = self._getProfiles([m1 for m1, m2 in pairs])
+        p2 = self._getProfiles([m2 for m1, m2 in pairs])
+        bounds = self.distance_bound.compare(p1, p2)
+        isfar = bounds > self.defer_threshold
+        near = [pair for pair, f in zip(pairs, isfar) if not f]
+        far = [pair for pair, f in zip(pairs, isfar) if f]
+        return near, far, list(bounds[isfar])
+
+    def _missingPairs(self, minima):
+        """return the pairs of minima in minima and Gdist for which the
+        distance is not known and is not deferred by distance_bound"""
+        nodes = list(self.Gdist.nodes()) + [m for m in minima if m not in self.Gdist]
+        pairs = []
+        for i in xrange(len(nodes)):
+            for j in xrange(i + 1, len(nodes)):
+                if self._getDistNoCalc(nodes[i], nodes[j]) is None:
+                    pairs.append((nodes[i], nodes[j]))
+        return self._splitByBound(pairs)[0]
+    
+    def _calculateDistances(self, pairs):
+        """
+        calculate and store the distances between the pairs of minima
+        
+        if ncores > 1 this is done in parallel
+        """
+        if len(pairs) == 0:
+            return
+        if self.ncores > 1 and len(pairs) > 1:
+            if self._pool is None:
+                self._pool = mp.Pool(self.ncores, _initWorker, (self.mindist,))
+            coords = [(m1.coords, m2.coords) for m1, m2 in pairs]
+            chunksize = max(1, len(pairs) // (4 * self.ncores))
+            try:
+                dists = list(self._pool.imap(_mindistWorker, coords, chunksize))
+            except:
+                print "exception raised while calculating distances in parallel, terminating pool"
+                self.close()
+                raise
+        else:
+            dists = [self.mindist(m1.coords, m2.coords)[0] for m1, m2 in pairs]
+        for (min1, min2), dist in zip(pairs, dists):
+            if self.verbosity > 1:
+                print "calculated distance between", min1._id, min2._id, dist
+            self._setDist(min1, min2, dist)
+        self.updateDatabase()
+    
 #    def _addEdge(self, min1, min2):
 #        """
 #        add a new edge to the graph.  Calculate the distance
@@ -182,11 +400,21 @@ class _DistanceGraph(object):
                 self.setTransitionStateConnection(m, m2)
         
         #for all other nodes set the weight to be the distance
-        for m2 in self.Gdist.nodes():
-            if not self.Gdist.has_edge(m, m2):
-                dist = self.getDist(m, m2)
-                weight = self.distToWeight(dist)
-                self.Gdist.add_edge(m, m2, {"weight":weight})
+        others = [m2 for m2 in self.Gdist.nodes() if not self.Gdist.has_edge(m, m2)]
+        #calculate the missing distances all at once, so it can be done in parallel.
+        #For minima which are far apart use the lower bound for now
+        near, far, bounds = self._splitByBound([(m, m2) for m2 in others 
+                                                if self._getDistNoCalc(m, m2) is None])
+        self._calculateDistances(near)
+        for (m1, m2), bound in zip(far, bounds):
+            self.Gdist.add_edge(m, m2, {"weight":self.distToWeight(bound)})
+            self._bound_edges.add(self._edgeKey(m, m2))
+        for m2 in others:
+            if self.Gdist.has_edge(m, m2):
+                continue
+            dist = self.getDist(m, m2)
+            weight = self.distToWeight(dist)
+            self.Gdist.add_edge(m, m2, {"weight":weight})
 
 
         
@@ -226,6 +454,7 @@ class _DistanceGraph(object):
             w = self.Gdist[min1][min2]["weight"]
             if not w < 1e-6:
                 self.Gdist.add_edge(min1, min2, weight=self.infinite_weight)
+                self._bound_edges.discard(self._edgeKey(min1, min2))
         return True
 #        try:
 #            self.Gdist.remove_edge(min1, min2)
@@ -235,20 +464,14 @@ class _DistanceGraph(object):
 
     def _initializeDistances(self):
         """put all distances in the database into distance_map for faster access"""
-#        from pygmin.storage.database import Distance
-#        from sqlalchemy.sql import select
-#        conn = self.database.engine.connect()
-#        sql = select([Distance.__table__])
-#        for tmp, dist, id1, id2 in conn.execute(sql):
-#            #m1 = self.database.getMinimum(id1)
-#            #m2 = self.database.getMinimum(id2)
-#            self.distance_map[id1, id2] = dist
-        if False:
-            for d in self.database.distances():
-                self.distance_map[(d.minimum1, d.minimum2)] = d.dist
-        else:
-            for d in self.database.distances():
-                self.distance_map[(d._minimum1_id, d._minimum2_id)] = d.dist
+        if self.max_preload_distances is not None:
+            if self.database.number_of_distances() > self.max_preload_distances:
+                print "    too many distances in the database, they will be read when needed"
+                self.distances_preloaded = False
+                return
+        pairs, dists = self.database.distance_arrays()
+        self.distance_map = _DistanceStore(pairs, dists)
+        self.distances_preloaded = True
 
     def replaceTransitionStateGraph(self, graph):
         self.graph = graph
@@ -266,7 +489,19 @@ class _DistanceGraph(object):
         start_end_distance = self.getDist(minstart, minend)
         count = 0
         naccept = 0
-        for m in self.graph.graph.nodes():
+        relevant = []
+        nodes = self.graph.graph.nodes()
+        if self.distance_bound is not None and len(nodes) > 0:
+            #reject the minima which are certainly too far away without 
+            #looking up the distances
+            profiles = self._getProfiles(nodes)
+            pstart, pend = self._getProfiles([minstart, minend])
+            bounds = np.maximum(self.distance_bound.compare(pstart, profiles),
+                                self.distance_bound.compare(pend, profiles))
+            count = len(nodes)
+            nodes = [m for m, b in zip(nodes, bounds) if b <= start_end_distance]
+            count -= len(nodes)
+        for m in nodes:
             count += 1
             d1 = self._getDistNoCalc(m, minstart)
             if d1 is None: continue
@@ -279,8 +514,11 @@ class _DistanceGraph(object):
             print "    accepting minimum", d1, d2, start_end_distance
             
             naccept += 1
-            self.addMinimum(m)
+            relevant.append(m)
         print "    found", naccept, "relevant minima out of", count
+        self._calculateDistances(self._missingPairs(relevant))
+        for m in relevant:
+            self.addMinimum(m)
 
 
     def initialize(self, minstart, minend, use_all_min=False, use_limited_min=True):
@@ -295,6 +533,8 @@ class _DistanceGraph(object):
         self._initializeDistances()
         #raw_input("Press Enter to continue:")
         dist = self.getDist(minstart, minend)
+        if self.distance_bound is not None:
+            self.defer_threshold = dist * self.defer_fraction
         self.addMinimum(minstart)
         self.addMinimum(minend)
         if use_all_min:
@@ -303,6 +543,7 @@ class _DistanceGraph(object):
             """
             print "adding all minima to distance graph (Gdist)."
             print "    This might take a while."
+            self._calculateDistances(self._missingPairs(self.graph.graph.nodes()))
             for m in self.graph.graph.nodes():
                 self.addMinimum(m)
         elif use_limited_min:
@@ -319,14 +560,34 @@ class _DistanceGraph(object):
         """
         weight = 0.
         self.Gdist.add_edge(min1, min2, {"weight":weight})
+        self._bound_edges.discard(self._edgeKey(min1, min2))
+
+    def _resolveBoundEdges(self, edges):
+        """replace the lower bound edge weights by the exact distances"""
+        self._calculateDistances([(u, v) for u, v in edges 
+                                  if self._getDistNoCalc(u, v) is None])
+        for u, v in edges:
+            self._bound_edges.discard(self._edgeKey(u, v))
+            weight = self.distToWeight(self.getDist(u, v))
+            self.Gdist.add_edge(u, v, {"weight":weight})
 
     def shortestPath(self, min1, min2):
         """return the minimum weight path path between min1 and min2""" 
-        try:
-            path = nx.shortest_path(
-                    self.Gdist, min1, min2, weight="weight")
-        except nx.NetworkXNoPath:
-            return None, None
+        while True:
+            try:
+                path = nx.shortest_path(
+                        self.Gdist, min1, min2, weight="weight")
+            except nx.NetworkXNoPath:
+                return None, None
+            #the path is only the true shortest path if none of the edge
+            #weights are lower bounds
+            edges = [(path[i], path[i+1]) for i in range(len(path)-1)
+                     if self._edgeKey(path[i], path[i+1]) in self._bound_edges]
+            if len(edges) == 0:
+                break
+            if self.verbosity > 1:
+                print "    calculating", len(edges), "distances in the path guess"
+            self._resolveBoundEdges(edges)
         
         #get_edge attributes is really slow:
         #weights = nx.get_edge_attributes(self.Gdist, "weight") #this takes order number_of_edges
@@ -352,7 +613,14 @@ class _DistanceGraph(object):
             wnew = min(w1, w2)
             #note: this will override any previous call to self.setTransitionStateConnection
             self.Gdist.add_edge(min1, m, weight=wnew)
+            if w2 < w1:
+                if self._edgeKey(min2, m) in self._bound_edges:
+                    self._bound_edges.add(self._edgeKey(min1, m))
+                else:
+                    self._bound_edges.discard(self._edgeKey(min1, m))
             
+        for m in self.Gdist[min2]:
+            self._bound_edges.discard(self._edgeKey(min2, m))
         self.Gdist.remove_node(min2)
             
 
@@ -409,6 +677,90 @@ class _DistanceGraph(object):
 #
 
 import unittest
+class TestDistanceStore(unittest.TestCase):
+    def test_store(self):
+        pairs = np.array([[1,2], [5,3], [2,7], [3,5]])
+        store = _DistanceStore(pairs, [1., 2., 3., 4.], merge_size=3)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.get(2, 1), 1.)
+        # the last of duplicate pairs wins
+        self.assertEqual(store.get(3, 5), 4.)
+        self.assertIs(store.get(1, 7), None)
+        store.set(7, 1, 5.)
+        store.set(1, 2, 6.)
+        self.assertEqual(store.get(1, 2), 6.)
+        store.set(8, 9, 7.)
+        self.assertEqual(len(store.recent), 0)
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store.get(1, 2), 6.)
+        self.assertEqual(store.get(1, 7), 5.)
+        self.assertEqual(store.get(9, 8), 7.)
+
+def _cartesian_dist(coords1, coords2):
+    return np.linalg.norm(coords1 - coords2), coords1, coords2
+
+class TestDistanceGraphParallel(unittest.TestCase):
+    def test_parallel(self):
+        from pygmin.landscape import Graph
+        from pygmin.landscape._graph import create_random_database
+        db = create_random_database(nmin=10, natoms=4, nts=5)
+        min1, min2 = list(db.minima())[:2]
+        dist_graph = _DistanceGraph(db, Graph(db), _cartesian_dist, ncores=2)
+        try:
+            dist_graph.initialize(min1, min2, use_all_min=True)
+        finally:
+            dist_graph.close()
+        self.assertIs(dist_graph._pool, None)
+        minima = db.minima()
+        self.assertEqual(dist_graph.Gdist.number_of_nodes(), len(minima))
+        for m1 in minima:
+            for m2 in minima:
+                if m1 is m2: continue
+                dist = np.linalg.norm(m1.coords - m2.coords)
+                self.assertAlmostEqual(dist_graph._getDistNoCalc(m1, m2), dist, 12)
+        # no distance of a minimum to itself is computed or stored
+        for m in minima:
+            self.assertIs(dist_graph.distance_map.get(m._id, m._id), None)
+        # the distances are written to the database in bulk
+        dist_graph.updateDatabase(force=True)
+        distances = list(db.distances())
+        for d in distances:
+            self.assertNotEqual(d._minimum1_id, d._minimum2_id)
+        self.assertEqual(len(distances), len(minima) * (len(minima) - 1) / 2)
+        self.assertAlmostEqual(db.getDistance(minima[0], minima[5]),
+                               np.linalg.norm(minima[0].coords - minima[5].coords), 12)
+
+class TestDistanceGraphBound(unittest.TestCase):
+    def test_bound(self):
+        from pygmin.landscape import Graph
+        from pygmin.storage import Database
+        from pygmin.mindist import RadialDistanceBound
+        #structures of different size, so many of the bounds are large
+        db = Database()
+        minima = [db.addMinimum(float(i), np.random.uniform(-1, 1, 12) * (1. + 0.2 * i))
+                  for i in range(20)]
+        db.addTransitionState(0., np.zeros(12), minima[3], minima[5])
+        min1, min2 = minima[:2]
+        calls = []
+        def mindist(x1, x2):
+            calls.append(1)
+            return _cartesian_dist(x1, x2)
+        dist_graph = _DistanceGraph(db, Graph(db), mindist, 
+                                    distance_bound=RadialDistanceBound())
+        dist_graph.initialize(min1, min2, use_all_min=True)
+        self.assertGreater(len(dist_graph._bound_edges), 0)
+        self.assertLess(len(calls), 20*21/2)
+        
+        #the shortest path must be the same as with all the exact distances
+        G = dist_graph.Gdist.copy()
+        for u, v in G.edges():
+            if dist_graph._edgeKey(u, v) in dist_graph._bound_edges:
+                G[u][v]["weight"] = np.linalg.norm(u.coords - v.coords)**2
+        path, weights = dist_graph.shortestPath(min1, min2)
+        self.assertAlmostEqual(sum(weights), nx.shortest_path_length(G, min1, min2, weight="weight"), 10)
+        for u, v in zip(path[:-1], path[1:]):
+            self.assertNotIn(dist_graph._edgeKey(u, v), dist_graph._bound_edges)
+
 class TestDistanceGraph(unittest.TestCase):
     def setUp(self):
         from pygmin.landscape import DoubleEndedConnect
@@ -1,4 +1,6 @@
 '''Wrapper to represent a storage class as a graph'''
+import gc
+
 import networkx as nx
 
 __all__ = ["Graph"]
@@ -36,6 +38,61 @@ class _ConnectedComponents():
         return self.component[min1] == self.component[min2]
             
 
+class _LazyTransitionState(object):
+    """
+    stands in for a TransitionState on the edges of Graph
+    
+    Making a TransitionState object for every edge takes most of the time
+    needed to build the graph of a large database.  This only knows the id 
+    and the energy, which are read in bulk.  Any other attribute is taken
+    from the TransitionState, which is loaded the first time it is needed.
+    
+    It compares equal to the TransitionState with the same id, and to other
+    proxies of it, but it is not a TransitionState:
+    isinstance(edge["ts"], TransitionState) is False.  Use the loaded object,
+    edge["ts"]._load(), where the real TransitionState is needed.
+    """
+    _ts = None
+    
+    def __init__(self, database, id_, energy):
+        d = self.__dict__
+        d["_database"] = database
+        d["_id"] = id_
+        d["energy"] = energy
+    
+    def _load(self):
+        if self._ts is None:
+            from pygmin.storage.database import TransitionState
+            self.__dict__["_ts"] = self._database.session.query(TransitionState).get(self._id)
+        return self._ts
+    
+    def __getattr__(self, name):
+        if name.startswith("__") or name in ("_database", "_id", "_ts"):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+    
+    def __deepcopy__(self, memo):
+        #the copy would refer to the same database object
+        return self
+    
+    def __setattr__(self, name, value):
+        if name == "energy":
+            self.__dict__["energy"] = value
+        setattr(self._load(), name, value)
+    
+    def __eq__(self, ts):
+        from pygmin.storage.database import TransitionState
+        if not isinstance(ts, (TransitionState, _LazyTransitionState)):
+            return NotImplemented
+        return ts._id == self._id
+    
+    def __ne__(self, ts):
+        return not self == ts
+    
+    def __hash__(self):
+        return hash(self._id)
+
+
 class Graph(object):
     '''
     Wrapper to represent a database object as a graph
@@ -67,11 +124,30 @@ class Graph(object):
     def _build_all(self):
         """
         add all minima and all transition states to the graph
+        
+        The minima are loaded with a single query, which only selects the id
+        and the energy (the coordinates are deferred).  The transition states
+        are read with transition_state_arrays, the TransitionState objects are
+        only loaded when they are used (see _LazyTransitionState)
         """
-        for m in self.storage.minima():
-            self.graph.add_node(m)
-        for ts in self.storage.transition_states():
-            self.graph.add_edge(ts.minimum1, ts.minimum2, ts=ts)
+        #the graph of a large database consists of millions of objects.  The
+        #garbage collector would scan them again and again while they are
+        #created, although none of them can be garbage.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            minima = self.storage.minima(order_energy=False)
+            self.graph.add_nodes_from(minima)
+            #look the minima up by id, loading them through ts.minimum1 is slow
+            id2min = dict([(m._id, m) for m in minima])
+            ids, energies, pairs = self.storage.transition_state_arrays()
+            self.graph.add_edges_from(
+                (id2min[id1], id2min[id2], 
+                 {"ts" : _LazyTransitionState(self.storage, id_, energy)})
+                for id_, energy, (id1, id2) in zip(ids.tolist(), energies.tolist(), pairs.tolist()))
+        finally:
+            if gc_enabled:
+                gc.enable()
 
     def _build_from_list(self, minima):
         """
@@ -178,6 +254,7 @@ def create_random_database(nmin=20, nts=None, natoms=2):
 
 
 import unittest
+from pygmin.storage.database import TransitionState
 class TestGraph(unittest.TestCase):
     def setUp(self):
         self.db = create_random_database()
@@ -232,6 +309,29 @@ class TestGraph(unittest.TestCase):
 
         #make sure min2 is not in database
         self.assertNotIn(min2, self.db.minima())
+    
+    def test_lazy_transition_states(self):
+        graph = Graph(self.db)
+        for ts in self.db.transition_states():
+            lazy = graph.graph[ts.minimum1][ts.minimum2]["ts"]
+            self.assertEqual(lazy, ts)
+            self.assertEqual(ts, lazy)
+            self.assertEqual(lazy, _LazyTransitionState(self.db, ts._id, ts.energy))
+            #a minimum with the same id is not the same object
+            m = self.db.getMinimum(ts._id)
+            if m is not None:
+                self.assertNotEqual(lazy, m)
+                self.assertNotEqual(m, lazy)
+            self.assertNotEqual(lazy, ts._id)
+            self.assertNotIsInstance(lazy, TransitionState)
+            self.assertIs(lazy._ts, None)
+            self.assertEqual(lazy.energy, ts.energy)
+            self.assertTrue((lazy.coords == ts.coords).all())
+            self.assertIs(lazy._ts, ts)
+            self.assertEqual(lazy.minimum1, ts.minimum1)
+            lazy.eigenval = -1.
+            self.assertEqual(ts.eigenval, -1.)
+        graph.graph.copy()
         
     def test_networkx(self):
         """check how networkx works"""
@@ -51,6 +51,14 @@ class DoubleEndedConnect(object):
     longest_first : bool
         if true, always try to connect the longest segment in the path guess
         first
+    max_preload_distances : int, optional
+        if the database holds more distances than this, they are read from
+        the database when needed instead of all being loaded at the start.
+        This limits the memory use for very large databases.
+    distance_bound : callable, optional
+        a cheap lower bound on mindist, e.g. RadialDistanceBound.  The
+        distances between minima which the bound shows are far apart are
+        only calculated if they are needed.  See _DistanceGraph.
     
     Notes
     -----
@@ -128,6 +136,7 @@ class DoubleEndedConnect(object):
                  merge_minima=False, 
                  max_dist_merge=0.1, local_connect_params=dict(),
                  fresh_connect=False, longest_first=False,
+                 max_preload_distances=None, distance_bound=None,
                  ):
         self.minstart = min1
         assert min1._id == min1, "minima must compare equal with their id %d %s %s" % (min1._id, str(min1), str(min1.__hash__()))
@@ -149,7 +158,8 @@ class DoubleEndedConnect(object):
         self.merge_minima = merge_minima
         self.max_dist_merge = float(max_dist_merge)
 
-        self.dist_graph = _DistanceGraph(self.database, self.graph, self.mindist, self.verbosity)
+        self.dist_graph = self._getDistanceGraph(max_preload_distances=max_preload_distances,
+                                                 distance_bound=distance_bound)
 
         #check if a connection exists before initializing distance Graph
         if self.graph.areConnected(self.minstart, self.minend):
@@ -293,6 +303,10 @@ class DoubleEndedConnect(object):
         
         return True
 
+    def _getDistanceGraph(self, **kwargs):
+        return _DistanceGraph(self.database, self.graph, self.mindist, self.verbosity,
+                              **kwargs)
+
     def _getLocalConnectObject(self):
         return LocalConnect(self.pot, self.mindist, **self.local_connect_params)
 
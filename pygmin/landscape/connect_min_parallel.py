@@ -6,7 +6,8 @@ import pygmin.utils.fix_multiprocessing
 
 from pygmin.landscape import DoubleEndedConnect, LocalConnect
 from pygmin.landscape.local_connect import _refineTS
-from pygmin.transition_states import create_NEB
+from pygmin.landscape._distance_graph import _DistanceGraph
+from pygmin.transition_states import create_NEB, PotentialPool
 
 __all__ = ["DoubleEndedConnectPar", "LocalConnectPar"]
 
@@ -16,6 +17,10 @@ def _refineTSWrapper(inputs):
     """
     return _refineTS(inputs[0], inputs[1], **inputs[2])
 
+def _refineTSPool(pot, inputs):
+    """a wrapper to allow _refineTS to be used with PotentialPool.map"""
+    return _refineTS(pot, inputs[0], **inputs[1])
+
 
 class DoubleEndedConnectPar(DoubleEndedConnect):
     """
@@ -37,6 +42,10 @@ class DoubleEndedConnectPar(DoubleEndedConnect):
     
     1. NEB : the potentials for each image are calculated in parallel
     2. findTransitionStates : each transition state candidate from the NEB run is refined in parallel. 
+    3. the minimum distances needed when minima are added to the distance graph
+    
+    The NEB runs and transition state searches all use the same PotentialPool,
+    so the worker processes are only started once.
     
     See Also
     --------
@@ -50,10 +59,30 @@ class DoubleEndedConnectPar(DoubleEndedConnect):
             self.ncores = kwargs.pop("ncores")
         except KeyError:
             self.ncores = 4
+        #potential_pool is needed in _getLocalConnectObject, the pot is set in the base class
+        self.potential_pool = None
         return super(DoubleEndedConnectPar, self).__init__(*args, **kwargs)
 
+    def _getDistanceGraph(self, **kwargs):
+        return _DistanceGraph(self.database, self.graph, self.mindist, self.verbosity,
+                              ncores=self.ncores, **kwargs)
+
     def _getLocalConnectObject(self):
-        return LocalConnectPar(self.pot, self.mindist, ncores=self.ncores, **self.local_connect_params)
+        if self.potential_pool is None:
+            copy_potential = self.local_connect_params.get("NEBparams", {}).get("copy_potential", False)
+            self.potential_pool = PotentialPool(self.pot, self.ncores, 
+                                                copy_potential=copy_potential)
+        return LocalConnectPar(self.pot, self.mindist, ncores=self.ncores, 
+                               pool=self.potential_pool, **self.local_connect_params)
+
+    def connect(self, *args, **kwargs):
+        try:
+            return super(DoubleEndedConnectPar, self).connect(*args, **kwargs)
+        finally:
+            #stop the worker processes of the distance graph and the potential
+            self.dist_graph.close()
+            if self.potential_pool is not None:
+                self.potential_pool.close()
 
 
 class LocalConnectPar(LocalConnect):
@@ -67,6 +96,9 @@ class LocalConnectPar(LocalConnect):
         all required and optional parameters from LocalConnect are also accepted
     ncores :
         the number of cores to use in parallel runs
+    pool : PotentialPool, optional
+        the worker processes to use for the NEB and the transition state 
+        searches.  If not given, new processes are started for each.
     
     See Also
     --------
@@ -91,6 +123,7 @@ class LocalConnectPar(LocalConnect):
             self.ncores = kwargs.pop("ncores")
         except KeyError:
             self.ncores = 4
+        self.pool = kwargs.pop("pool", None)
         return super(LocalConnectPar, self).__init__(*args, **kwargs)
 
     def _refineTransitionStates(self, neb, climbing_images):
@@ -120,22 +153,17 @@ class LocalConnectPar(LocalConnect):
 
         #do all the transition state searches in parallel using a pool of workers
         print "refining transition states in parallel on", self.ncores, "cores"
+        if self.pool is not None:
+            #the workers already have the potential
+            returnlist = self.pool.map(_refineTSPool, [args[1:] for args in input_args])
+            return self._addTransitionStates(returnlist, nrefine)
+        
         mypool = mp.Pool(self.ncores)
         try:
             #there is a bug in Python so that exceptions in multiprocessing.Pool aren't
             #handled correctly.  A fix is to add a timeout (.get(timeout))
             returnlist = mypool.imap_unordered( _refineTSWrapper, input_args )#.get(9999999)
-            
-            ngood_ts = 0
-            #analyze the return values and 
-            #find the minimum on either side of each good transition state
-            for ret in returnlist:#.get(99999999):        
-                ts_success = ret[0]
-                if ts_success:
-                    #the transition state is good, add it to the graph
-                    tsret, m1ret, m2ret = ret[1:4]
-                    self.res.new_transition_states.append( (tsret, m1ret, m2ret) )
-                    ngood_ts += 1
+            success = self._addTransitionStates(returnlist, nrefine)
         except:
             #It's important to make sure the child processes are closed even
             #if when an exception is raised.  
@@ -147,16 +175,46 @@ class LocalConnectPar(LocalConnect):
             raise
         mypool.close()
         mypool.join()
-        
+        return success
+    
+    def _addTransitionStates(self, returnlist, nrefine):
+        """analyze the return values of the transition state searches"""
+        ngood_ts = 0
+        #find the minimum on either side of each good transition state
+        for ret in returnlist:#.get(99999999):        
+            ts_success = ret[0]
+            if ts_success:
+                #the transition state is good, add it to the graph
+                tsret, m1ret, m2ret = ret[1:4]
+                self.res.new_transition_states.append( (tsret, m1ret, m2ret) )
+                ngood_ts += 1
         print "found", ngood_ts, "good transition states from", nrefine, "candidates"
         return ngood_ts > 0
     
     def _getNEB(self, *args, **kwargs):
         #this is all that need be changed to get the NEB to run in parallel.
-        return create_NEB(*args, parallel=True, ncores=self.ncores, **kwargs)
+        return create_NEB(*args, parallel=True, ncores=self.ncores, pool=self.pool, **kwargs)
 #        return NEBPar(*args, ncores=self.ncores, **kwargs)
 
 
+import unittest
+class TestDoubleEndedConnectPar(unittest.TestCase):
+    def test_pool_copy_potential(self):
+        """the shared pool copies the potential if the NEB should"""
+        from pygmin.landscape._graph import create_random_database
+        from pygmin.landscape._distance_graph import _cartesian_dist
+        from pygmin.potentials.lj import LJ
+        db = create_random_database(nmin=4, natoms=4, nts=2)
+        min1, min2 = db.minima()[:2]
+        for copy_potential in [False, True]:
+            params = dict(NEBparams=dict(copy_potential=copy_potential))
+            connect = DoubleEndedConnectPar(min1, min2, LJ(), _cartesian_dist, db, 
+                                            local_connect_params=params, ncores=2)
+            local_connect = connect._getLocalConnectObject()
+            self.assertIs(local_connect.pool, connect.potential_pool)
+            self.assertEqual(connect.potential_pool.copy_potential, copy_potential)
+            connect.dist_graph.close()
+
 
 if __name__ == "__main__":
     from pygmin.landscape.connect_min import test
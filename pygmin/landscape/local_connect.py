@@ -51,7 +51,9 @@ class LocalConnect(object):
         parameters passed to the transition state search algorithm
     NEBparams : dict
         NEB setup parameters.  Use NEBquenchParams for parameters related 
-        to the optimization of the band.
+        to the optimization of the band.  e.g. NEBparams=dict(adaptive=2)
+        starts with a coarse band and adds images only where they are
+        needed (see create_NEB).
     NEBquenchParams : dict
         parameters passed to the NEB minimization routine
     nrefine_max : int
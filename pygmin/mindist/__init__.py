@@ -45,6 +45,16 @@ necessarily the optimal
     minPermDistStochastic
     ExactMatchCluster
 
+lower bounds
+------------
+A bound which is much cheaper than any alignment, used to avoid aligning
+structures which are clearly far apart
+
+.. autosummary::
+   :toctree: generated/
+
+    RadialDistanceBound
+
 A wrapper
 ---------
 This wrapper provides the simplified interface for mindist that some 
@@ -66,4 +76,5 @@ from minpermdist_stochastic import *
 from minpermdist_rbmol import *
 from mindist import *
 from rmsfit import *
+from lower_bound import *
 
@@ -0,0 +1,99 @@
+import numpy as np
+
+__all__ = ["RadialDistanceBound"]
+
+class RadialDistanceBound(object):
+    """
+    a cheap lower bound on the distance returned by minPermDistStochastic
+
+    After moving the center of mass to the origin, an atom at distance r1 from
+    the origin and an atom at distance r2 are at least |r1 - r2| apart,
+    whatever the rotation.  Within a group of permutable atoms the sum of
+    (r1 - r2)**2 is smallest when both lists of radii are sorted, so
+
+        bound = norm(profile(X1) - profile(X2))
+
+    where the profile is the list of sorted radii of each permutable group
+    (atoms not in permlist are left in order).  The bound is invariant to
+    translation, rotation, inversion and permutation, and no alignment
+    is ever larger than the exact minimum distance.
+
+    Parameters
+    ----------
+    permlist : list of lists, optional
+        the groups of permutable atoms.  By default all atoms are permutable.
+
+    Notes
+    -----
+    This is only a bound for systems of atoms, e.g. clusters, where the
+    distance is the cartesian distance with all masses equal.
+
+    Examples
+    --------
+    The profiles of many structures can be compared at once
+
+    >>> bound = RadialDistanceBound(permlist)
+    >>> p = bound.profiles(coords_array)
+    >>> bounds = bound.compare(p[0], p)
+
+    See Also
+    --------
+    minPermDistStochastic
+    """
+    def __init__(self, permlist=None):
+        self.permlist = permlist
+
+    def profiles(self, coords):
+        """
+        return the sorted radii of one structure or of each row of a 2d array
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+        single = coords.ndim == 1
+        X = np.atleast_2d(coords)
+        X = X.reshape(len(X), -1, 3)
+        X = X - X.mean(axis=1)[:,np.newaxis,:]
+        r = np.sqrt((X**2).sum(axis=2))
+        if self.permlist is None:
+            r.sort(axis=1)
+        else:
+            for atomlist in self.permlist:
+                atomlist = np.asarray(atomlist)
+                r[:,atomlist] = np.sort(r[:,atomlist], axis=1)
+        if single:
+            return r[0]
+        return r
+
+    def compare(self, profile, profiles):
+        """
+        return the bounds between one profile and an array of profiles
+        """
+        return np.sqrt(((profiles - profile)**2).sum(axis=-1))
+
+    def __call__(self, X1, X2):
+        """return the lower bound on the distance between X1 and X2"""
+        return self.compare(self.profiles(X1), self.profiles(X2))
+
+
+import unittest
+class TestRadialDistanceBound(unittest.TestCase):
+    def test_bound(self):
+        from pygmin.mindist import minPermDistStochastic
+        from pygmin.utils import rotations
+        natoms = 10
+        permlist = [range(6), range(6, natoms)]
+        bound = RadialDistanceBound(permlist)
+        X1 = np.random.uniform(-1, 1, 3*natoms)
+        X2 = np.random.uniform(-1, 1, 3*natoms)
+        dist = minPermDistStochastic(X1.copy(), X2.copy(), niter=10, permlist=permlist)[0]
+        self.assertLessEqual(bound(X1, X2), dist + 1e-10)
+
+        #a rotated, translated and permuted copy has bound zero
+        mx = rotations.aa2mx(rotations.random_aa())
+        X3 = np.dot(X1.reshape(-1,3), mx.transpose()) + 1.
+        X3 = X3[[1,0,2,3,4,5,7,6,8,9]].reshape(-1)
+        self.assertAlmostEqual(bound(X1, X3), 0., 10)
+
+        #vectorized over many structures
+        p = bound.profiles(np.array([X1, X2, X3]))
+        self.assertEqual(p.shape, (3, natoms))
+        self.assertTrue(np.allclose(bound.compare(p[0], p), [0., bound(X1, X2), 0.]))
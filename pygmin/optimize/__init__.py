@@ -47,6 +47,9 @@ to a constraint on the energy change.  If the energy rises more than a given amo
 step size is reduce until the condition is satisfied.  Note: this is what makes
 lbfgs potentially fail with non-Hamiltonian systems.
 
+LBFGSFast is the same algorithm as LBFGS with the whole minimization loop in
+fortran.  It is the default quench routine.
+
 .. autosummary::
    :toctree: generated/
    
@@ -54,8 +57,19 @@ lbfgs potentially fail with non-Hamiltonian systems.
    lbfgs_py
    MYLBFGS
    mylbfgs
+   LBFGSFast
+   lbfgs_fast
    lbfgs_scipy
 
+LBFGSBatch minimizes many structures in lockstep, one potential call per
+iteration for the whole batch (see getEnergyGradientMultiple in BasePotential).
+
+.. autosummary::
+   :toctree: generated/
+   
+   LBFGSBatch
+   lbfgs_batch
+
 Fire
 ----
 .. autosummary::
@@ -84,6 +98,8 @@ These are not used very often and may be buggy.
 
 from result import *
 from _lbfgs_py import *
+from _lbfgs_batch import *
 from _mylbfgs import *
+from _lbfgs_fast import *
 from _fire import *
 from _quench import *
\ No newline at end of file
@@ -0,0 +1,287 @@
+import numpy as np
+from pygmin.optimize import Result
+
+__all__ = ["LBFGSBatch", "lbfgs_batch"]
+
+
+class LBFGSBatch(object):
+    """
+    minimize many independent structures in lockstep with the LBFGS routine
+
+    This is the same algorithm as LBFGS, but every step is done for all
+    configurations at once so that the potential is called once per
+    iteration for the whole batch.  This amortizes the python overhead of
+    the potential call and the LBFGS update over many structures.
+
+    Parameters
+    ----------
+    X : array of shape (nconf, ndof)
+        the starting configurations for the minimization, one per row
+    pot :
+        the potential object.  It must implement getEnergyGradientMultiple()
+    nsteps : int
+        the maximum number of iterations
+    tol : float
+        a configuration is converged when its rms grad is less than tol
+    iprint : int
+        how often to print status information
+    maxstep : float
+        the maximum step size
+    maxErise : float
+        the maximum the energy is alowed to rise during a step.
+        The step size will be reduced until this condition is satisfied.
+    M : int
+        the number of previous iterations to use in determining the optimal step
+    H0 : float
+        the initial guess for the inverse diagonal Hessian.
+    debug :
+        print debugging information
+
+    Notes
+    -----
+    Each configuration has its own LBFGS memory, its own H0 and its own
+    step size control.  Converged configurations are frozen and no longer
+    passed to the potential.  The result of the minimization of configuration
+    i is the same as running LBFGS on it alone, up to round-off.
+
+    See Also
+    --------
+    LBFGS : the single configuration version
+    lbfgs_batch : a function wrapper
+    """
+    def __init__(self, X, pot, maxstep=0.1, maxErise=1e-4, M=4, H0=1.,
+                 debug=False, iprint=-1, nsteps=10000, tol=1e-6):
+        self.X = np.array(X, dtype=np.float64)
+        if self.X.ndim != 2:
+            raise ValueError("X must be a 2d array of shape (nconf, ndof)")
+        self.pot = pot
+        self.maxstep = maxstep
+        self.maxErise = maxErise
+        self.iprint = iprint
+        self.nsteps = nsteps
+        self.tol = tol
+        self.debug = debug
+
+        self.K, self.N = self.X.shape
+        self.M = M
+        K, N = self.K, self.N
+
+        self.E, self.G = self.pot.getEnergyGradientMultiple(self.X)
+        self.funcalls = np.ones(K, dtype=int)
+
+        if H0 is None or H0 < 1e-10:
+            H0 = 1.
+        self.H0_init = H0
+        self.H0 = np.ones(K) * H0
+
+        self.s = np.zeros([K, M, N])  #position updates
+        self.y = np.zeros([K, M, N])  #gradient updates
+        self.rho = np.zeros([K, M])
+        self.k = np.zeros(K, dtype=int) #iteration counter since the last reset
+
+        self.Xold = self.X.copy()
+        self.Gold = self.G.copy()
+
+        self.nfailed = np.zeros(K, dtype=int)
+        self.failed = np.zeros(K, dtype=bool)
+        self.stepsize = np.zeros(K)
+
+    def getStep(self, act):
+        """
+        Calculate a step direction and step size for the configurations in act
+        using the LBFGS algorithm
+        """
+        X = self.X[act]
+        G = self.G[act]
+        k = self.k[act]
+        s = self.s[act]
+        y = self.y[act]
+        rho = self.rho[act]
+        H0 = self.H0[act]
+        M = self.M
+        nact = len(act)
+        rows = np.arange(nact)
+
+        #we have a new X and G, save in s and y
+        upd = k > 0
+        if upd.any():
+            km1 = (k + M - 1) % M
+            r = rows[upd]
+            s[r, km1[upd]] = X[upd] - self.Xold[act[upd]]
+            y[r, km1[upd]] = G[upd] - self.Gold[act[upd]]
+            YS = (s[r, km1[upd]] * y[r, km1[upd]]).sum(1)
+            YY = (y[r, km1[upd]]**2).sum(1)
+            YS[YS == 0.] = 1.
+            YY[YY == 0.] = 1.
+            rho[r, km1[upd]] = 1. / YS
+            H0[upd] = YS / YY
+
+        self.Xold[act] = X
+        self.Gold[act] = G
+
+        #the two loop recursion.  Configurations with less than M saved
+        #updates are masked out for the missing ones
+        nmem = np.minimum(k, M)
+        q = G.copy()
+        a = np.zeros([nact, M])
+        for j in xrange(1, M+1):
+            valid = j <= nmem
+            if not valid.any(): break
+            i = (k - j) % M
+            a[:,j-1] = rho[rows, i] * (s[rows, i] * q).sum(1) * valid
+            q -= a[:,j-1,np.newaxis] * y[rows, i]
+        z = q * H0[:,np.newaxis]
+        for j in xrange(M, 0, -1):
+            valid = j <= nmem
+            if not valid.any(): continue
+            i = (k - j) % M
+            beta = rho[rows, i] * (y[rows, i] * z).sum(1)
+            z += s[rows, i] * ((a[:,j-1] - beta) * valid)[:,np.newaxis]
+        stp = -z
+
+        #make first guess for the step length cautious
+        first = k == 0
+        if first.any():
+            gnorm = np.sqrt((G[first]**2).sum(1))
+            gnorm[gnorm == 0.] = 1.
+            stp[first] *= np.minimum(gnorm, 1. / gnorm)[:,np.newaxis]
+
+        self.s[act] = s
+        self.y[act] = y
+        self.rho[act] = rho
+        self.H0[act] = H0
+        self.k[act] += 1
+        return stp
+
+    def adjustStepSize(self, act, stp):
+        """
+        take the step for the configurations in act, reducing the step size
+        where the energy rises by more than maxErise.
+
+        See LBFGS.adjustStepSize for details.  Configurations which
+        fail to find a good step are reset.
+        """
+        X0 = self.X[act]
+        E0 = self.E[act]
+
+        #reverse steps which are uphill
+        uphill = (self.G[act] * stp).sum(1) > 0
+        stp[uphill] *= -1.
+
+        stepsize = np.sqrt((stp**2).sum(1))
+        f = np.ones(len(act))
+        big = stepsize > self.maxstep
+        f[big] = self.maxstep / stepsize[big]
+
+        pending = np.arange(len(act))
+        nincrease = 0
+        while len(pending) > 0 and nincrease <= 10:
+            Xtrial = X0[pending] + f[pending,np.newaxis] * stp[pending]
+            E, G = self.pot.getEnergyGradientMultiple(Xtrial)
+            self.funcalls[act[pending]] += 1
+            ok = E - E0[pending] <= self.maxErise
+            idx = act[pending[ok]]
+            self.X[idx] = Xtrial[ok]
+            self.E[idx] = E[ok]
+            self.G[idx] = G[ok]
+            pending = pending[~ok]
+            if self.debug and len(pending) > 0:
+                print "warning: energy increased, trying a smaller step", len(pending), nincrease
+            f[pending] /= 10.
+            nincrease += 1
+
+        if len(pending) > 0:
+            #these configurations could not find a good step.  Reset them
+            idx = act[pending]
+            self.nfailed[idx] += 1
+            print "lbfgs_batch: having trouble finding a good step size for", len(idx), "configurations"
+            self.H0[idx] = self.H0_init
+            self.k[idx] = 0
+            self.failed[idx[self.nfailed[idx] > 10]] = True
+
+        self.stepsize[act] = f * stepsize
+
+    def run(self):
+        """
+        the main loop of the algorithm
+
+        Returns
+        -------
+        res : Result
+            with attributes coords (nconf, ndof), energy (nconf,), grad,
+            rms (nconf,), nfev (nconf,), success (nconf,) and nsteps
+        """
+        sqrtN = np.sqrt(self.N)
+        rms = np.sqrt((self.G**2).sum(1)) / sqrtN
+        converged = rms < self.tol
+        i = 0
+        while i < self.nsteps:
+            act = np.where(~(converged | self.failed))[0]
+            if len(act) == 0:
+                break
+            i += 1
+            stp = self.getStep(act)
+            self.adjustStepSize(act, stp)
+
+            rms[act] = np.sqrt((self.G[act]**2).sum(1)) / sqrtN
+            converged[act] = rms[act] < self.tol
+
+            if self.iprint > 0:
+                if i % self.iprint == 0:
+                    print "lbfgs_batch:", i, len(act), self.E[act].min(), rms[act].max()
+
+        res = Result()
+        res.nsteps = i
+        res.nfev = self.funcalls.copy()
+        res.coords = self.X
+        res.energy = self.E
+        res.grad = self.G
+        res.rms = rms
+        res.success = converged
+        res.H0 = self.H0
+        return res
+
+
+def lbfgs_batch(coords2d, pot, **kwargs):
+    """
+    A wrapper function for LBFGSBatch
+
+    Parameters
+    ----------
+    coords2d : array of shape (nconf, ndof)
+    pot :
+        potential object implementing getEnergyGradientMultiple()
+    kwargs :
+        passed to LBFGSBatch
+
+    Returns
+    -------
+    coords, energies, rms, funcalls, res
+        the first four are arrays with one entry per configuration
+
+    See Also
+    --------
+    LBFGSBatch
+    """
+    lbfgs = LBFGSBatch(coords2d, pot, **kwargs)
+    ret = lbfgs.run()
+    return ret.coords, ret.energy, ret.rms, ret.nfev, ret
+
+
+import unittest
+class TestLBFGSBatch(unittest.TestCase):
+    def test_same_as_lbfgs(self):
+        """the batch reaches the same minima as separate LBFGS runs"""
+        from pygmin.optimize import LBFGS
+        from pygmin.potentials.lj import LJ
+        np.random.seed(0)
+        pot = LJ()
+        nwalkers, natoms = 6, 13
+        X = np.random.uniform(-1, 1, [nwalkers, 3*natoms]) * 1.5
+        res = LBFGSBatch(X.copy(), pot, tol=1e-6).run()
+        self.assertTrue(np.all(res.success))
+        for i in range(nwalkers):
+            res1 = LBFGS(X[i].copy(), pot, tol=1e-6).run()
+            self.assertAlmostEqual(res.energy[i], res1.energy, 6)
+            self.assertLess(np.max(np.abs(res.coords[i] - res1.coords)), 1e-4)
+            self.assertAlmostEqual(res.energy[i], pot.getEnergy(res.coords[i]), 10)
@@ -0,0 +1,180 @@
+!
+!  the LBFGS algorithm of pygmin.optimize.LBFGS with the whole minimization
+!  loop in fortran.  The potential is called back in python.
+!
+!  The algorithm is step for step the same as in _lbfgs_py.py, so the two
+!  should give the same result up to round-off.  All the work space is
+!  allocated once at the start of the minimization.
+!
+!  X is used as work space and is overwritten.  The final coordinates are
+!  returned in COORDS
+!
+      SUBROUTINE LBFGS(N, M, X, TOL, MAXSTEP, MAXERISE, RELENERGY, H0, &
+         NSTEPS, IPRINT, COORDS, ENERGY, GRAD, H0OUT, RMS, NFEV, NITER, &
+         SUCCESS, LSFAIL)
+      IMPLICIT NONE
+      INTEGER, INTENT(IN) ::             N
+      INTEGER, INTENT(IN) ::             M
+      DOUBLE PRECISION, INTENT(INOUT) :: X(N)
+!f2py intent(in) X
+      DOUBLE PRECISION, INTENT(IN) ::    TOL
+      DOUBLE PRECISION, INTENT(IN) ::    MAXSTEP
+      DOUBLE PRECISION, INTENT(IN) ::    MAXERISE
+      LOGICAL, INTENT(IN) ::             RELENERGY
+      DOUBLE PRECISION, INTENT(IN) ::    H0
+      INTEGER, INTENT(IN) ::             NSTEPS
+      INTEGER, INTENT(IN) ::             IPRINT
+      DOUBLE PRECISION, INTENT(OUT) ::   COORDS(N)
+      DOUBLE PRECISION, INTENT(OUT) ::   ENERGY
+      DOUBLE PRECISION, INTENT(OUT) ::   GRAD(N)
+      DOUBLE PRECISION, INTENT(OUT) ::   H0OUT
+      DOUBLE PRECISION, INTENT(OUT) ::   RMS
+      INTEGER, INTENT(OUT) ::            NFEV
+      INTEGER, INTENT(OUT) ::            NITER
+      LOGICAL, INTENT(OUT) ::            SUCCESS
+      LOGICAL, INTENT(OUT) ::            LSFAIL
+!
+!  the potential is called as POTENTIAL(X, ENERGY, GRAD, N).  In python
+!  this is  energy, grad = potential(x)
+!
+!f2py intent(callback) potential
+      EXTERNAL POTENTIAL
+
+      DOUBLE PRECISION, ALLOCATABLE :: S(:,:), Y(:,:), RHO(:), A(:)
+      DOUBLE PRECISION, ALLOCATABLE :: STP(:), XOLD(:), GOLD(:)
+      DOUBLE PRECISION, ALLOCATABLE :: X0(:), G0(:)
+      DOUBLE PRECISION E0, DE, F, STEPSIZE, SQRTN
+      DOUBLE PRECISION YS, YY, BETA, GNORM, HDIAG
+      INTEGER K, J, JI, KM1, NINCREASE, NFAILED
+
+      ALLOCATE(S(N,M), Y(N,M), RHO(M), A(M))
+      ALLOCATE(STP(N), XOLD(N), GOLD(N), X0(N), G0(N))
+      S(:,:) = 0.D0
+      Y(:,:) = 0.D0
+      RHO(:) = 0.D0
+      A(:) = 0.D0
+
+      HDIAG = H0
+      IF (HDIAG .LT. 1.D-10) THEN
+         WRITE(*,*) "warning: initial guess for inverse Hessian diagonal", &
+            " is negative or too small", HDIAG, "resetting it to 1."
+         HDIAG = 1.D0
+      ENDIF
+      SQRTN = SQRT(DBLE(N))
+      K = 0
+      NFAILED = 0
+      LSFAIL = .FALSE.
+      SUCCESS = .FALSE.
+      STEPSIZE = 0.D0
+
+      CALL POTENTIAL(X, ENERGY, GRAD, N)
+      NFEV = 1
+      RMS = SQRT(DOT_PRODUCT(GRAD, GRAD)) / SQRTN
+
+      NITER = 1
+      DO WHILE (NITER .LT. NSTEPS)
+!
+!  get the step direction from the LBFGS two loop recursion
+!
+         IF (K .GT. 0) THEN
+            KM1 = MOD(K - 1, M) + 1
+            S(:,KM1) = X(:) - XOLD(:)
+            Y(:,KM1) = GRAD(:) - GOLD(:)
+            YS = DOT_PRODUCT(S(:,KM1), Y(:,KM1))
+            IF (YS .EQ. 0.D0) THEN
+               WRITE(*,*) "warning: resetting YS to 1 in lbfgs", YS
+               YS = 1.D0
+            ENDIF
+            RHO(KM1) = 1.D0 / YS
+            YY = DOT_PRODUCT(Y(:,KM1), Y(:,KM1))
+            IF (YY .EQ. 0.D0) THEN
+               WRITE(*,*) "warning: resetting YY to 1 in lbfgs", YY
+               YY = 1.D0
+            ENDIF
+            HDIAG = YS / YY
+         ENDIF
+         XOLD(:) = X(:)
+         GOLD(:) = GRAD(:)
+
+         STP(:) = GRAD(:)
+         DO J = K - 1, MAX(0, K - M), -1
+            JI = MOD(J, M) + 1
+            A(JI) = RHO(JI) * DOT_PRODUCT(S(:,JI), STP)
+            STP(:) = STP(:) - A(JI) * Y(:,JI)
+         ENDDO
+         STP(:) = STP(:) * HDIAG
+         DO J = MAX(0, K - M), K - 1
+            JI = MOD(J, M) + 1
+            BETA = RHO(JI) * DOT_PRODUCT(Y(:,JI), STP)
+            STP(:) = STP(:) + S(:,JI) * (A(JI) - BETA)
+         ENDDO
+         STP(:) = -STP(:)
+
+         IF (K .EQ. 0) THEN
+!  make first guess for the step length cautious
+            GNORM = SQRT(DOT_PRODUCT(GRAD, GRAD))
+            STP(:) = STP(:) * MIN(GNORM, 1.D0 / GNORM)
+         ENDIF
+         K = K + 1
+!
+!  take the step, reducing the step size while the energy rises by
+!  more than MAXERISE
+!
+         X0(:) = X(:)
+         G0(:) = GRAD(:)
+         E0 = ENERGY
+         IF (DOT_PRODUCT(GRAD, STP) .GT. 0.D0) STP(:) = -STP(:)
+         STEPSIZE = SQRT(DOT_PRODUCT(STP, STP))
+         F = 1.D0
+         IF (STEPSIZE .GT. MAXSTEP) F = MAXSTEP / STEPSIZE
+         NINCREASE = 0
+         DO
+            X(:) = X0(:) + F * STP(:)
+            CALL POTENTIAL(X, ENERGY, GRAD, N)
+            NFEV = NFEV + 1
+            IF (RELENERGY) THEN
+               IF (ENERGY .EQ. 0.D0) ENERGY = 1.D-100
+               DE = (ENERGY - E0) / ABS(ENERGY)
+            ELSE
+               DE = ENERGY - E0
+            ENDIF
+            IF (DE .LE. MAXERISE) EXIT
+            F = F / 10.D0
+            NINCREASE = NINCREASE + 1
+            IF (NINCREASE .GT. 10) EXIT
+         ENDDO
+
+         IF (NINCREASE .GT. 10) THEN
+            NFAILED = NFAILED + 1
+            X(:) = X0(:)
+            GRAD(:) = G0(:)
+            ENERGY = E0
+            IF (NFAILED .GT. 10) THEN
+               LSFAIL = .TRUE.
+               RMS = SQRT(DOT_PRODUCT(GRAD, GRAD)) / SQRTN
+               EXIT
+            ENDIF
+            WRITE(*,*) "lbfgs: having trouble finding a good step size.", &
+               F * STEPSIZE, STEPSIZE
+            HDIAG = 1.D0
+            K = 0
+         ENDIF
+         STEPSIZE = F * STEPSIZE
+
+         RMS = SQRT(DOT_PRODUCT(GRAD, GRAD)) / SQRTN
+         IF (IPRINT .GT. 0) THEN
+            IF (MOD(NITER, IPRINT) .EQ. 0) THEN
+               WRITE(*,*) "lbfgs:", NITER, ENERGY, RMS, NFEV, STEPSIZE
+            ENDIF
+         ENDIF
+         IF (RMS .LT. TOL) THEN
+            SUCCESS = .TRUE.
+            EXIT
+         ENDIF
+         NITER = NITER + 1
+      ENDDO
+
+      COORDS(:) = X(:)
+      H0OUT = HDIAG
+      DEALLOCATE(S, Y, RHO, A, STP, XOLD, GOLD, X0, G0)
+      END SUBROUTINE LBFGS
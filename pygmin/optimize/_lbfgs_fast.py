@@ -0,0 +1,176 @@
+import numpy as np
+from pygmin.optimize import Result, LBFGS
+try:
+    from _lbfgs_engine import lbfgs as _lbfgs_fortran
+except ImportError:
+    #the compiled fortran module is not available
+    _lbfgs_fortran = None
+
+__all__ = ["LBFGSFast"]
+
+
+class LBFGSFast(object):
+    """
+    minimize a function using the LBFGS routine with the main loop compiled
+
+    This is the same algorithm as LBFGS, but the whole minimization, i.e. the
+    two loop recursion, the step size adjustment and the convergence test,
+    is done in fortran.  The work space is allocated once at the start, so
+    the only python code run per iteration is the call to the potential.
+    For small systems, where the python overhead of LBFGS dominates, this is
+    several times faster.
+
+    Parameters
+    ----------
+    X : array
+        the starting configuration for the minimization
+    pot :
+        the potential object
+    nsteps : int
+        the maximum number of iterations
+    tol : float
+        the minimization will stop when the rms grad is less than tol
+    iprint : int
+        how often to print status information
+    maxstep : float
+        the maximum step size
+    maxErise : float
+        the maximum the energy is alowed to rise during a step.
+        The step size will be reduced until this condition is satisfied.
+    M : int
+        the number of previous iterations to use in determining the optimal step
+    rel_energy : bool
+        if True, then maxErise the the *relative* maximum the energy is allowed
+        to rise during a step
+    H0 : float
+        the initial guess for the inverse diagonal Hessian.
+    events : list of callables
+        these are called after each iteration.  events can also be added using
+        attachEvent()
+    alternate_stop_criterion : callable
+        this criterion will be used rather than rms gradiant to determine when
+        to stop the iteration
+    debug :
+        print debugging information
+
+    Notes
+    -----
+    events and alternate_stop_criterion need python to be called every
+    iteration.  If either is used, or if the compiled module is not
+    available, the python implementation LBFGS is used instead.
+
+    The coordinates passed to the potential are a view of the work space
+    and are changed during the minimization.  A potential which needs to
+    remember them must make a copy.
+
+    See Also
+    --------
+    LBFGS : the python implementation
+    lbfgs_fast : a function wrapper
+    """
+    def __init__(self, X, pot, maxstep=0.1, maxErise=1e-4, M=4,
+                 rel_energy=False, H0=1., events=None,
+                 alternate_stop_criterion=None, debug=False,
+                 iprint=-1, nsteps=10000, tol=1e-6):
+        self.X = X
+        self.pot = pot
+        self.maxstep = maxstep
+        self.maxErise = maxErise
+        self.M = M
+        self.rel_energy = rel_energy
+        if H0 is None:
+            H0 = 1.
+        self.H0 = H0
+        if events is None:
+            events = []
+        self.events = events
+        self.alternate_stop_criterion = alternate_stop_criterion
+        self.debug = debug
+        self.iprint = iprint
+        self.nsteps = nsteps
+        self.tol = tol
+
+    def attachEvent(self, event):
+        self.events.append(event)
+
+    def _run_python(self):
+        lbfgs = LBFGS(self.X, self.pot, maxstep=self.maxstep,
+                      maxErise=self.maxErise, M=self.M,
+                      rel_energy=self.rel_energy, H0=self.H0,
+                      events=self.events,
+                      alternate_stop_criterion=self.alternate_stop_criterion,
+                      debug=self.debug, iprint=self.iprint,
+                      nsteps=self.nsteps, tol=self.tol)
+        return lbfgs.run()
+
+    def run(self):
+        """
+        do the minimization
+
+        Returns
+        -------
+        res : Result
+            with the same attributes as returned by LBFGS.run()
+        """
+        if (_lbfgs_fortran is None or len(self.events) > 0
+                or self.alternate_stop_criterion is not None):
+            return self._run_python()
+
+        #the fortran routine uses its input coordinates as work space
+        X = np.array(self.X, dtype=np.float64)
+        ret = _lbfgs_fortran(self.M, X, self.tol, self.maxstep, self.maxErise,
+                             self.rel_energy, self.H0, self.nsteps, self.iprint,
+                             self.pot.getEnergyGradient)
+        X, e, G, H0, rms, nfev, niter, success, lsfail = ret
+
+        res = Result()
+        res.message = []
+        if lsfail:
+            print "Warning: problem with adjustStepSize, ending quench"
+            print "    on failure: quench step", niter, e, rms, nfev
+            res.message.append( "problem with adjustStepSize" )
+        res.nsteps = niter
+        res.nfev = nfev
+        res.coords = X
+        res.energy = e
+        res.rms = rms
+        res.grad = G
+        res.H0 = H0
+        res.success = bool(success)
+        return res
+
+
+import unittest
+class TestLBFGSFast(unittest.TestCase):
+    def setUp(self):
+        from pygmin.potentials.lj import LJ
+        self.pot = LJ()
+        self.natoms = 13
+        self.X = np.random.uniform(-1, 1, 3*self.natoms) * 1.3
+
+    def test_same_as_lbfgs(self):
+        if _lbfgs_fortran is None:
+            return
+        X = self.X.copy()
+        res = LBFGSFast(X, self.pot, tol=1e-5).run()
+        self.assertTrue(np.all(X == self.X))
+        self.assertTrue(res.success)
+        self.assertLess(res.rms, 1e-5)
+
+        #the first 20 iterations should agree up to round-off
+        res20 = LBFGSFast(self.X, self.pot, nsteps=20, tol=1e-5).run()
+        respy = LBFGS(self.X.copy(), self.pot, nsteps=20, tol=1e-5).run()
+        self.assertEqual(res20.nsteps, respy.nsteps)
+        self.assertAlmostEqual(res20.energy, respy.energy, 6)
+        self.assertLess(np.abs(res20.coords - respy.coords).max(), 1e-6)
+        self.assertAlmostEqual(res20.H0, respy.H0, 6)
+
+    def test_events(self):
+        count = []
+        def event(coords=None, energy=None, rms=None):
+            count.append(energy)
+        res = LBFGSFast(self.X.copy(), self.pot, tol=1e-5, events=[event]).run()
+        self.assertTrue(res.success)
+        self.assertEqual(len(count), res.nsteps)
+        e, g = self.pot.getEnergyGradient(res.coords)
+        self.assertAlmostEqual(e, res.energy, 8)
@@ -10,9 +10,9 @@ scipy.minimize would do a similar thing
 
 import numpy as np
 
-from pygmin.optimize import LBFGS, MYLBFGS, Fire
+from pygmin.optimize import LBFGS, MYLBFGS, Fire, LBFGSFast
 
-__all__ = ["lbfgs_scipy", "fire", "lbfgs_py", "mylbfgs", "cg", "fmin", 
+__all__ = ["lbfgs_scipy", "fire", "lbfgs_py", "mylbfgs", "lbfgs_fast", "cg", "fmin", 
            "steepest_descent", "bfgs"]
 
 class getEnergyGradientWrapper:
@@ -188,6 +188,31 @@ def lbfgs_py(coords, getEnergyGradient, **kwargs):
     ret = _lbfgs_py(coords, pot, **kwargs)
     return ret
 
+def _lbfgs_fast(coords, pot, **kwargs):
+    lbfgs = LBFGSFast(coords, pot, **kwargs)
+    
+    ret = lbfgs.run()
+    coords = ret.coords
+    e = ret.energy
+    rms = ret.rms
+    funcalls = ret.nfev
+    return coords, e, rms, funcalls, ret
+
+def lbfgs_fast(coords, getEnergyGradient, **kwargs):
+    """
+    A wrapper function for LBFGSFast, the LBFGS algorithm of lbfgs_py with
+    the main loop compiled.
+    
+    This is the default quench routine.
+
+    See Also
+    --------
+    LBFGSFast  
+    """
+    pot = getEnergyGradientWrapper(getEnergyGradient)
+    ret = _lbfgs_fast(coords, pot, **kwargs)
+    return ret
+
 def _mylbfgs(coords, pot, **kwargs):
     lbfgs = MYLBFGS(coords, pot, **kwargs)
     
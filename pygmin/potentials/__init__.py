@@ -24,6 +24,17 @@ also use gradient information, so it is highly recommended to also
 implement getEnergyGradient().  Otherwise the gradients will be calculated
 numerically and your system will run a lot slower.
 
+The transition state routines use products of the Hessian with a vector.  By
+default these are central differences of the gradient, overload
+getHessianVectorProduct() if you can compute them analytically.
+
+.. autosummary::
+   :toctree: generated/
+
+    hessian_vector_product
+    has_hessian_vector_product
+    has_energy_gradient_multiple
+
 pygmin potentials
 -----------------
 these are potentials that exist completely within the pygmin package
@@ -39,6 +50,13 @@ these are potentials that exist completely within the pygmin package
     HeisenbergModel
     HeisenbergModelRA
 
+potential wrappers
+------------------
+.. autosummary::
+    :toctree: generated/
+
+    CachingPotential
+
 GMIN potentials
 ---------------
 .. autosummary::
@@ -54,6 +72,7 @@ to be written
 
 
 from potential import *
+from caching_potential import *
 from lj import *
 from ATLJ import *
 from coldfusioncheck import *
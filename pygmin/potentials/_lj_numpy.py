@@ -0,0 +1,605 @@
+"""
+pure numpy implementations of the Lennard-Jones type potentials
+
+These are used in place of the compiled fortran modules when those are not
+available.  The functions have the same call signatures as the f2py
+wrapped fortran routines, so the namespaces `lj`, `ljcut` and `ljpshift`
+defined here can be used as drop in replacements, e.g.::
+
+    try:
+        import fortran.lj as ljf
+    except ImportError:
+        from _lj_numpy import lj as ljf
+
+The pair separations are computed with numpy over the upper triangle pair
+indices.  The index arrays and the work arrays are allocated once for
+each number of atoms and reused on subsequent calls.  The work arrays are
+kept per thread, so the routines can be called from several threads at once.
+
+Run this module as a script to compare the speed with the fortran routines.
+"""
+import threading
+
+import numpy as np
+
+__all__ = ["lj", "ljcut", "ljpshift"]
+
+
+class _PairWorkspace(object):
+    """
+    pair indices and preallocated work arrays for a given list of pairs
+    """
+    def __init__(self, natoms, i, j):
+        self.natoms = natoms
+        self.i = i
+        self.j = j
+        npairs = len(i)
+        self.dr = np.empty([npairs, 3])
+        self.tmp = np.empty([npairs, 3])
+        self.r2 = np.empty(npairs)
+        self.ir2 = np.empty(npairs)
+        self.ir6 = np.empty(npairs)
+        self.e = np.empty(npairs)
+        self.g = np.empty(npairs)
+        #the pair parameters of the binary potential, keyed by the parameters
+        self.pair_params = dict()
+
+#the workspaces of each thread
+_local = threading.local()
+
+def _get_workspace(natoms):
+    """return the workspace for all pairs of natoms atoms"""
+    try:
+        workspaces = _local.workspaces
+    except AttributeError:
+        workspaces = _local.workspaces = dict()
+    try:
+        return workspaces[natoms]
+    except KeyError:
+        i, j = np.triu_indices(natoms, 1)
+        ws = workspaces[natoms] = _PairWorkspace(natoms, i, j)
+        return ws
+
+def _get_workspace_ilist(natoms, ilist):
+    """
+    return a workspace for the pairs in ilist.  
+    
+    The workspace of the last ilist is kept, so calling this repeatedly with
+    the same list only allocates once.
+    """
+    ilist = np.asarray(ilist).reshape(-1, 2)
+    ws = getattr(_local, "workspace_ilist", None)
+    if (ws is not None and ws.natoms == natoms and len(ws.i) == len(ilist)
+            and np.array_equal(ws.i, ilist[:,0]) and np.array_equal(ws.j, ilist[:,1])):
+        return ws
+    ws = _local.workspace_ilist = _PairWorkspace(natoms, ilist[:,0].copy(), ilist[:,1].copy())
+    return ws
+
+def _check_cubic(periodic, boxlx, boxly, boxlz):
+    if periodic and not (boxlx == boxly == boxlz):
+        raise ValueError("only cubic boxes are supported, not %g %g %g" % (boxlx, boxly, boxlz))
+
+def _put_in_box(coords, boxl):
+    """
+    wrap coords into the box in place, as the fortran code does with its 
+    INTENT(INOUT) coordinates.  Like f2py, this only changes coords if it 
+    is a float64 array.
+    """
+    if isinstance(coords, np.ndarray) and coords.dtype == np.float64:
+        #fortran ANINT rounds halves away from zero
+        shift = coords / boxl
+        shift = np.sign(shift) * np.floor(np.abs(shift) + 0.5)
+        coords -= boxl * shift
+
+def _separations(coords, periodic, boxl, ws):
+    """
+    compute ws.dr = x[i] - x[j] and ws.r2 for all pairs in the workspace
+    """
+    x = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    dr = ws.dr
+    np.take(x, ws.i, axis=0, out=dr)
+    np.take(x, ws.j, axis=0, out=ws.tmp)
+    dr -= ws.tmp
+    if periodic:
+        np.multiply(dr, 1. / boxl, out=ws.tmp)
+        np.rint(ws.tmp, out=ws.tmp)
+        ws.tmp *= boxl
+        dr -= ws.tmp
+    np.multiply(dr, dr, out=ws.tmp)
+    ws.tmp.sum(1, out=ws.r2)
+
+def _inverse_powers(ws, mask=None):
+    """compute ws.ir2 and ws.ir6.  They are set to zero where mask is False"""
+    np.divide(1., ws.r2, out=ws.ir2)
+    if mask is not None:
+        ws.ir2 *= mask
+    np.power(ws.ir2, 3, out=ws.ir6)
+
+def _gradient(ws, g):
+    """
+    return the gradient from the pair forces: atom i gets -g*dr, atom j +g*dr
+    """
+    np.multiply(ws.dr, g[:,np.newaxis], out=ws.tmp)
+    grad = np.zeros([ws.natoms, 3])
+    for k in range(3):
+        f = ws.tmp[:,k]
+        grad[:,k] = (np.bincount(ws.j, weights=f, minlength=ws.natoms)
+                     - np.bincount(ws.i, weights=f, minlength=ws.natoms))
+    return grad.reshape(-1)
+
+def _hessian_vector_product(ws, v, a, b):
+    """
+    return the product of the hessian with v from the pair terms a and b.
+
+    With dv = v[i] - v[j] atom i gets a (dr.dv) dr + b dv and atom j the
+    negative, where b = phi'/r and a = (phi'' - phi'/r) / r**2
+    """
+    v = np.asarray(v, dtype=np.float64).reshape(-1, 3)
+    dv = v[ws.i] - v[ws.j]
+    h = (a * (ws.dr * dv).sum(1))[:,np.newaxis] * ws.dr + b[:,np.newaxis] * dv
+    hv = np.zeros([ws.natoms, 3])
+    for k in range(3):
+        hv[:,k] = (np.bincount(ws.i, weights=h[:,k], minlength=ws.natoms)
+                   - np.bincount(ws.j, weights=h[:,k], minlength=ws.natoms))
+    return hv.reshape(-1)
+
+
+#########################################################################
+# Lennard-Jones
+#########################################################################
+
+def _lj_energy(ws, eps, sig, periodic, boxl, coords, gradient):
+    _separations(coords, periodic, boxl, ws)
+    _inverse_powers(ws)
+    #s6 = (sig/r)**6
+    s6 = ws.ir6
+    s6 *= sig**6
+    #e = 4 eps (s6**2 - s6)
+    e = ws.e
+    np.multiply(s6, s6, out=e)
+    e -= s6
+    E = 4. * eps * e.sum()
+    if not gradient:
+        return E
+    #g = 4 eps (12 s6**2 - 6 s6) / r2
+    g = ws.g
+    np.multiply(s6, 12., out=g)
+    g -= 6.
+    g *= s6
+    g *= ws.ir2
+    g *= 4. * eps
+    return E, _gradient(ws, g)
+
+def _lj_hessian_vector_product(ws, eps, sig, periodic, boxl, coords, v, rcut=None, B1=0.):
+    _separations(coords, periodic, boxl, ws)
+    if rcut is None:
+        inside = None
+    else:
+        inside = ws.r2 <= rcut**2
+    _inverse_powers(ws, inside)
+    s6 = ws.ir6 * sig**6
+    b = -4. * eps * ((12. * s6 - 6.) * s6 * ws.ir2 - 2. * B1)
+    a = 4. * eps * (168. * s6 - 48.) * s6 * ws.ir2**2
+    if inside is not None:
+        b *= inside
+    return _hessian_vector_product(ws, v, a, b)
+
+def lj_energy(coords, eps, sig, periodic, boxl, natoms=None):
+    """the same as fortran.lj.ljenergy"""
+    ws = _get_workspace(len(coords) / 3)
+    return _lj_energy(ws, eps, sig, periodic, boxl, coords, False)
+
+def lj_energy_gradient(coords, eps, sig, periodic, boxl, natoms=None):
+    """the same as fortran.lj.ljenergy_gradient"""
+    ws = _get_workspace(len(coords) / 3)
+    return _lj_energy(ws, eps, sig, periodic, boxl, coords, True)
+
+def lj_energy_ilist(coords, eps, sig, ilist, periodic, boxl, natoms=None):
+    """the same as fortran.lj.energy_ilist"""
+    ws = _get_workspace_ilist(len(coords) / 3, ilist)
+    return _lj_energy(ws, eps, sig, periodic, boxl, coords, False)
+
+def lj_energy_gradient_ilist(coords, eps, sig, ilist, periodic, boxl, natoms=None):
+    """the same as fortran.lj.energy_gradient_ilist"""
+    ws = _get_workspace_ilist(len(coords) / 3, ilist)
+    return _lj_energy(ws, eps, sig, periodic, boxl, coords, True)
+
+def lj_hessian_vector_product(coords, v, eps, sig, periodic, boxl, natoms=None):
+    """the same as fortran.lj.ljhessian_vector_product"""
+    ws = _get_workspace(len(coords) / 3)
+    return _lj_hessian_vector_product(ws, eps, sig, periodic, boxl, coords, v)
+
+
+#########################################################################
+# Lennard-Jones with a smooth cutoff
+#########################################################################
+
+def _ljcut_energy(ws, eps, sig, periodic, boxl, rcut, coords, gradient):
+    _separations(coords, periodic, boxl, ws)
+    inside = ws.r2 <= rcut**2
+    _inverse_powers(ws, inside)
+    sig6 = sig**6
+    sig12 = sig6 * sig6
+    rcut6 = rcut**6
+    A1 = 4.0*(sig6/rcut6) - 7.0*(sig12/rcut6**2)
+    B1 = (-3.0*(sig6/rcut6) + 6.0*(sig12/rcut6**2)) / rcut**2
+    #s6 = (sig/r)**6
+    s6 = ws.ir6
+    s6 *= sig6
+    #e = 4 eps (s6**2 - s6 + A1 + B1 r2) inside the cutoff
+    e = ws.e
+    np.multiply(s6, s6, out=e)
+    e -= s6
+    e += A1
+    e += B1 * ws.r2
+    e *= inside
+    E = 4. * eps * e.sum()
+    if not gradient:
+        return E
+    #g = 4 eps ((12 s6**2 - 6 s6) / r2 - 2 B1) inside the cutoff
+    g = ws.g
+    np.multiply(s6, 12., out=g)
+    g -= 6.
+    g *= s6
+    g *= ws.ir2
+    g -= 2. * B1
+    g *= inside
+    g *= 4. * eps
+    return E, _gradient(ws, g)
+
+def ljcut_energy(coords, eps, sig, periodic, boxl, rcut, natoms=None):
+    """the same as fortran.ljcut.ljenergy"""
+    ws = _get_workspace(len(coords) / 3)
+    return _ljcut_energy(ws, eps, sig, periodic, boxl, rcut, coords, False)
+
+def ljcut_energy_gradient(coords, eps, sig, periodic, boxl, rcut, natoms=None):
+    """the same as fortran.ljcut.ljenergy_gradient"""
+    ws = _get_workspace(len(coords) / 3)
+    return _ljcut_energy(ws, eps, sig, periodic, boxl, rcut, coords, True)
+
+def ljcut_energy_ilist(coords, eps, sig, ilist, periodic, boxl, rcut, natoms=None):
+    """the same as fortran.ljcut.energy_ilist"""
+    ws = _get_workspace_ilist(len(coords) / 3, ilist)
+    return _ljcut_energy(ws, eps, sig, periodic, boxl, rcut, coords, False)
+
+def ljcut_energy_gradient_ilist(coords, eps, sig, ilist, periodic, boxl, rcut, natoms=None):
+    """the same as fortran.ljcut.energy_gradient_ilist"""
+    ws = _get_workspace_ilist(len(coords) / 3, ilist)
+    return _ljcut_energy(ws, eps, sig, periodic, boxl, rcut, coords, True)
+
+def ljcut_hessian_vector_product(coords, v, eps, sig, periodic, boxl, rcut, natoms=None):
+    """the same as fortran.ljcut.ljhessian_vector_product"""
+    ws = _get_workspace(len(coords) / 3)
+    sig6 = sig**6
+    rcut6 = rcut**6
+    B1 = (-3.0*(sig6/rcut6) + 6.0*(sig6**2/rcut6**2)) / rcut**2
+    return _lj_hessian_vector_product(ws, eps, sig, periodic, boxl, coords, v, rcut=rcut, B1=B1)
+
+
+#########################################################################
+# binary Lennard-Jones with a smooth cutoff
+#########################################################################
+
+def _blj_pair_params(ws, cutoff, ntypea, epsab, epsbb, sigab, sigbb):
+    """
+    return eps, sig6, const, rconst, rcut2 as arrays over the pairs in ws
+
+    The atoms with index less than ntypea are of type A, the rest of type B.
+    epsAA = sigAA = 1 and the cutoff of each pair type is cutoff*sig.
+    """
+    key = (cutoff, ntypea, epsab, epsbb, sigab, sigbb)
+    try:
+        return ws.pair_params[key]
+    except KeyError:
+        pass
+    nA = (ws.i < ntypea).astype(int) + (ws.j < ntypea).astype(int)
+    #index 0: BB, 1: AB, 2: AA
+    eps = np.array([epsbb, epsab, 1.])
+    sig = np.array([sigbb, sigab, 1.])
+    rcut = cutoff * sig
+    sig6 = sig**6
+    sigrc6 = sig6 / rcut**6
+    sigrc12 = sigrc6**2
+    const = 4.0*sigrc6 - 7.0*sigrc12
+    rconst = (6.0*sigrc12 - 3.0*sigrc6) / rcut**2
+    params = (eps[nA], sig6[nA], const[nA], rconst[nA], (rcut**2)[nA])
+    ws.pair_params[key] = params
+    return params
+
+def _blj_energy(ws, coords, gtest, boxl, cutoff, periodic, ntypea, epsab, epsbb, sigab, sigbb):
+    eps, sig6, const, rconst, rcut2 = _blj_pair_params(ws, cutoff, ntypea, epsab, epsbb, sigab, sigbb)
+    _separations(coords, periodic, boxl, ws)
+    inside = ws.r2 < rcut2
+    _inverse_powers(ws, inside)
+    #s6 = (sig/r)**6
+    s6 = ws.ir6
+    s6 *= sig6
+    #e = 4 eps (s6 (s6 - 1) + rconst r2 + const) inside the cutoff
+    e = ws.e
+    np.multiply(s6, s6, out=e)
+    e -= s6
+    e += rconst * ws.r2
+    e += const
+    e *= inside
+    e *= eps
+    E = 4. * e.sum()
+    if not gtest:
+        return np.zeros(3 * ws.natoms), E
+    #g = 8 eps (3 (2 s6**2 - s6) / r2 - rconst) inside the cutoff
+    g = ws.g
+    np.multiply(s6, 2., out=g)
+    g -= 1.
+    g *= s6
+    g *= ws.ir2
+    g *= 3.
+    g -= rconst
+    g *= inside
+    g *= 8. * eps
+    return _gradient(ws, g), E
+
+def ljpshift_energy_gradient(coords, gtest, stest, boxlx, boxly, boxlz, cutoff, periodic,
+             ntypea, epsab, epsbb, sigab, sigbb, natoms=None):
+    """
+    the same as fortran.ljpshiftfort.ljpshift
+
+    stest is ignored and only cubic boxes are supported.  If periodic,
+    coords is put in the box in place.
+    """
+    _check_cubic(periodic, boxlx, boxly, boxlz)
+    if periodic:
+        _put_in_box(coords, boxlx)
+    ws = _get_workspace(len(coords) / 3)
+    return _blj_energy(ws, coords, gtest, boxlx, cutoff, periodic, ntypea,
+                       epsab, epsbb, sigab, sigbb)
+
+def ljpshift_hessian_vector_product(coords, v, boxlx, boxly, boxlz, cutoff, periodic,
+             ntypea, epsab, epsbb, sigab, sigbb, natoms=None):
+    """
+    the same as fortran.ljpshiftfort.ljpshift_hessian_vector_product
+
+    only cubic boxes are supported.
+    """
+    _check_cubic(periodic, boxlx, boxly, boxlz)
+    ws = _get_workspace(len(coords) / 3)
+    eps, sig6, const, rconst, rcut2 = _blj_pair_params(ws, cutoff, ntypea, epsab, epsbb, sigab, sigbb)
+    _separations(coords, periodic, boxlx, ws)
+    inside = ws.r2 < rcut2
+    _inverse_powers(ws, inside)
+    s6 = ws.ir6 * sig6
+    b = -4. * eps * ((12. * s6 - 6.) * s6 * ws.ir2 - 2. * rconst) * inside
+    a = 4. * eps * (168. * s6 - 48.) * s6 * ws.ir2**2
+    return _hessian_vector_product(ws, v, a, b)
+
+
+class _Namespace(object):
+    """a module-like container for the replacements of the fortran routines"""
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+lj = _Namespace(ljenergy=lj_energy,
+                ljenergy_gradient=lj_energy_gradient,
+                energy_ilist=lj_energy_ilist,
+                energy_gradient_ilist=lj_energy_gradient_ilist,
+                ljhessian_vector_product=lj_hessian_vector_product)
+ljcut = _Namespace(ljenergy=ljcut_energy,
+                   ljenergy_gradient=ljcut_energy_gradient,
+                   energy_ilist=ljcut_energy_ilist,
+                   energy_gradient_ilist=ljcut_energy_gradient_ilist,
+                   ljhessian_vector_product=ljcut_hessian_vector_product)
+ljpshift = _Namespace(ljpshift=ljpshift_energy_gradient,
+                      ljpshift_hessian_vector_product=ljpshift_hessian_vector_product)
+
+
+import unittest
+def _reference_energy(coords, pair_energy, periodic=False, boxl=None):
+    """the sum of pair_energy(r, i, j) over all pairs, with plain python loops"""
+    x = np.reshape(coords, [-1, 3])
+    E = 0.
+    for i in range(len(x)):
+        for j in range(i+1, len(x)):
+            dr = x[i] - x[j]
+            if periodic:
+                dr -= boxl * np.round(dr / boxl)
+            E += pair_energy(np.linalg.norm(dr), i, j)
+    return E
+
+class TestLJNumpyReference(unittest.TestCase):
+    """
+    check the numpy routines against closed form energies and numerical
+    derivatives.  This needs no compiled modules.
+    """
+    def setUp(self):
+        np.random.seed(0)
+        self.natoms = 12
+        self.coords = np.random.uniform(-1, 1, 3*self.natoms) * 1.3
+        self.v = np.random.uniform(-1, 1, 3*self.natoms)
+
+    def check(self, f_energy_gradient, f_hv, ref_pair_energy, periodic, boxl):
+        from pygmin.potentials.potential import BasePotential
+        class Pot(BasePotential):
+            def getEnergy(self, coords):
+                return f_energy_gradient(coords)[0]
+        pot = Pot()
+        E, grad = f_energy_gradient(self.coords)
+        Eref = _reference_energy(self.coords, ref_pair_energy, periodic, boxl)
+        self.assertAlmostEqual(1., E / Eref, 10)
+        gnum = pot.NumericalDerivative(self.coords, 1e-6)
+        self.assertLess(np.max(np.abs(grad - gnum)) / np.max(np.abs(grad)), 1e-6)
+        hv = f_hv(self.coords, self.v)
+        gplus = f_energy_gradient(self.coords + 1e-6 * self.v)[1]
+        gminus = f_energy_gradient(self.coords - 1e-6 * self.v)[1]
+        hvnum = (gplus - gminus) / 2e-6
+        self.assertLess(np.max(np.abs(hv - hvnum)) / np.max(np.abs(hv)), 1e-5)
+
+    def test_lj(self):
+        eps, sig = 1.2, 1.1
+        def pair(r, i, j):
+            return 4. * eps * ((sig / r)**12 - (sig / r)**6)
+        for periodic in [False, True]:
+            args = (eps, sig, periodic, 3.)
+            self.check(lambda x: lj.ljenergy_gradient(x, *args),
+                       lambda x, v: lj.ljhessian_vector_product(x, v, *args),
+                       pair, periodic, 3.)
+            ilist = np.array([[i, j] for i in range(self.natoms) for j in range(i)])
+            self.check(lambda x: lj.energy_gradient_ilist(x, eps, sig, ilist.reshape(-1), periodic, 3.),
+                       lambda x, v: lj.ljhessian_vector_product(x, v, *args),
+                       pair, periodic, 3.)
+
+    def test_ljcut(self):
+        eps, sig, rcut = 1.2, 1.1, 1.8
+        def pair(r, i, j):
+            #shifted so that the energy and the force vanish at rcut
+            if r > rcut:
+                return 0.
+            phi = lambda r: (sig / r)**12 - (sig / r)**6
+            dphi = lambda r: (-12. * (sig / r)**12 + 6. * (sig / r)**6) / r
+            return 4. * eps * (phi(r) - phi(rcut) - 0.5 * dphi(rcut) * (r**2 - rcut**2) / rcut)
+        for periodic in [False, True]:
+            args = (eps, sig, periodic, 4., rcut)
+            self.check(lambda x: ljcut.ljenergy_gradient(x, *args),
+                       lambda x, v: ljcut.ljhessian_vector_product(x, v, *args),
+                       pair, periodic, 4.)
+
+    def test_ljpshift(self):
+        ntypea, epsab, epsbb, sigab, sigbb, cutoff = 8, 1.5, 0.5, 0.8, 0.88, 1.8
+        def pair(r, i, j):
+            nA = (i < ntypea) + (j < ntypea)
+            eps = [epsbb, epsab, 1.][nA]
+            sig = [sigbb, sigab, 1.][nA]
+            rcut = cutoff * sig
+            if r >= rcut:
+                return 0.
+            phi = lambda r: (sig / r)**12 - (sig / r)**6
+            dphi = lambda r: (-12. * (sig / r)**12 + 6. * (sig / r)**6) / r
+            return 4. * eps * (phi(r) - phi(rcut) - 0.5 * dphi(rcut) * (r**2 - rcut**2) / rcut)
+        for periodic in [False, True]:
+            boxl = 4.
+            args = (periodic, ntypea, epsab, epsbb, sigab, sigbb)
+            def f_energy_gradient(x):
+                g, e = ljpshift.ljpshift(x.copy(), True, False, boxl, boxl, boxl, cutoff, *args)
+                return e, g
+            self.check(f_energy_gradient,
+                       lambda x, v: ljpshift.ljpshift_hessian_vector_product(x, v, boxl, boxl, boxl, cutoff, *args),
+                       pair, periodic, boxl)
+
+    def test_ljpshift_box(self):
+        args = (True, False, 4., 4., 5., 1.8, True, 8, 1.5, 0.5, 0.8, 0.88)
+        self.assertRaises(ValueError, ljpshift.ljpshift, self.coords, *args)
+        #the coordinates are put in the box in place
+        x = self.coords * 3.
+        args = (True, False, 2., 2., 2., 1.8, True, 8, 1.5, 0.5, 0.8, 0.88)
+        g1, e1 = ljpshift.ljpshift(x, *args)
+        self.assertLessEqual(np.max(np.abs(x)), 1.)
+        g2, e2 = ljpshift.ljpshift(self.coords * 3., *args)
+        self.assertAlmostEqual(e1, e2, 10)
+
+    def test_ilist_workspace(self):
+        ilist = np.array([[1, 0], [3, 2], [5, 1]])
+        ws = _get_workspace_ilist(self.natoms, ilist)
+        self.assertIs(_get_workspace_ilist(self.natoms, ilist.copy()), ws)
+        self.assertIsNot(_get_workspace_ilist(self.natoms, ilist[:2]), ws)
+
+    def test_threads(self):
+        """every thread has its own work arrays"""
+        ws = []
+        t = threading.Thread(target=lambda: ws.append(_get_workspace(self.natoms)))
+        t.start()
+        t.join()
+        self.assertIsNot(ws[0], _get_workspace(self.natoms))
+
+
+class TestLJNumpy(unittest.TestCase):
+    """compare the numpy routines with the fortran routines"""
+    def setUp(self):
+        self.natoms = 20
+        self.coords = np.random.uniform(-1, 1, 3*self.natoms) * 1.5
+        self.ilist = np.array([[i, j] for i in range(self.natoms) for j in range(i)])
+
+    def import_fortran(self, name):
+        try:
+            return __import__("fortran." + name, globals(), fromlist=[name])
+        except ImportError:
+            self.skipTest("the compiled module %s is not available" % name)
+
+    def compare(self, e1, g1, e2, g2):
+        self.assertAlmostEqual(1., e1 / e2, 8)
+        gdiffmax = np.max(np.abs(g1 - g2)) / np.max(np.abs(g1))
+        self.assertLess(gdiffmax, 1e-8)
+
+    def compare_hv(self, ffort, fnumpy, args):
+        v = np.random.uniform(-1, 1, self.coords.size)
+        hv1 = ffort(self.coords, v, *args)
+        hv2 = fnumpy(self.coords, v, *args)
+        self.assertLess(np.max(np.abs(hv1 - hv2)) / np.max(np.abs(hv1)), 1e-8)
+
+    def test_lj(self):
+        ljf = self.import_fortran("lj")
+        for periodic in [False, True]:
+            args = (1.2, 1.1, periodic, 3.)
+            e1, g1 = ljf.ljenergy_gradient(self.coords, *args)
+            e2, g2 = lj.ljenergy_gradient(self.coords, *args)
+            self.compare(e1, g1, e2, g2)
+            self.assertAlmostEqual(1., lj.ljenergy(self.coords, *args) / e1, 8)
+            e3, g3 = lj.energy_gradient_ilist(self.coords, 1.2, 1.1, self.ilist.reshape(-1), periodic, 3.)
+            self.compare(e1, g1, e3, g3)
+            self.compare_hv(ljf.ljhessian_vector_product, lj.ljhessian_vector_product, args)
+
+    def test_ljcut(self):
+        ljf = self.import_fortran("ljcut")
+        for periodic in [False, True]:
+            args = (1.2, 1.1, periodic, 4., 1.8)
+            e1, g1 = ljf.ljenergy_gradient(self.coords, *args)
+            e2, g2 = ljcut.ljenergy_gradient(self.coords, *args)
+            self.compare(e1, g1, e2, g2)
+            self.assertAlmostEqual(1., ljcut.ljenergy(self.coords, *args) / e1, 8)
+            e3, g3 = ljcut.energy_gradient_ilist(self.coords, 1.2, 1.1, self.ilist.reshape(-1), periodic, 4., 1.8)
+            self.compare(e1, g1, e3, g3)
+            self.compare_hv(ljf.ljhessian_vector_product, ljcut.ljhessian_vector_product, args)
+
+    def test_ljpshift(self):
+        ljf = self.import_fortran("ljpshiftfort")
+        for periodic in [False, True]:
+            args = (True, False, 4., 4., 4., 1.8, periodic, 15, 1.5, 0.5, 0.8, 0.88)
+            g1, e1 = ljf.ljpshift(self.coords.copy(), *args)
+            g2, e2 = ljpshift.ljpshift(self.coords, *args)
+            self.compare(e1, g1, e2, g2)
+            self.compare_hv(ljf.ljpshift_hessian_vector_product, 
+                            ljpshift.ljpshift_hessian_vector_product, args[2:])
+            #the central difference of the gradient along v
+            v = np.random.uniform(-1, 1, self.coords.size)
+            hv = ljpshift.ljpshift_hessian_vector_product(self.coords, v, *args[2:])
+            gplus = ljpshift.ljpshift(self.coords + 1e-7 * v, *args)[0]
+            gminus = ljpshift.ljpshift(self.coords - 1e-7 * v, *args)[0]
+            hvnum = (gplus - gminus) / 2e-7
+            self.assertLess(np.max(np.abs(hv - hvnum)) / np.max(np.abs(hv)), 1e-5)
+
+
+def benchmark(natoms_list=[13, 38, 100, 300], nrepeat=200):
+    """print the time per gradient call of the fortran and numpy routines"""
+    import time
+    import fortran.lj as ljf
+    import fortran.ljcut as ljcutf
+    import fortran.ljpshiftfort as ljpshiftf
+    print "%8s %10s %12s %12s %8s" % ("natoms", "potential", "fortran (s)", "numpy (s)", "ratio")
+    for natoms in natoms_list:
+        coords = np.random.uniform(-1, 1, 3*natoms) * natoms**(1./3)
+        boxl = 2. * natoms**(1./3)
+        tests = [("lj", ljf.ljenergy_gradient, lj.ljenergy_gradient,
+                  (coords, 1., 1., False, boxl)),
+                 ("ljcut", ljcutf.ljenergy_gradient, ljcut.ljenergy_gradient,
+                  (coords, 1., 1., True, boxl, 2.5)),
+                 ("blj", ljpshiftf.ljpshift, ljpshift.ljpshift,
+                  (coords, True, False, boxl, boxl, boxl, 2.5, True, int(0.8*natoms), 1.5, 0.5, 0.8, 0.88)),
+                 ]
+        for name, ffort, fnumpy, args in tests:
+            times = []
+            for f in [ffort, fnumpy]:
+                t0 = time.time()
+                for i in xrange(nrepeat):
+                    f(*args)
+                times.append((time.time() - t0) / nrepeat)
+            print "%8d %10s %12.3g %12.3g %8.1f" % (natoms, name, times[0], times[1], times[1] / times[0])
+
+
+if __name__ == "__main__":
+    benchmark()
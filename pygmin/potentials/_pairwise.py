@@ -0,0 +1,68 @@
+"""
+tools for vectorized pair potentials acting on many configurations at once
+"""
+import numpy as np
+
+#the maximum number of elements in the (nconf, natoms, natoms) work arrays.
+#Larger batches are split into chunks.
+max_batch_elements = 2**21
+
+def pair_separations(coords2d, dim=3, boxl=None):
+    """
+    return all pair separation vectors and squared distances of many configurations
+
+    Parameters
+    ----------
+    coords2d : array of shape (nconf, natoms*dim)
+    dim : int
+        the dimension of space
+    boxl : float, optional
+        if not None apply the minimum image convention in a cubic box
+        of this side length
+
+    Returns
+    -------
+    dr : array of shape (nconf, natoms, natoms, dim)
+        dr[k,i,j] = x[k,i] - x[k,j]
+    r2 : array of shape (nconf, natoms, natoms)
+        the squared distances.  The diagonal is set to infinity, so
+        inverse powers of it vanish and it is always beyond any cutoff.
+    """
+    nconf = coords2d.shape[0]
+    x = coords2d.reshape(nconf, -1, dim)
+    natoms = x.shape[1]
+    dr = x[:,:,np.newaxis,:] - x[:,np.newaxis,:,:]
+    if boxl is not None:
+        dr -= np.round(dr / boxl) * boxl
+    r2 = (dr**2).sum(3)
+    diag = np.arange(natoms)
+    r2[:,diag,diag] = np.inf
+    return dr, r2
+
+def energy_gradient_multiple(pot, coords2d, kernel, dim=3):
+    """
+    evaluate a vectorized kernel over many configurations in chunks
+
+    The kernel is called as `energies, grads = kernel(coords_chunk)` on
+    chunks small enough that the pair arrays fit in max_batch_elements.  If
+    a single configuration is already too large the python overhead is
+    irrelevant and pot.getEnergyGradient is called for each configuration
+    instead.
+    """
+    coords2d = np.asarray(coords2d, dtype=np.float64)
+    nconf, ndof = coords2d.shape
+    natoms = ndof / dim
+    chunk = max_batch_elements / natoms**2
+    if chunk < 1:
+        energies = np.zeros(nconf)
+        grads = np.zeros(coords2d.shape)
+        for i in xrange(nconf):
+            energies[i], grads[i,:] = pot.getEnergyGradient(coords2d[i,:])
+        return energies, grads
+    if chunk >= nconf:
+        return kernel(coords2d)
+    energies = np.zeros(nconf)
+    grads = np.zeros(coords2d.shape)
+    for i in xrange(0, nconf, chunk):
+        energies[i:i+chunk], grads[i:i+chunk,:] = kernel(coords2d[i:i+chunk,:])
+    return energies, grads
@@ -0,0 +1,170 @@
+import numpy as np
+from collections import OrderedDict
+
+from pygmin.potentials.potential import BasePotential, has_hessian_vector_product
+
+__all__ = ["CachingPotential"]
+
+class CachingPotential(BasePotential):
+    """
+    a potential wrapper which remembers the most recent energy evaluations
+
+    Optimizers and transition state searches often evaluate the potential
+    again at a point they have already seen, e.g. LBFGS.run() re-evaluates the
+    starting point and minima_from_ts quenches from known points.  For
+    expensive potentials this wrapper returns the stored result instead.
+
+    Parameters
+    ----------
+    potential :
+        the potential to wrap
+    maxsize : int
+        the number of evaluations to remember.  The least recently used
+        entry is discarded when the cache is full.
+
+    Attributes
+    ----------
+    nhits, nmisses : int
+        the number of calls answered from the cache and passed to the
+        potential.
+
+    Notes
+    -----
+    The key is the exact byte content of the coordinate array, so a hit
+    always returns exactly what the potential would have returned.  The
+    gradient is copied on the way in and the way out, so the caller can
+    modify it freely.
+
+    Attributes that are not defined here are looked up on the wrapped
+    potential, so e.g. getEnergyGradientHessian still works.  They are not
+    cached.
+    """
+    def __init__(self, potential, maxsize=10):
+        self.potential = potential
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.nhits = 0
+        self.nmisses = 0
+
+    def __getattr__(self, name):
+        #only called if the attribute is not found in the usual places
+        if name == "potential":
+            raise AttributeError(name)
+        return getattr(self.potential, name)
+
+    def _key(self, coords):
+        return np.ascontiguousarray(coords, dtype=np.float64).tostring()
+
+    def _lookup(self, key, need_gradient):
+        try:
+            E, grad = self.cache[key]
+        except KeyError:
+            return None
+        if need_gradient and grad is None:
+            return None
+        #move the entry to the end, it is now the most recently used
+        del self.cache[key]
+        self.cache[key] = (E, grad)
+        self.nhits += 1
+        return E, grad
+
+    def _store(self, key, E, grad):
+        self.nmisses += 1
+        if key in self.cache:
+            del self.cache[key]
+        elif len(self.cache) >= self.maxsize:
+            self.cache.popitem(last=False)
+        self.cache[key] = (E, grad)
+
+    def getEnergy(self, coords):
+        key = self._key(coords)
+        ret = self._lookup(key, False)
+        if ret is not None:
+            return ret[0]
+        E = self.potential.getEnergy(coords)
+        self._store(key, E, None)
+        return E
+
+    def getEnergyGradient(self, coords):
+        key = self._key(coords)
+        ret = self._lookup(key, True)
+        if ret is not None:
+            return ret[0], ret[1].copy()
+        E, grad = self.potential.getEnergyGradient(coords)
+        self._store(key, E, np.array(grad, dtype=np.float64))
+        return E, grad
+
+    @property
+    def getHessianVectorProduct(self):
+        """
+        the analytic product of the wrapped potential if it has one.
+        Otherwise the finite difference default, which uses the cache
+        """
+        if has_hessian_vector_product(self.potential):
+            return self.potential.getHessianVectorProduct
+        return BasePotential.getHessianVectorProduct.__get__(self, CachingPotential)
+
+    def getEnergyGradientMultiple(self, coords2d):
+        """passed directly to the wrapped potential.  This is not cached"""
+        return self.potential.getEnergyGradientMultiple(coords2d)
+
+    def clear(self):
+        """empty the cache and reset the counters"""
+        self.cache.clear()
+        self.nhits = 0
+        self.nmisses = 0
+
+
+import unittest
+class TestCachingPotential(unittest.TestCase):
+    def setUp(self):
+        from pygmin.potentials.lj import LJ
+        self.pot = CachingPotential(LJ(), maxsize=2)
+        self.coords = np.random.uniform(-1, 1, 3*8) * 1.2
+
+    def test_hit(self):
+        e1, g1 = self.pot.getEnergyGradient(self.coords)
+        g1[:] = 0.
+        e2, g2 = self.pot.getEnergyGradient(self.coords.copy())
+        self.assertEqual(e1, e2)
+        self.assertEqual(self.pot.nhits, 1)
+        self.assertEqual(self.pot.nmisses, 1)
+        self.assertGreater(np.abs(g2).max(), 0.)
+        self.assertEqual(self.pot.getEnergy(self.coords), e1)
+        self.assertEqual(self.pot.nhits, 2)
+
+    def test_lru(self):
+        x2 = self.coords + 0.1
+        x3 = self.coords + 0.2
+        self.pot.getEnergyGradient(self.coords)
+        self.pot.getEnergyGradient(x2)
+        self.pot.getEnergyGradient(self.coords)
+        self.pot.getEnergyGradient(x3)
+        #x2 was the least recently used, so it is gone
+        self.pot.getEnergyGradient(x2)
+        self.assertEqual(self.pot.nhits, 1)
+        self.assertEqual(self.pot.nmisses, 4)
+        self.assertEqual(len(self.pot.cache), 2)
+
+    def test_energy_only(self):
+        self.pot.getEnergy(self.coords)
+        self.pot.getEnergyGradient(self.coords)
+        self.assertEqual(self.pot.nhits, 0)
+        self.pot.getEnergyGradient(self.coords)
+        self.assertEqual(self.pot.nhits, 1)
+
+    def test_hessian_vector_product(self):
+        #atoms on a perturbed cubic lattice, so no pair is so close that the
+        #finite differences become inaccurate
+        lattice = np.array([(i, j, k) for i in range(2) for j in range(2) for k in range(2)])
+        coords = (1.1 * lattice + np.random.uniform(-0.1, 0.1, lattice.shape)).reshape(-1)
+        v = np.random.uniform(-1, 1, coords.size)
+        self.assertTrue(has_hessian_vector_product(self.pot))
+        hv = self.pot.getHessianVectorProduct(coords, v)
+        self.assertTrue(np.all(hv == self.pot.potential.getHessianVectorProduct(coords, v)))
+        #a potential without an analytic product
+        pot = CachingPotential(BasePotential())
+        pot.getEnergyGradient = self.pot.getEnergyGradient
+        self.assertFalse(has_hessian_vector_product(pot))
+        hvnum = pot.getHessianVectorProduct(coords, v)
+        self.assertLess(np.max(np.abs(hv - hvnum)) / np.max(np.abs(hv)), 1e-4)
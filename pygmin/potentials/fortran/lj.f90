@@ -133,3 +133,43 @@ do n = 1,nlist
    grad(i2+1 : i2+3) = grad(i2+1 : i2+3) + g * dr(:)
 enddo
 end subroutine energy_gradient_ilist
+
+subroutine ljhessian_vector_product( coords, v, natoms, hv, eps, sig, periodic, boxl )
+! the product of the hessian with the vector v, without forming the hessian.
+! For a pair potential phi(r) the pair contribution to atom j1 is
+!     hv = a * (dr . dv) * dr + b * dv
+! where dv = v(j1) - v(j2), b = phi'/r and a = (phi'' - phi'/r) / r**2
+implicit none
+integer, intent(in) :: natoms
+double precision, intent(in) :: coords(3*natoms), v(3*natoms), sig, eps, boxl
+double precision, intent(out) :: hv(3*natoms)
+logical, intent(in) :: periodic
+double precision dr(3), dv(3), h(3), sig6, sig12, r2, ir2, ir6, ir12, a, b, iboxl
+integer j1, j2, i1, i2
+
+if (periodic) iboxl = 1.d0 / boxl
+
+sig6 = sig**6
+sig12 = sig6*sig6
+
+hv(:) = 0.d0
+do j1 = 1,natoms
+   i1 = 3*(j1-1)
+   do j2 = 1,j1-1
+      i2 = 3*(j2-1)
+      dr(:) = coords(i1+1 : i1 + 3) - coords(i2+1 : i2 + 3)
+      if (periodic)  dr(:) = dr(:) - nint( dr(:) * iboxl ) * boxl
+      r2 = sum( dr(:)**2 )
+      ir2 = 1.d0/r2
+      ir6 = ir2**3
+      ir12 = ir6**2
+
+      b = -4.d0 * eps * (12.d0 * sig12 * ir12 -  6.d0 * sig6 * ir6) * ir2
+      a = 4.d0 * eps * (168.d0 * sig12 * ir12 - 48.d0 * sig6 * ir6) * ir2 * ir2
+      dv(:) = v(i1+1 : i1+3) - v(i2+1 : i2+3)
+      h(:) = a * sum(dr(:) * dv(:)) * dr(:) + b * dv(:)
+      hv(i1+1 : i1+3) = hv(i1+1 : i1+3) + h(:)
+      hv(i2+1 : i2+3) = hv(i2+1 : i2+3) - h(:)
+   enddo
+enddo
+end subroutine ljhessian_vector_product
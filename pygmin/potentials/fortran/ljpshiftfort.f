@@ -275,3 +275,119 @@ C       POTELDUM = 0.D0;
         ENDIF
 
       END SUBROUTINE LJPSHIFT_UPDATE_PAIR
+
+C*******************************************************************
+C
+C  Subroutine LJPSHIFT_HESSIAN_VECTOR_PRODUCT calculates the product
+C  of the second derivative matrix with the vector VEC without
+C  forming the matrix.  The parameters are the same as for LJPSHIFT.
+C
+C*******************************************************************
+
+      SUBROUTINE LJPSHIFT_HESSIAN_VECTOR_PRODUCT(X, VEC, HV,
+     &   NATOMS, BOXLX, BOXLY, BOXLZ, CUTOFF, PERIODIC, NTYPEA,
+     &   EPSAB, EPSBB, SIGAB, SIGBB)
+      IMPLICIT NONE
+      DOUBLE PRECISION, INTENT(IN) :: X(3*NATOMS), VEC(3*NATOMS)
+      DOUBLE PRECISION, INTENT(OUT) :: HV(3*NATOMS)
+      LOGICAL, INTENT(IN) :: PERIODIC
+      DOUBLE PRECISION, INTENT(IN) :: BOXLX, BOXLY, BOXLZ
+      DOUBLE PRECISION, INTENT(IN) :: EPSAB, EPSBB, SIGAB, SIGBB
+      DOUBLE PRECISION, INTENT(IN) :: CUTOFF
+      INTEGER, INTENT(IN) :: NATOMS, NTYPEA
+      DOUBLE PRECISION SIGAB6, SIGBB6, SIGRCAB6, SIGRCBB6, SIGRCAA6,
+     &                 RCONSTAA, RCONSTAB, RCONSTBB,
+     &                 CUTAA, CUTAB, CUTBB
+      INTEGER J1, J2
+
+      CUTAA=CUTOFF
+      CUTAB=CUTOFF*SIGAB
+      CUTBB=CUTOFF*SIGBB
+      SIGAB6=SIGAB**6
+      SIGBB6=SIGBB**6
+      SIGRCAA6= 1.0D0/CUTAA**6
+      SIGRCAB6=SIGAB6/CUTAB**6
+      SIGRCBB6=SIGBB6/CUTBB**6
+      RCONSTAA=(6.0D0*SIGRCAA6**2-3.0D0*SIGRCAA6)/CUTAA**2
+      RCONSTAB=(6.0D0*SIGRCAB6**2-3.0D0*SIGRCAB6)/CUTAB**2
+      RCONSTBB=(6.0D0*SIGRCBB6**2-3.0D0*SIGRCBB6)/CUTBB**2
+
+      DO J1=1,3*NATOMS
+        HV(J1) = 0.0D0
+      END DO
+
+      DO J1=1,NATOMS
+        DO J2=J1+1,NATOMS
+          IF (J2.LE.NTYPEA) THEN
+            CALL LJPSHIFT_UPDATE_PAIRH(X, VEC, HV, 1.0D0, 1.0D0,
+     &   RCONSTAA, 1.0D0/CUTAA**2, J1, J2, BOXLX, BOXLY, BOXLZ,
+     &   NATOMS, PERIODIC)
+          ELSE IF (J1.LE.NTYPEA) THEN
+            CALL LJPSHIFT_UPDATE_PAIRH(X, VEC, HV, EPSAB, SIGAB6,
+     &   RCONSTAB, 1.0D0/CUTAB**2, J1, J2, BOXLX, BOXLY, BOXLZ,
+     &   NATOMS, PERIODIC)
+          ELSE
+            CALL LJPSHIFT_UPDATE_PAIRH(X, VEC, HV, EPSBB, SIGBB6,
+     &   RCONSTBB, 1.0D0/CUTBB**2, J1, J2, BOXLX, BOXLY, BOXLZ,
+     &   NATOMS, PERIODIC)
+          ENDIF
+        ENDDO
+      ENDDO
+
+      END SUBROUTINE LJPSHIFT_HESSIAN_VECTOR_PRODUCT
+
+C*******************************************************************
+
+      SUBROUTINE LJPSHIFT_UPDATE_PAIRH(X, VEC, HV, EPSG, SIGG6,
+     & RCONSTG, IRCUT2G, J1, J2, BOXLX, BOXLY, BOXLZ, NATOMS,
+     & PERIODIC)
+        !add the contribution of the pair j1, j2 to the hessian vector
+        !product HV.  With DR = X(J1) - X(J2) and DV = VEC(J1) - VEC(J2)
+        !atom j1 gets A*(DR.DV)*DR + B*DV and atom j2 the negative,
+        !where B = phi'/r and A = (phi'' - phi'/r)/r**2
+
+        IMPLICIT NONE
+
+        LOGICAL, INTENT(IN) :: PERIODIC
+        INTEGER, INTENT(IN) :: J1, J2, NATOMS
+        DOUBLE PRECISION, INTENT(IN) :: EPSG, SIGG6, RCONSTG
+        DOUBLE PRECISION, INTENT(IN) :: BOXLX, BOXLY, BOXLZ, IRCUT2G
+        DOUBLE PRECISION, INTENT(IN) :: X(3*NATOMS), VEC(3*NATOMS)
+        DOUBLE PRECISION, INTENT(INOUT) :: HV(3*NATOMS)
+        DOUBLE PRECISION :: XVEC(3), DV(3), H, A, B, DOTP
+        DOUBLE PRECISION :: R2, R6, R8, R14
+        INTEGER :: J3, J4, J5
+
+        J3=3*(J1-1)
+        J4=3*(J2-1)
+
+        XVEC(1)=X(J3+1)-X(J4+1)
+        XVEC(2)=X(J3+2)-X(J4+2)
+        XVEC(3)=X(J3+3)-X(J4+3)
+        IF (PERIODIC) THEN
+           XVEC(1)=XVEC(1)-BOXLX*NINT(XVEC(1)/BOXLX)
+           XVEC(2)=XVEC(2)-BOXLY*NINT(XVEC(2)/BOXLY)
+           XVEC(3)=XVEC(3)-BOXLZ*NINT(XVEC(3)/BOXLZ)
+        ENDIF
+
+        R2=1.0D0/(XVEC(1)**2+XVEC(2)**2+XVEC(3)**2)
+        IF (R2.GT.IRCUT2G) THEN
+          R6=R2**3
+          R8=R6*R2
+          R14=R8*R6
+          B=-8.0D0*EPSG*(3.0D0*(2.0D0*R14*(SIGG6*SIGG6)
+     & -R8*SIGG6)-RCONSTG)
+          A=4.0D0*EPSG*(168.0D0*R14*(SIGG6*SIGG6)-48.0D0*R8*SIGG6)*R2
+          DOTP=0.0D0
+          DO J5=1,3
+            DV(J5)=VEC(J3+J5)-VEC(J4+J5)
+            DOTP=DOTP+XVEC(J5)*DV(J5)
+          END DO
+          DO J5=1,3
+            H=A*DOTP*XVEC(J5)+B*DV(J5)
+            HV(J3+J5)=HV(J3+J5)+H
+            HV(J4+J5)=HV(J4+J5)-H
+          END DO
+        ENDIF
+
+      END SUBROUTINE LJPSHIFT_UPDATE_PAIRH
@@ -2,7 +2,12 @@ from math import *
 import numpy as np #to access np.exp() not built int exp
 
 from pygmin.potentials import BasePotential
-import fortran.lj as ljf
+from pygmin.potentials._pairwise import pair_separations, energy_gradient_multiple
+try:
+    import fortran.lj as ljf
+except ImportError:
+    #the compiled fortran module is not available
+    from _lj_numpy import lj as ljf
 
 
 __all__ = ["LJ"]
@@ -149,6 +154,32 @@ class LJ(BasePotential):
                 coords, self.eps, self.sig, self.periodic, self.boxl, [natoms])
         return E, grad 
     
+    def getEnergyGradientMultiple(self, coords2d):
+        """
+        vectorized energies and gradients of many configurations at once
+        
+        See Also
+        --------
+        BasePotential.getEnergyGradientMultiple
+        """
+        return energy_gradient_multiple(self, coords2d, self._energyGradientMultiple)
+    
+    def _energyGradientMultiple(self, coords2d):
+        if self.periodic:
+            dr, r2 = pair_separations(coords2d, boxl=self.boxl)
+        else:
+            dr, r2 = pair_separations(coords2d)
+        ir2 = 1. / r2
+        ir6 = ir2**3
+        ir12 = ir6**2
+        sig6 = self.sig**6
+        sig12 = sig6 * sig6
+        #each pair is counted twice
+        energies = 2. * self.eps * (sig12 * ir12 - sig6 * ir6).sum(2).sum(1)
+        g = 4. * self.eps * (12. * sig12 * ir12 - 6. * sig6 * ir6) * ir2
+        grads = -(g[:,:,:,np.newaxis] * dr).sum(2)
+        return energies, grads.reshape(coords2d.shape)
+    
     def getEnergyList(self, coords, ilist):
         #ilist = ilist_i.getNPilist()
         #ilist += 1 #fortran indexing
@@ -171,8 +202,14 @@ class LJ(BasePotential):
         #ilist -= 1
         return E, grad 
     
+    def getHessianVectorProduct(self, coords, v):
+        """the analytic product of the Hessian with v"""
+        natoms = len(coords) / 3
+        return ljf.ljhessian_vector_product(coords, v, self.eps, self.sig,
+                                            self.periodic, self.boxl, [natoms])
+
     def getEnergyGradientHessian(self, coords):
-        if self.periodic: raise Exception("Hessian not implemented for periodic boundaries")
+        if self.periodic: raise NotImplementedError("Hessian not implemented for periodic boundaries")
         from fortran.lj_hess import ljdiff
         g, energy, hess = ljdiff(coords, True, True)
         return energy, g, hess
@@ -221,11 +258,25 @@ class LJTest(unittest.TestCase):
     def test_lists_e(self):
         e = self.pot.getEnergyList(self.coords, self.ilist)
         self.assertAlmostEqual(self.E, e, 7)
+    def test_multiple(self):
+        coords2d = np.array([self.coords, self.coords * 1.1])
+        e, g = self.pot.getEnergyGradientMultiple(coords2d)
+        self.assertAlmostEqual(1., e[0] / self.E, 7)
+        e1, g1 = self.pot.getEnergyGradient(coords2d[1])
+        self.assertAlmostEqual(1., e[1] / e1, 7)
+        gdiffmax = np.max(np.abs( g[0]-self.grad )) / np.max(np.abs(self.grad))
+        self.assertLess(gdiffmax, 1e-7)
     def test_lists_eg(self):
         e, g = self.pot.getEnergyGradientList(self.coords, self.ilist)
         self.assertAlmostEqual(self.E, e, 7)
         gdiffmax = np.max(np.abs( g-self.grad )) / np.max(np.abs(self.grad))
         self.assertLess(gdiffmax, 1e-7)
+    def test_hessian_vector_product(self):
+        v = np.random.uniform(-1, 1, self.coords.size)
+        hv = self.pot.getHessianVectorProduct(self.coords, v)
+        hvnum = self.pot.NumericalHessianVectorProduct(self.coords, v, 1e-7)
+        hvdiffmax = np.max(np.abs(hv - hvnum)) / np.max(np.abs(hv))
+        self.assertLess(hvdiffmax, 1e-5)
  
 
 if __name__ == "__main__":
@@ -1,7 +1,12 @@
 import numpy as np
 
-import fortran.ljcut as _ljcut
+try:
+    import fortran.ljcut as _ljcut
+except ImportError:
+    #the compiled fortran module is not available
+    from _lj_numpy import ljcut as _ljcut
 from pygmin.potentials import BasePotential
+from pygmin.potentials._pairwise import pair_separations, energy_gradient_multiple
 
 __all__ = ["LJCut"]
 
@@ -40,6 +45,45 @@ class LJCut(BasePotential):
                 self.rcut, [natoms])
         return E, grad 
     
+    def getHessianVectorProduct(self, coords, v):
+        """the analytic product of the Hessian with v"""
+        natoms = len(coords) / 3
+        return _ljcut.ljhessian_vector_product(
+                coords, v, self.eps, self.sig, self.periodic, self.boxl,
+                self.rcut, [natoms])
+    
+    def getEnergyGradientMultiple(self, coords2d):
+        """
+        vectorized energies and gradients of many configurations at once
+        
+        See Also
+        --------
+        BasePotential.getEnergyGradientMultiple
+        """
+        return energy_gradient_multiple(self, coords2d, self._energyGradientMultiple)
+    
+    def _energyGradientMultiple(self, coords2d):
+        if self.periodic:
+            dr, r2 = pair_separations(coords2d, boxl=self.boxl)
+        else:
+            dr, r2 = pair_separations(coords2d)
+        sig6 = self.sig**6
+        sig12 = sig6*sig6
+        rcut2 = self.rcut**2
+        rcut6 = self.rcut**6
+        A1 = 4.0*(sig6/rcut6) - 7.0*(sig12/rcut6**2)
+        B1 = (-3.0*(sig6/rcut6) + 6.0*(sig12/rcut6**2)) / rcut2
+        inside = r2 <= rcut2
+        ir2 = np.where(inside, 1. / r2, 0.)
+        ir6 = ir2**3
+        ir12 = ir6**2
+        #each pair is counted twice
+        e = (sig12 * ir12 - sig6 * ir6 + A1 + B1 * np.where(inside, r2, 0.)) * inside
+        energies = 2. * self.eps * e.sum(2).sum(1)
+        g = 4. * self.eps * ((12. * sig12 * ir12 - 6. * sig6 * ir6) * ir2 - 2. * B1) * inside
+        grads = -(g[:,:,:,np.newaxis] * dr).sum(2)
+        return energies, grads.reshape(coords2d.shape)
+    
     def getEnergyList(self, coords, ilist):
         #ilist = ilist_i.getNPilist()
         #ilist += 1 #fortran indexing
@@ -87,11 +131,25 @@ class LJCutTest(unittest.TestCase):
     def test_lists_e(self):
         e = self.pot.getEnergyList(self.coords, self.ilist)
         self.assertAlmostEqual(self.E, e, 7)
+    def test_multiple(self):
+        coords2d = np.array([self.coords, self.coords * 1.3])
+        e, g = self.pot.getEnergyGradientMultiple(coords2d)
+        self.assertAlmostEqual(1., e[0] / self.E, 7)
+        e1, g1 = self.pot.getEnergyGradient(coords2d[1])
+        self.assertAlmostEqual(1., e[1] / e1, 7)
+        gdiffmax = np.max(np.abs( g[0]-self.grad )) / np.max(np.abs(self.grad))
+        self.assertLess(gdiffmax, 1e-7)
     def test_lists_eg(self):
         e, g = self.pot.getEnergyGradientList(self.coords, self.ilist)
         self.assertAlmostEqual(self.E, e, 7)
         gdiffmax = np.max(np.abs( g-self.grad )) / np.max(np.abs(self.grad))
         self.assertLess(gdiffmax, 1e-7)
+    def test_hessian_vector_product(self):
+        v = np.random.uniform(-1, 1, self.coords.size)
+        hv = self.pot.getHessianVectorProduct(self.coords, v)
+        hvnum = self.pot.NumericalHessianVectorProduct(self.coords, v, 1e-7)
+        hvdiffmax = np.max(np.abs(hv - hvnum)) / np.max(np.abs(hv))
+        self.assertLess(hvdiffmax, 1e-5)
 
 if __name__ == "__main__":
     unittest.main()
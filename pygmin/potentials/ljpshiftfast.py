@@ -1,8 +1,13 @@
 from math import *
 import numpy as np #to access np.exp() not built int exp
-import fortran.ljpshiftfort as ljpshiftfort
+try:
+    import fortran.ljpshiftfort as ljpshiftfort
+except ImportError:
+    #the compiled fortran module is not available
+    from _lj_numpy import ljpshift as ljpshiftfort
 
 from pygmin.potentials import BasePotential
+from pygmin.potentials._pairwise import pair_separations, energy_gradient_multiple
 
 __all__ = ["LJpshift"]
 
@@ -69,6 +74,81 @@ class LJpshift(BasePotential):
                 [self.natoms])
         return E, V
 
+    def getHessianVectorProduct(self, coords, v):
+        """the analytic product of the Hessian with v"""
+        return ljpshiftfort.ljpshift_hessian_vector_product(coords, v,
+                self.boxl, self.boxl, self.boxl, \
+                self.AA.rcut, self.periodic, self.ntypeA, \
+                self.AB.eps, self.BB.eps, self.AB.sig, self.BB.sig, \
+                [self.natoms])
+
+    def _getPairParameters(self):
+        """return the interaction parameters of every pair as (natoms, natoms) arrays"""
+        isA = np.arange(self.natoms) < self.ntypeA
+        AA = isA[:,np.newaxis] & isA[np.newaxis,:]
+        BB = ~isA[:,np.newaxis] & ~isA[np.newaxis,:]
+        params = dict()
+        for name in ["eps", "sig6", "const", "rconst", "ircut2"]:
+            p = np.empty([self.natoms, self.natoms])
+            p[:] = getattr(self.AB, name)
+            p[AA] = getattr(self.AA, name)
+            p[BB] = getattr(self.BB, name)
+            params[name] = p
+        return params
+
+    def getEnergyGradientMultiple(self, coords2d):
+        """
+        vectorized energies and gradients of many configurations at once
+        
+        See Also
+        --------
+        BasePotential.getEnergyGradientMultiple
+        """
+        return energy_gradient_multiple(self, coords2d, self._energyGradientMultiple)
+
+    def _energyGradientMultiple(self, coords2d):
+        try:
+            p = self._pair_params
+        except AttributeError:
+            p = self._pair_params = self._getPairParameters()
+        if self.periodic:
+            dr, r2 = pair_separations(coords2d, boxl=self.boxl)
+        else:
+            dr, r2 = pair_separations(coords2d)
+        ir2 = 1. / r2
+        inside = ir2 > p["ircut2"]
+        ir2 *= inside
+        ir6 = ir2**3
+        sig6 = p["sig6"]
+        #each pair is counted twice
+        e = (sig6 * ir6 * (sig6 * ir6 - 1.) + p["rconst"] * np.where(inside, r2, 0.) + p["const"]) * inside
+        energies = 2. * (p["eps"] * e).sum(2).sum(1)
+        ir8 = ir6 * ir2
+        ir14 = ir8 * ir6
+        g = -8. * p["eps"] * (3. * (2. * ir14 * sig6**2 - ir8 * sig6) - p["rconst"]) * inside
+        grads = (g[:,:,:,np.newaxis] * dr).sum(2)
+        return energies, grads.reshape(coords2d.shape)
+
+
+import unittest
+class TestLJpshiftMultiple(unittest.TestCase):
+    def check(self, boxl):
+        natoms = 20
+        pot = LJpshift(natoms, 16, boxl=boxl)
+        np.random.seed(0)
+        coords2d = np.random.uniform(-1, 1, [3, 3*natoms]) * 1.7
+        e, g = pot.getEnergyGradientMultiple(coords2d)
+        for i in range(3):
+            e1, g1 = pot.getEnergyGradient(coords2d[i])
+            self.assertAlmostEqual(1., e[i] / e1, 10)
+            self.assertLess(np.max(np.abs(g[i] - g1)) / np.max(np.abs(g1)), 1e-10)
+
+    def test_free(self):
+        self.check(None)
+
+    def test_periodic(self):
+        self.check(3.5)
+
 if __name__ == "__main__":
     import pygmin.potentials.ljpshift as ljpshift
     import pygmin.defaults as defaults
@@ -5,7 +5,8 @@ Created on 13 Apr 2012
 '''
 import numpy as np
 
-__all__ = ["BasePotential"]
+__all__ = ["BasePotential", "hessian_vector_product", "has_hessian_vector_product",
+           "has_energy_gradient_multiple"]
 
 
 class BasePotential(object):
@@ -43,6 +44,52 @@ class BasePotential(object):
         e, g = self.getEnergyGradient(coords)
         return g     
 
+    def getHessianVectorProduct(self, coords, v):
+        """
+        return the product of the Hessian at coords with the vector v
+        
+        The default is a central difference of the gradient along v, which
+        costs two gradient evaluations.  Overload this if the product can be
+        computed analytically, the transition state routines use it in place
+        of their own finite differences.
+        
+        See Also
+        --------
+        hessian_vector_product
+        """
+        return self.NumericalHessianVectorProduct(coords, v, 1e-3)
+
+    def NumericalHessianVectorProduct(self, coords, v, eps):
+        return _numerical_hessian_vector_product(self, coords, v, eps)
+
+    def getEnergyGradientMultiple(self, coords2d):
+        """
+        the energies and gradients of many configurations at once
+        
+        Parameters
+        ----------
+        coords2d : array of shape (nconf, ndof)
+            one configuration per row
+        
+        Returns
+        -------
+        energies : array of shape (nconf,)
+        gradients : array of shape (nconf, ndof)
+        
+        Notes
+        -----
+        This is used wherever many configurations are evaluated together,
+        e.g. NEB images and batched quenches.  The default simply loops over
+        getEnergyGradient.  Overload this with a vectorized version to reduce 
+        the python overhead per configuration.
+        """
+        coords2d = np.asarray(coords2d)
+        energies = np.zeros(coords2d.shape[0])
+        grads = np.zeros(coords2d.shape)
+        for i in xrange(coords2d.shape[0]):
+            energies[i], grads[i,:] = self.getEnergyGradient(coords2d[i,:])
+        return energies, grads
+
 
     #routines involving interaction lists
     def getEnergyListSlow(self, coords, ilist):
@@ -80,6 +127,55 @@ class BasePotential(object):
         """
         return self.getEnergyGradientListSlow(coords, ilist)
 
+def _numerical_hessian_vector_product(pot, coords, v, eps):
+    """
+    the central difference of the gradient over a distance eps along v
+    """
+    vnorm = np.linalg.norm(v)
+    if vnorm == 0.:
+        return np.zeros(np.shape(v))
+    dx = (eps / vnorm) * np.asarray(v)
+    eplus, gplus = pot.getEnergyGradient(coords + dx)
+    eminus, gminus = pot.getEnergyGradient(coords - dx)
+    return (gplus - gminus) * (vnorm / (2. * eps))
+
+def has_hessian_vector_product(pot):
+    """
+    return True if pot computes Hessian vector products itself, i.e. it
+    overloads BasePotential.getHessianVectorProduct
+    """
+    f = getattr(pot, "getHessianVectorProduct", None)
+    if f is None:
+        return False
+    return getattr(f, "im_func", f) is not BasePotential.getHessianVectorProduct.im_func
+
+def has_energy_gradient_multiple(pot):
+    """
+    return True if pot evaluates many configurations at once itself, i.e. it
+    overloads BasePotential.getEnergyGradientMultiple
+    """
+    f = getattr(pot, "getEnergyGradientMultiple", None)
+    if f is None:
+        return False
+    return getattr(f, "im_func", f) is not BasePotential.getEnergyGradientMultiple.im_func
+
+def hessian_vector_product(pot, coords, v, eps=1e-3):
+    """
+    return the product of the Hessian of pot at coords with v
+    
+    This works for any object with getEnergyGradient.  If the potential 
+    implements getHessianVectorProduct that is used, otherwise the
+    product is the central difference of the gradient over the distance eps
+    along v.
+    
+    See Also
+    --------
+    BasePotential.getHessianVectorProduct
+    """
+    if has_hessian_vector_product(pot):
+        return pot.getHessianVectorProduct(coords, v)
+    return _numerical_hessian_vector_product(pot, coords, v, eps)
+
 class potential(BasePotential):
     """
     for backward compatibility
@@ -1,6 +1,7 @@
 import numpy as np
 
 from pygmin.potentials import BasePotential
+from pygmin.potentials._pairwise import pair_separations, energy_gradient_multiple
 from fortran.soft_sphere_pot import soft_sphere_pot
 
 __all__ = ["SoftSphere"]
@@ -28,6 +29,48 @@ class SoftSphere(BasePotential):
         energy, force = soft_sphere_pot(self.dimen, coords, self.diams, [natoms])
         return energy, force
 
+    def getEnergyGradientMultiple(self, coords2d):
+        """
+        vectorized energies and gradients of many configurations at once
+        
+        See Also
+        --------
+        BasePotential.getEnergyGradientMultiple
+        """
+        return energy_gradient_multiple(self, coords2d, self._energyGradientMultiple,
+                                        dim=self.dimen)
+
+    def _energyGradientMultiple(self, coords2d):
+        #the fortran code uses periodic boundaries with box length 1
+        dr, r2 = pair_separations(coords2d, dim=self.dimen, boxl=1.)
+        diams = np.asarray(self.diams)
+        Odij = 2. / (diams[:,np.newaxis] + diams[np.newaxis,:])
+        r = np.sqrt(r2)
+        Orij = 1. / r
+        overlap = Orij > Odij
+        ptemp = np.where(overlap, 1. - r * Odij, 0.)
+        #each pair is counted twice
+        energies = 0.25 * (ptemp**2).sum(2).sum(1)
+        fr = Odij * Orij * ptemp
+        grads = -(fr[:,:,:,np.newaxis] * dr).sum(2)
+        return energies, grads.reshape(coords2d.shape)
+
+
+import unittest
+class TestSoftSphereMultiple(unittest.TestCase):
+    def test_multiple(self):
+        natoms = 16
+        np.random.seed(0)
+        diams = np.random.uniform(0.3, 0.5, natoms)
+        pot = SoftSphere(diams)
+        coords2d = np.random.uniform(-1, 1, [3, 3*natoms])
+        e, g = pot.getEnergyGradientMultiple(coords2d)
+        for i in range(3):
+            e1, g1 = pot.getEnergyGradient(coords2d[i])
+            self.assertGreater(e1, 0.)
+            self.assertAlmostEqual(1., e[i] / e1, 10)
+            self.assertLess(np.max(np.abs(g[i] - g1)) / np.max(np.abs(g1)), 1e-10)
+
 
         
         
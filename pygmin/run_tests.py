@@ -1,14 +1,33 @@
 import unittest
 
+from pygmin.basinhopping_parallel import TestParallelBasinHopping
+from pygmin.basinhopping_multiwalker import TestMultiWalkerBasinHopping
 from pygmin.mindist.aamindist import aaDistTest
 from pygmin.mindist.minpermdist_stochastic import TestMinPermDistStochastic_BLJ
 from pygmin.mindist.minpermdist_rbmol import TestMinPermDistRBMol_OTP
 from pygmin.mindist.permutational_alignment import TestMinDistUtils
+from pygmin.mindist.lower_bound import TestRadialDistanceBound
 from pygmin.potentials.ATLJ import TestATLJ
 from pygmin.potentials.lj import LJTest
 from pygmin.potentials.ljcut import LJCutTest
+from pygmin.potentials._lj_numpy import TestLJNumpy, TestLJNumpyReference
+from pygmin.potentials.ljpshiftfast import TestLJpshiftMultiple
+from pygmin.potentials.soft_sphere import TestSoftSphereMultiple
+from pygmin.potentials.caching_potential import TestCachingPotential
+from pygmin.utils.neighbor_list import TestNeighborListCells, TestMarkovStateNeighborLists, TestNeighborListPotentialMulti
+from pygmin.utils.benchmark import TestQuenchBenchmarkSuite
+from pygmin.optimize._lbfgs_fast import TestLBFGSFast
+from pygmin.optimize._lbfgs_batch import TestLBFGSBatch
+from pygmin.storage.database import TestDatabaseEnergyCache, TestArrayType, TestDatabaseBatch, TestBulkRead, TestDatabaseCoordsStore
+from pygmin.storage.coords_store import TestCoordsStore
+from pygmin.storage.database_server import TestDatabaseServer
+from pygmin.storage.pathsample_import import TestImportPathsample
 from pygmin.landscape._graph import TestGraph
-from pygmin.landscape._distance_graph import TestDistanceGraph
+from pygmin.landscape._distance_graph import TestDistanceGraph, TestDistanceStore, TestDistanceGraphParallel, TestDistanceGraphBound
+from pygmin.landscape.connect_min_parallel import TestDoubleEndedConnectPar
 from pygmin.transition_states._orthogopt import TestOrthogopt
+from pygmin.transition_states._NEB import TestNEBForces
+from pygmin.transition_states.find_lowest_eig import TestFindLowestEigenVectorHessian
+from pygmin.transition_states._NEB_parallel import TestPotentialPool
 
 unittest.main()
\ No newline at end of file
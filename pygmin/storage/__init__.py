@@ -132,6 +132,13 @@ To connect to a database::
 Database will load data from "mydatabase.sqlite" if it already exists, or create a new 
 database with that name if it doesn't.
 
+For analysis of large databases it is much faster to read the data as numpy
+arrays than as Minimum and TransitionState objects::
+
+    >>> ids, energies = db.minima_arrays()
+    >>> ids, energies, coords = db.minima_arrays(with_coords=True)
+    >>> ts_ids, ts_energies, pairs = db.transition_state_arrays()
+
 .. note::
 
     basinhopping doesn't accept a database as a parameter, instead you should pass
@@ -141,9 +148,84 @@ database with that name if it doesn't.
         >>> minima_adder = database.minimum_adder()
         >>> bh = BasinHopping(coords, potential, takestep, storage=minima_adder)
 
+
+Many processes
+--------------
+.. autosummary::
+   :toctree: generated/
+
+    DatabaseServer
+    DatabaseClient
+
+Many processes, e.g. basin hopping or connect workers, can use the same 
+database file.  A DatabaseServer process does all the writing and checks 
+new minima and transition states for duplicates, the workers read directly
+from the file::
+
+    >>> server = DatabaseServer("landscape.sqlite")
+    >>> server.start()
+    >>> client = server.client() #  used like a Database, can be passed to other processes
+    >>> ...
+    >>> server.stop()
+
+Coordinates store
+-----------------
+.. autosummary::
+   :toctree: generated/
+
+    CoordsStore
+
+For very large landscapes the coordinates of the minima can be kept in a
+memory mapped file next to the database, with one row per minimum id::
+
+    >>> db = Database(db="landscape.sqlite", coords_store="landscape.coords")
+
+minimum.coords is then a slice of the file rather than an sql query, and
+several processes can read the coordinates at the same time without loading
+them into memory.
+
+Importing from PATHSAMPLE
+-------------------------
+.. autosummary::
+   :toctree: generated/
+
+    import_pathsample
+
+The minima and transition states of an OPTIM / PATHSAMPLE database (min.data,
+ts.data, points.min and points.ts) can be imported with::
+
+    >>> db = Database(db="mydatabase.sqlite")
+    >>> import_pathsample(db)
+
+This uses bulk inserts and memory maps the coordinate files, so it also 
+works for databases with millions of minima.
+
+Array storage
+-------------
+.. autosummary::
+   :toctree: generated/
+
+    ArrayType
+    set_array_storage
+    convert_array_storage
+
+The coordinates and eigenvectors are stored as raw bytes by the column type
+ArrayType.  By default they are stored in double precision without
+compression.  Single precision and zlib compression make the database smaller::
+
+    >>> set_array_storage(dtype=np.float32, compress=True) #  for all new arrays
+
+Databases written by older versions, which pickled the arrays, can no longer
+be read directly.  Unpickling can execute arbitrary code, so they must first be
+converted with ``scripts/migrate_database.py --allow-pickle`` (or
+convert_array_storage(..., allow_pickle=True)), which rewrites all the arrays
+in the current format.  Only convert databases from a trusted source.
 """
 
 
 
 
-from database import *
\ No newline at end of file
+from database import *
+from pathsample_import import *
+from coords_store import *
+from database_server import *
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""a file of coordinates indexed by the id of the minimum"""
+import os
+
+import numpy as np
+
+__all__ = ["CoordsStore"]
+
+
+class CoordsStore(object):
+    """store coordinates in a memory mapped file with one row per id
+
+    Row i of the file holds the coordinates with id i, so reading the
+    coordinates of a minimum is a slice of the memory map.  Nothing is
+    unpickled and nothing is copied.  Rows which have not been written are
+    nan.  The first row is a header which holds the number of degrees of
+    freedom (ids start at 1).
+
+    Parameters
+    ----------
+    fname : str
+        the file.  It is created if it doesn't exist.
+    ndof : int, optional
+        the length of a row.  It is read from the file if the file exists,
+        and otherwise taken from the first coordinates written.
+    readonly : bool
+        open the file read only.  Any number of processes can read the same
+        file, also while one process writes to it.
+
+    Notes
+    -----
+    The arrays returned are read only views into the file.  Copy them if
+    you want to change them.  Minimum.coords returns a copy.
+
+    Examples
+    --------
+    >>> db = Database(db="landscape.sqlite", coords_store="landscape.coords")
+
+    See Also
+    --------
+    Database
+    """
+    def __init__(self, fname, ndof=None, readonly=False):
+        self.fname = fname
+        self.readonly = readonly
+        self.ndof = None
+        self.nrows = 0
+        self.data = None
+        if os.path.isfile(fname) and os.path.getsize(fname) > 0:
+            header = np.fromfile(fname, dtype=np.float64, count=1)
+            self.ndof = int(header[0])
+            if ndof is not None and ndof != self.ndof:
+                raise ValueError("%s stores arrays of length %d, not %d" % (fname, self.ndof, ndof))
+            self._map()
+        elif ndof is not None:
+            self._create(ndof)
+
+    def _create(self, ndof):
+        if self.readonly:
+            raise IOError("can't create %s, it is opened read only" % self.fname)
+        self.ndof = int(ndof)
+        header = np.zeros(self.ndof)
+        header[:] = np.nan
+        header[0] = self.ndof
+        header.tofile(self.fname)
+        self._map()
+
+    def _map(self):
+        """memory map the whole file"""
+        nrows = os.path.getsize(self.fname) // (8 * self.ndof)
+        if nrows == self.nrows:
+            return
+        mode = "r" if self.readonly else "r+"
+        self.data = np.memmap(self.fname, dtype=np.float64, mode=mode,
+                              shape=(nrows, self.ndof))
+        self.nrows = nrows
+
+    def _grow(self, nrows):
+        """extend the file to at least nrows rows"""
+        nrows = max(nrows, 2 * self.nrows)
+        if self.data is not None:
+            self.data.flush()
+        self.data = None
+        new = np.zeros((nrows - self.nrows, self.ndof))
+        new[:] = np.nan
+        with open(self.fname, "ab") as fout:
+            new.tofile(fout)
+        self.nrows = 0
+        self._map()
+
+    def __len__(self):
+        """the number of rows, including the ones not written"""
+        return max(self.nrows - 1, 0)
+
+    def __contains__(self, id_):
+        return self.get(id_) is not None
+
+    def get(self, id_):
+        """return the coordinates with id id_ or None if they are not stored"""
+        if self.ndof is None:
+            return None
+        if id_ >= self.nrows:
+            # another process may have extended the file
+            self._map()
+            if id_ >= self.nrows:
+                return None
+        x = self.data[id_]
+        if np.isnan(x[0]):
+            return None
+        x = x.view(np.ndarray)
+        x.flags.writeable = False
+        return x
+
+    def __getitem__(self, id_):
+        x = self.get(id_)
+        if x is None:
+            raise KeyError(id_)
+        return x
+
+    def __setitem__(self, id_, coords):
+        self.set_block(id_, np.reshape(coords, [1, -1]))
+
+    def set_block(self, id_, coords):
+        """write the rows of the 2d array coords to the ids id_, id_+1, ..."""
+        if id_ < 1:
+            raise KeyError(id_)
+        coords = np.asarray(coords)
+        if self.ndof is None:
+            self._create(coords.shape[1])
+        if coords.shape[1] != self.ndof:
+            raise ValueError("the coordinates must have length %d" % self.ndof)
+        if id_ + len(coords) > self.nrows:
+            self._grow(id_ + len(coords))
+        self.data[id_:id_+len(coords)] = coords
+
+    def get_many(self, ids):
+        """return the coordinates for the ids as a 2d array.
+
+        This is a copy.  Rows which are not stored are nan
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        coords = np.zeros([len(ids), self.ndof or 0])
+        coords[:] = np.nan
+        if self.ndof is None or len(ids) == 0:
+            return coords
+        if ids.max() >= self.nrows:
+            self._map()
+        inside = ids < self.nrows
+        coords[inside] = self.data[ids[inside]]
+        return coords
+
+    def remove(self, id_):
+        """forget the coordinates with id id_"""
+        if self.ndof is not None and id_ < self.nrows:
+            self.data[id_] = np.nan
+
+    def flush(self):
+        """write the changes to disk"""
+        if self.data is not None and not self.readonly:
+            self.data.flush()
+
+
+import unittest
+class TestCoordsStore(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, "test.coords")
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def test_store(self):
+        store = CoordsStore(self.fname)
+        coords = np.random.random((20, 6))
+        for i in range(1, 20):
+            store[i] = coords[i]
+        self.assertEqual(store.ndof, 6)
+        self.assertTrue(np.all(store[5] == coords[5]))
+        self.assertRaises(ValueError, store[5].__setitem__, 0, 1.)
+        store.remove(5)
+        self.assertNotIn(5, store)
+        self.assertIs(store.get(100), None)
+
+        store.flush()
+        reader = CoordsStore(self.fname, readonly=True)
+        self.assertTrue(np.all(reader[19] == coords[19]))
+        # the reader sees rows added after it was opened
+        store.set_block(30, coords[:3])
+        store.flush()
+        self.assertTrue(np.all(reader[32] == coords[2]))
+        x = reader.get_many([1, 5, 31, 1000])
+        self.assertTrue(np.all(x[0] == coords[1]))
+        self.assertTrue(np.all(x[2] == coords[1]))
+        self.assertTrue(np.all(np.isnan(x[[1,3]])))
@@ -4,8 +4,17 @@ import sqlalchemy
 from sqlalchemy import create_engine, and_, or_
 from sqlalchemy.orm import sessionmaker
 import threading
+import bisect
+import time
+import atexit
+import weakref
+from contextlib import contextmanager
+import struct
+import zlib
+import cPickle
 import numpy as np
-from sqlalchemy import Column, Integer, Float, PickleType
+from sqlalchemy import Column, Integer, Float, LargeBinary
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import relationship, backref, deferred
 import sqlalchemy.orm
@@ -13,10 +22,142 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import select, bindparam, case, insert
 from sqlalchemy.schema import Index
 
-__all__ = ["Minimum", "TransitionState", "Database", "Distance"]
+__all__ = ["Minimum", "TransitionState", "Database", "Distance", "ArrayType",
+           "set_array_storage", "convert_array_storage"]
 
 verbose=False
 
+#########################################################################
+# storage of numpy arrays
+#########################################################################
+
+# every array stored by ArrayType starts with this.  Pickles never start with
+# a zero byte, so blobs written by older versions (PickleType) can still be 
+# recognized and converted
+_ARRAY_MAGIC = "\x00PGA"
+_ARRAY_FORMATS = {"d" : (np.float64, False),
+                  "f" : (np.float32, False),
+                  "D" : (np.float64, True),
+                  "F" : (np.float32, True),
+                  }
+_ARRAY_CODES = dict([((np.dtype(dtype), compress), code) 
+                     for code, (dtype, compress) in _ARRAY_FORMATS.iteritems()])
+
+def _encode_array(value, dtype=np.float64, compress=False):
+    """return the blob which stores the array value"""
+    if value is None:
+        return None
+    arr = np.asarray(value)
+    if arr.dtype == object and arr.ndim == 0 and arr.item() is None:
+        # np.copy(None) gives a 0-d object array.  
+        return None
+    if arr.dtype.kind not in "biuf":
+        raise TypeError("ArrayType can only store numeric arrays, not %s" % arr.dtype)
+    dtype = np.dtype(dtype)
+    code = _ARRAY_CODES[(dtype, bool(compress))]
+    data = np.ascontiguousarray(arr, dtype=dtype).tostring()
+    if compress:
+        data = zlib.compress(data)
+    header = _ARRAY_MAGIC + code + struct.pack("<B%dq" % arr.ndim, arr.ndim, *arr.shape)
+    return header + data
+
+def _decode_array(data, allow_pickle=False):
+    """return the array stored in the blob data
+    
+    Float32 arrays are returned as float64.  Blobs which were written by
+    PickleType are only unpickled if allow_pickle is True, because 
+    unpickling a blob from an untrusted file can execute arbitrary code.
+    """
+    if data is None:
+        return None
+    data = str(data)
+    if not data.startswith(_ARRAY_MAGIC):
+        if not allow_pickle:
+            raise ValueError("the array was stored by an older version of pygmin.  "
+                             "Convert the database with scripts/migrate_database.py --allow-pickle")
+        return cPickle.loads(data)
+    n = len(_ARRAY_MAGIC)
+    dtype, compress = _ARRAY_FORMATS[data[n]]
+    ndim = ord(data[n+1])
+    shape = struct.unpack_from("<%dq" % ndim, data, n+2)
+    offset = n + 2 + 8 * ndim
+    if compress:
+        arr = np.frombuffer(zlib.decompress(data[offset:]), dtype=dtype)
+    else:
+        arr = np.frombuffer(data, dtype=dtype, offset=offset)
+    # astype makes a writable copy
+    return arr.astype(np.float64).reshape(shape)
+
+# the format used by ArrayType columns which don't set their own.  Change it
+# with set_array_storage()
+_array_storage = {"dtype" : np.dtype(np.float64), "compress" : False}
+
+def _check_array_format(dtype, compress):
+    if (np.dtype(dtype), bool(compress)) not in _ARRAY_CODES:
+        raise ValueError("arrays can only be stored as float64 or float32")
+
+class ArrayType(TypeDecorator):
+    """sqlalchemy column type which stores a numpy array as raw bytes
+    
+    PickleType spends most of its time in the pickle machinery and stores a
+    lot of overhead.  This type stores a short header with the format and
+    shape followed by the raw array data, and reads it back with
+    np.frombuffer.
+    
+    Parameters
+    ----------
+    dtype : np.float64 or np.float32, optional
+        the precision the array is stored with.  Arrays are always returned
+        as float64.  float32 halves the size of the database but keeps only
+        about 7 significant digits.
+    compress : bool, optional
+        compress the data with zlib.  This saves little for random
+        coordinates but a lot for e.g. lattice systems.
+    
+    If dtype or compress are None, the format set with set_array_storage()
+    is used. The default is uncompressed float64.
+        
+    Notes
+    -----
+    The format is stored with each array, so arrays written with different
+    settings can all be read.  Arrays pickled by older versions of the 
+    database can not be read, they have to be rewritten with 
+    convert_array_storage() first.
+    """
+    impl = LargeBinary
+    hashable = False
+    
+    def __init__(self, dtype=None, compress=None):
+        TypeDecorator.__init__(self)
+        if dtype is not None:
+            _check_array_format(dtype, bool(compress))
+            dtype = np.dtype(dtype)
+        self.dtype = dtype
+        self.compress = compress
+    
+    def process_bind_param(self, value, dialect):
+        dtype = self.dtype
+        if dtype is None:
+            dtype = _array_storage["dtype"]
+        compress = self.compress
+        if compress is None:
+            compress = _array_storage["compress"]
+        return _encode_array(value, dtype, compress)
+    
+    def process_result_value(self, value, dialect):
+        return _decode_array(value)
+    
+    def copy_value(self, value):
+        if value is None:
+            return None
+        return np.copy(value)
+    
+    def compare_values(self, x, y):
+        if x is None or y is None:
+            return x is y
+        return np.array_equal(x, y)
+
+
 Base = declarative_base()
 
 class Minimum(Base):
@@ -49,12 +190,29 @@ class Minimum(Base):
     _id = Column(Integer, primary_key=True)
     energy = Column(Float) 
     # deferred means the object is loaded on demand, that saves some time / memory for huge graphs
-    coords = deferred(Column(PickleType))
-    '''coordinates'''
+    _coords = deferred(Column("coords", ArrayType()))
     
     def __init__(self, energy, coords):
         self.energy = energy
         self.coords = np.copy(coords)
+    
+    def _get_coords(self):
+        if self._id is not None:
+            session = sqlalchemy.orm.object_session(self)
+            if session is not None:
+                store = session.info.get("coords_store")
+                if store is not None:
+                    coords = store.get(self._id)
+                    if coords is not None:
+                        # a copy, because e.g. CoMToOrigin changes its input
+                        return np.array(coords)
+        return self._coords
+    
+    def _set_coords(self, coords):
+        self._coords = coords
+    
+    coords = property(_get_coords, _set_coords)
+    '''coordinates.  If the database has a CoordsStore they are read from there'''
  
     def right_neighbors(self):
         return [x.higher_node for x in self.left_edges]
@@ -72,8 +230,10 @@ class Minimum(Base):
             return self._id == m
         
     def __hash__(self):
-        assert self._id is not None
-        return self._id
+        # called for every dict lookup of a graph node, so read _id only once
+        _id = self._id
+        assert _id is not None
+        return _id
          
 #    transition_states = relationship("transition_states", order_by="transition_states.id", backref="minima")
     
@@ -123,7 +283,7 @@ class TransitionState(Base):
     energy = Column(Float)
     '''energy of transition state'''
     
-    coords = deferred(Column(PickleType))
+    coords = deferred(Column(ArrayType()))
     '''coordinates of transition state'''
     
     _minimum1_id = Column(Integer, ForeignKey('tbl_minima._id'))
@@ -141,7 +301,7 @@ class TransitionState(Base):
     eigenval = Column(Float)
     '''coordinates of transition state'''
 
-    eigenvec = deferred(Column(PickleType))
+    eigenvec = deferred(Column(ArrayType()))
     '''coordinates of transition state'''
     
     
@@ -223,9 +383,145 @@ class Distance(Base):
         self.minimum1 = min1
         self.minimum2 = min2
 
+Index('idx_minima_energy', Minimum.__table__.c.energy)
 Index('idx_transition_states', TransitionState.__table__.c._minimum1_id, TransitionState.__table__.c._minimum2_id)
 Index('idx_distances', Distance.__table__.c._minimum1_id, Distance.__table__.c._minimum2_id, unique=True)
 
+def _array_columns():
+    """return (table, column) for all the columns which store arrays"""
+    return [(table, column) for table in Base.metadata.sorted_tables
+            for column in table.columns if isinstance(column.type, ArrayType)]
+
+def set_array_storage(dtype=np.float64, compress=False):
+    """set the format in which coordinates and eigenvectors are written
+    
+    This applies to all databases opened in this process.  Arrays which are 
+    already stored are not changed, see convert_array_storage().
+
+    Parameters
+    ----------
+    dtype : np.float64 or np.float32
+    compress : bool
+        see ArrayType
+    """
+    _check_array_format(dtype, compress)
+    _array_storage["dtype"] = np.dtype(dtype)
+    _array_storage["compress"] = bool(compress)
+
+def convert_array_storage(database, dtype=np.float64, compress=False,
+                          vacuum=True, chunksize=1000, allow_pickle=False):
+    """rewrite all stored coordinates and eigenvectors in a new format
+    
+    This is the migration path for databases written by older versions, 
+    which stored the arrays with PickleType, and for changing between
+    the ArrayType formats.  The new format is also used for all arrays
+    written afterwards, see set_array_storage().
+    
+    Parameters
+    ----------
+    database : Database
+    dtype, compress :
+        the new format, see ArrayType
+    vacuum : bool
+        for sqlite databases, run VACUUM afterwards so that the file 
+        actually shrinks
+    chunksize : int
+        the number of rows read and written at a time
+    allow_pickle : bool
+        convert the arrays which were pickled by older versions.  Only use
+        this for files you trust, unpickling can execute arbitrary code.
+        Otherwise such arrays raise a ValueError.
+    
+    Returns
+    -------
+    n : int
+        the number of arrays converted
+    """
+    set_array_storage(dtype, compress)
+    database.commit()
+    conn = database.connection
+    n = 0
+    trans = conn.begin()
+    for table, column in _array_columns():
+        # read the raw blobs, not the decoded arrays
+        raw = sqlalchemy.type_coerce(column, LargeBinary)
+        update = table.update().where(table.c._id == bindparam("b_id"))
+        update = update.values({column.name : bindparam("b_data", type_=LargeBinary)})
+        ids = [row[0] for row in conn.execute(select([table.c._id]).order_by(table.c._id))]
+        for i in xrange(0, len(ids), chunksize):
+            chunk = ids[i:i+chunksize]
+            rows = conn.execute(select([table.c._id, raw]).where(table.c._id.in_(chunk))).fetchall()
+            values = [dict(b_id=id_, b_data=column.type.process_bind_param(_decode_array(data, allow_pickle), None))
+                      for id_, data in rows if data is not None]
+            if len(values) > 0:
+                conn.execute(update, values)
+            n += len(values)
+    trans.commit()
+    # the arrays held by the session may have been written with lower precision
+    database.session.expire_all()
+    if vacuum and database.engine.dialect.name == "sqlite" and database.engine.url.database not in (None, "", ":memory:"):
+        conn.execute("VACUUM")
+    return n
+
+
+
+class _EnergyCache(object):
+    """the energies and ids of all minima sorted by energy
+    
+    This mirrors tbl_minima so that the minima with energies close to a
+    given energy can be found by bisection without an sql query.  maxid is
+    the largest id in the cache, which is used to find the minima added by 
+    other connections.
+    """
+    def __init__(self, rows):
+        rows = sorted(rows)
+        self.energies = [e for e, i in rows]
+        self.ids = [i for e, i in rows]
+        self.maxid = max(self.ids) if self.ids else 0
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def add(self, energy, id_):
+        self.maxid = max(self.maxid, id_)
+        i = bisect.bisect_right(self.energies, energy)
+        self.energies.insert(i, energy)
+        self.ids.insert(i, id_)
+    
+    def remove(self, energy, id_):
+        i = bisect.bisect_left(self.energies, energy)
+        while i < len(self.ids) and self.energies[i] == energy:
+            if self.ids[i] == id_:
+                del self.energies[i]
+                del self.ids[i]
+                return
+            i += 1
+    
+    def candidates(self, energy, accuracy):
+        """return the ids of the minima with energy within accuracy"""
+        i = bisect.bisect_right(self.energies, energy - accuracy)
+        j = bisect.bisect_left(self.energies, energy + accuracy, lo=i)
+        return self.ids[i:j]
+
+
+def _columns(rows, ncols):
+    """transpose the rows of an sql query into columns"""
+    if len(rows) == 0:
+        return [()] * ncols
+    return zip(*rows)
+
+# the databases which have held back a commit because of batch_size or 
+# flush_interval.  They are committed when the program exits
+_databases_pending = weakref.WeakSet()
+
+def _commit_at_exit():
+    """commit the objects held back by Database.batch_size"""
+    for db in list(_databases_pending):
+        if db._npending > 0:
+            db.commit()
+
+atexit.register(_commit_at_exit)
+
 
 class Database(object):
     '''Database storage class
@@ -255,6 +551,28 @@ class Database(object):
         called when a new, unique, minimum is added to the database
     onMinimumRemoved : callable, `onMinimumRemoved(minimum)`, optional
         called when a minimum is removed from the database 
+    energy_cache : bool, optional
+        keep a sorted list of the energies of all minima in memory, so 
+        addMinimum can find the minima with similar energy without an sql 
+        query.  Minima added by other processes are picked up by checking 
+        the largest id in the database before each lookup.  Call
+        invalidate_energy_cache() after changing tbl_minima directly.
+    batch_size : int, optional
+        addMinimum and addTransitionState commit only every batch_size new
+        objects.  Committing a sqlite file waits for the data to be written
+        to disk, which for cheap potentials can take longer than the basin
+        hopping step.  The objects not yet committed are visible to this 
+        Database, but not to other processes, and are lost if the program 
+        crashes.  They are committed when the program exits normally.
+    flush_interval : float, optional
+        if given, also commit if more than flush_interval seconds have passed
+        since the last commit.
+    coords_store : string or CoordsStore, optional
+        keep the coordinates of new minima in a memory mapped file instead of
+        the sql database.  Reading them is then much faster, and other 
+        processes can read them without loading the landscape into memory.
+        Minima which are already in the database keep their coordinates in 
+        sql.
 
 
     Attributes
@@ -278,6 +596,12 @@ class Database(object):
     >>> for minimum in database.minima():
     >>>     print minimum.energy
     
+    to group many additions into one transaction
+    
+    >>> with db.batch():
+    >>>     for energy in np.random.random(1000):
+    >>>         db.addMinimum(energy, np.random.random(10))
+    
     See Also
     --------
     Minimum
@@ -295,20 +619,117 @@ class Database(object):
     compareMinima=None
     
     def __init__(self, db=":memory:", accuracy=1e-3, connect_string='sqlite:///%s',\
-                 onMinimumAdded=None, onMinimumRemoved=None, compareMinima=None):
+                 onMinimumAdded=None, onMinimumRemoved=None, compareMinima=None,
+                 energy_cache=True, batch_size=1, flush_interval=None,
+                 coords_store=None):
         self.engine = create_engine(connect_string%(db), echo=verbose)
         Base.metadata.create_all(self.engine)
+        self._create_missing_indices()
         Session = sessionmaker(bind=self.engine)
         self.session = Session()
+        if isinstance(coords_store, basestring):
+            from pygmin.storage.coords_store import CoordsStore
+            coords_store = CoordsStore(coords_store)
+        self.coords_store = coords_store
+        # Minimum.coords finds the store through the session
+        self.session.info["coords_store"] = coords_store
         self.accuracy=accuracy
         self.onMinimumAdded=onMinimumAdded
         self.onMinimumRemoved=onMinimumRemoved
         self.compareMinima=compareMinima
         self.lock = threading.Lock()
         self.connection = self.engine.connect()
+        self.use_energy_cache = energy_cache
+        self._energy_cache = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._npending = 0
+        self._last_commit = time.time()
         
         self._initialize_queries()
+    
+    def _create_missing_indices(self):
+        """create_all does not add new indices to existing tables.  Add them
+        here so that databases created by older versions get them too"""
+        inspector = sqlalchemy.inspect(self.engine)
+        for table in Base.metadata.sorted_tables:
+            existing = set([idx["name"] for idx in inspector.get_indexes(table.name)])
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(self.engine)
+    
+    def _get_energy_cache(self):
+        """return the energy cache, building it on the first call
         
+        The minima which were added by other connections since the last call
+        are added to the cache.  Minima removed by other connections stay in
+        the cache, so the callers must check that the ids still exist.
+        """
+        tbl = Minimum.__table__.c
+        if self._energy_cache is None:
+            rows = self.session.execute(select([tbl.energy, tbl._id]))
+            self._energy_cache = _EnergyCache([(e, i) for e, i in rows])
+            return self._energy_cache
+        cache = self._energy_cache
+        maxid = self.session.execute(select([sqlalchemy.func.max(tbl._id)])).scalar()
+        if maxid is not None and maxid > cache.maxid:
+            rows = self.session.execute(select([tbl.energy, tbl._id], 
+                                               tbl._id > cache.maxid))
+            for e, i in rows:
+                cache.add(e, i)
+        return cache
+    
+    def invalidate_energy_cache(self):
+        """rebuild the energy cache before it is used next
+        
+        Call this after tbl_minima was changed without going through 
+        addMinimum, removeMinimum or mergeMinima, e.g. after a rollback or 
+        a bulk insert.
+        """
+        self._energy_cache = None
+    
+    def _energy_cache_remove(self, m):
+        if self._energy_cache is not None:
+            self._energy_cache.remove(m.energy, m._id)
+        
+    def commit(self):
+        """commit all changes, including those held back by batch_size"""
+        self.session.commit()
+        if self.coords_store is not None:
+            self.coords_store.flush()
+        self._npending = 0
+        self._last_commit = time.time()
+    
+    def _commit_batched(self):
+        """commit a new object, or only flush it if the batch is not full"""
+        self._npending += 1
+        if self._npending >= self.batch_size:
+            self.commit()
+        elif (self.flush_interval is not None and 
+              time.time() - self._last_commit >= self.flush_interval):
+            self.commit()
+        else:
+            # the new object gets an id and is seen by the queries in addMinimum
+            self.session.flush()
+            _databases_pending.add(self)
+    
+    @contextmanager
+    def batch(self, batch_size=1000, flush_interval=None):
+        """context manager which groups the commits of addMinimum and 
+        addTransitionState
+        
+        Within the block the database behaves as if it had been created with
+        these values of batch_size and flush_interval.  All changes are 
+        committed at the end of the block.
+        """
+        old = self.batch_size, self.flush_interval
+        self.batch_size, self.flush_interval = batch_size, flush_interval
+        try:
+            yield self
+        finally:
+            self.batch_size, self.flush_interval = old
+            self.commit()
+    
     def _initialize_queries(self):
         #        self._sql_get_dist = select([Distance.__table__.c.dist],
         #               or_(and_(Distance.__table__.c._minimum1_id==bindparam("id1"), 
@@ -347,9 +768,18 @@ class Database(object):
             
         """
         self.lock.acquire()
-        candidates = self.session.query(Minimum).\
-            filter(Minimum.energy > E-self.accuracy).\
-            filter(Minimum.energy < E+self.accuracy)
+        if self.use_energy_cache:
+            cache = self._get_energy_cache()
+            query = self.session.query(Minimum)
+            candidates = (query.get(mid) for mid in cache.candidates(E, self.accuracy))
+            # skip minima removed by another connection, or whose id was 
+            # reused for a different minimum
+            candidates = (m for m in candidates 
+                          if m is not None and abs(m.energy - E) < self.accuracy)
+        else:
+            candidates = self.session.query(Minimum).\
+                filter(Minimum.energy > E-self.accuracy).\
+                filter(Minimum.energy < E+self.accuracy)
         
         new = Minimum(E, coords)
             
@@ -359,9 +789,23 @@ class Database(object):
                     continue
             self.lock.release() 
             return m
+        store = self.coords_store
+        if store is not None:
+            # the coordinates go into the store instead of sql
+            new.coords = None
         self.session.add(new)
+        if store is not None:
+            # write the coordinates before the minimum is committed, so a 
+            # committed minimum always has them
+            self.session.flush()
+            store[new._id] = coords
         if(commit):
-            self.session.commit()
+            self._commit_batched()
+        elif self.use_energy_cache:
+            #the id is needed for the energy cache
+            self.session.flush()
+        if self.use_energy_cache:
+            cache.add(new.energy, new._id)
         self.lock.release()
         if(self.onMinimumAdded):
             self.onMinimumAdded(new)
@@ -420,7 +864,7 @@ class Database(object):
             
         self.session.add(new)
         if(commit):
-            self.session.commit()
+            self._commit_batched()
         return new
 
     def getTransitionState(self, min1, min2):
@@ -453,6 +897,10 @@ class Database(object):
         id1 = max(min1._id, min2._id)
         id2 = min(min1._id, min2._id)
         
+        if self._npending > 0:
+            # sqlite can't write on self.connection while the session holds 
+            # uncommitted rows
+            self.commit()
         self.connection.execute(self._sql_set_dist, [{'id1':id1, 'id2':id2, 'dist':dist}])
         
         #res = self.connection.execute(self._sql_set_dist_upd, [{'id1':min1._id, 'id2':min2._id, 'dist':dist}])
@@ -472,6 +920,8 @@ class Database(object):
         submit = []
         for mins, dist in values:
             submit.append({'id1':min(mins[0]._id, mins[1]._id), 'id2':max(mins[0]._id, mins[1]._id), 'dist':dist})
+        if self._npending > 0:
+            self.commit()
         self.connection.execute(self._sql_set_dist, submit)
         
 #    def setDistanceMultiple(self, newdistances, commit=True):
@@ -567,11 +1017,126 @@ class Database(object):
         '''
         return self.session.query(TransitionState).all()
     
+    def _coords_matrix(self, column, ids):
+        """return the arrays in column for the rows ids as a 2d array"""
+        table = column.table
+        rows = self.session.execute(select([table.c._id, column]))
+        index = dict([(id_, i) for i, id_ in enumerate(ids)])
+        coords = None
+        for id_, x in rows:
+            i = index.get(id_)
+            if i is None or x is None:
+                continue
+            if coords is None:
+                coords = np.zeros([len(ids), x.size])
+                coords[:] = np.nan
+            coords[i,:] = x.ravel()
+        if coords is None:
+            coords = np.zeros([len(ids), 0])
+        return coords
+    
+    def minima_arrays(self, order_energy=True, with_coords=False):
+        '''return the ids and energies of all minima as numpy arrays
+        
+        This runs a single sql select and creates no Minimum objects, so it 
+        is much faster than minima() for large databases.
+        
+        Parameters
+        ----------
+        order_energy : bool
+            order the minima by energy
+        with_coords : bool
+            also return the coordinates
+            
+        Returns
+        -------
+        ids : int array
+        energies : float array
+        coords : 2d float array, only if with_coords is True
+            coords[i] are the coordinates of minimum ids[i]
+        '''
+        self.session.flush()
+        tbl = Minimum.__table__.c
+        query = select([tbl._id, tbl.energy])
+        if order_energy:
+            query = query.order_by(tbl.energy)
+        ids, energies = _columns(self.session.execute(query).fetchall(), 2)
+        ids = np.array(ids, dtype=np.int64)
+        energies = np.array(energies, dtype=np.float64)
+        if not with_coords:
+            return ids, energies
+        if self.coords_store is None:
+            return ids, energies, self._coords_matrix(tbl.coords, ids)
+        coords = self.coords_store.get_many(ids)
+        missing = np.where(np.isnan(coords[:,0]))[0]
+        if len(missing) > 0:
+            # the minima added before the store was used
+            sqlcoords = self._coords_matrix(tbl.coords, ids[missing])
+            if sqlcoords.shape[1] == coords.shape[1]:
+                coords[missing] = sqlcoords
+        return ids, energies, coords
+    
+    def transition_state_arrays(self, with_coords=False):
+        '''return the ids, energies and minima of all transition states as 
+        numpy arrays
+        
+        This runs a single sql select and creates no TransitionState objects.
+        
+        Parameters
+        ----------
+        with_coords : bool
+            also return the coordinates
+            
+        Returns
+        -------
+        ids : int array
+        energies : float array
+        pairs : int array, shape (nts, 2)
+            the ids of minimum1 and minimum2 of each transition state
+        coords : 2d float array, only if with_coords is True.
+            Rows of transition states without coordinates are nan
+        '''
+        self.session.flush()
+        tbl = TransitionState.__table__.c
+        query = select([tbl._id, tbl.energy, tbl._minimum1_id, tbl._minimum2_id])
+        ids, energies, id1, id2 = _columns(self.session.execute(query).fetchall(), 4)
+        ids = np.array(ids, dtype=np.int64)
+        energies = np.array(energies, dtype=np.float64)
+        pairs = np.zeros([len(ids), 2], dtype=np.int64)
+        pairs[:,0] = id1
+        pairs[:,1] = id2
+        if not with_coords:
+            return ids, energies, pairs
+        return ids, energies, pairs, self._coords_matrix(tbl.coords, ids)
+    
+    def distance_arrays(self):
+        '''return all distances as numpy arrays
+        
+        Returns
+        -------
+        pairs : int array, shape (n, 2)
+            the ids of the two minima.  They are not ordered.
+        dists : float array
+        '''
+        self.session.flush()
+        tbl = Distance.__table__.c
+        query = select([tbl._minimum1_id, tbl._minimum2_id, tbl.dist])
+        id1, id2, dists = _columns(self.session.execute(query).fetchall(), 3)
+        pairs = np.zeros([len(dists), 2], dtype=np.int64)
+        pairs[:,0] = id1
+        pairs[:,1] = id2
+        return pairs, np.array(dists, dtype=np.float64)
+    
+    def number_of_distances(self):
+        """return the number of distances in the database"""
+        return self.session.query(Distance).count()
+    
     def minimum_adder(self, Ecut=None):
         '''wrapper class to add minima
         
         Since pickle cannot handle pointer to member functions, this class wraps the call to
-        add minimum.
+        add minimum.  The minima are committed according to batch_size and 
+        flush_interval of the database.
         
         Parameters
         ----------
@@ -618,8 +1183,11 @@ class Database(object):
             self.session.delete(ts)
         
         #delete the minimum
+        self._energy_cache_remove(m)
+        if self.coords_store is not None:
+            self.coords_store.remove(m._id)
         self.session.delete(m)
-        self.session.commit()
+        self.commit()
 
     
     def mergeMinima(self, min1, min2):
@@ -660,8 +1228,263 @@ class Database(object):
         for d in candidates:
             self.session.delete(d)
         
+        self._energy_cache_remove(min2)
+        if self.coords_store is not None:
+            self.coords_store.remove(min2._id)
         self.session.delete(min2)
-        self.session.commit()
+        self.commit()
+
+
+import unittest
+class TestDatabaseEnergyCache(unittest.TestCase):
+    def setUp(self):
+        self.db = Database(accuracy=1e-2)
+        self.energies = np.random.uniform(-10, 0, 100)
+        for e in self.energies:
+            self.db.addMinimum(e, np.random.random(6))
+    
+    def test_same_as_sql(self):
+        db2 = Database(accuracy=1e-2, energy_cache=False)
+        for e in self.energies:
+            db2.addMinimum(e, np.random.random(6))
+        for e in np.random.uniform(-10, 0, 100):
+            m1 = self.db.addMinimum(e, np.random.random(6), commit=False)
+            m2 = db2.addMinimum(e, np.random.random(6), commit=False)
+            self.assertEqual(m1.energy == e, m2.energy == e)
+            self.assertLess(abs(m1.energy - e), 1e-2)
+        self.assertEqual(len(self.db.minima()), len(db2.minima()))
+    
+    def test_remove(self):
+        m = self.db.minima()[5]
+        self.db.removeMinimum(m)
+        m1, m2 = self.db.minima()[:2]
+        self.db.mergeMinima(m1, m2)
+        cache = self.db._get_energy_cache()
+        self.assertEqual(len(cache), len(self.db.minima()))
+        self.assertEqual(cache.ids, [mm._id for mm in self.db.minima()])
+    
+    def test_two_connections(self):
+        """minima added through another connection are found"""
+        import tempfile
+        import shutil
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = tmpdir + "/test.sqlite"
+            db1 = Database(fname)
+            db2 = Database(fname)
+            db1.addMinimum(0., np.random.random(6))
+            db2.addMinimum(1., np.random.random(6))
+            db1.addMinimum(1., np.random.random(6))
+            self.assertEqual(len(db1.minima()), 2)
+            # a minimum removed by the other connection is not returned
+            db2.removeMinimum(db2.minima()[0])
+            m = db1.addMinimum(0., np.random.random(6))
+            self.assertEqual(len(db1.minima()), 2)
+            self.assertEqual(len(Database(fname).minima()), 2)
+            db1.invalidate_energy_cache()
+            self.assertEqual(len(db1._get_energy_cache()), 2)
+        finally:
+            shutil.rmtree(tmpdir)
+    
+    def test_index(self):
+        indices = sqlalchemy.inspect(self.db.engine).get_indexes("tbl_minima")
+        self.assertIn("idx_minima_energy", [idx["name"] for idx in indices])
+
+class TestDatabaseBatch(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = self.tmpdir + "/test.sqlite"
+        self.db = Database(self.fname, batch_size=10)
+    
+    def tearDown(self):
+        import shutil
+        self.db.commit()
+        shutil.rmtree(self.tmpdir)
+    
+    def count_committed(self):
+        return len(Database(self.fname).minima())
+    
+    def test_batch_size(self):
+        minima = [self.db.addMinimum(float(i), np.random.random(6)) for i in range(5)]
+        self.assertEqual(self.count_committed(), 0)
+        # the uncommitted minima are still found
+        m = self.db.addMinimum(2., np.random.random(6))
+        self.assertEqual(m, minima[2])
+        # the transition state counts towards the batch
+        self.db.addTransitionState(1.5, np.random.random(6), minima[0], minima[1])
+        for i in range(5, 9):
+            self.db.addMinimum(float(i), np.random.random(6))
+        self.assertEqual(self.count_committed(), 9)
+    
+    def test_context(self):
+        with self.db.batch(batch_size=100):
+            for i in range(20):
+                self.db.addMinimum(float(i), np.random.random(6))
+            self.assertEqual(self.count_committed(), 0)
+        self.assertEqual(self.count_committed(), 20)
+        self.assertEqual(self.db.batch_size, 10)
+    
+    def test_flush_interval(self):
+        self.db.flush_interval = 0.
+        self.db.addMinimum(1., np.random.random(6))
+        self.assertEqual(self.count_committed(), 1)
+    
+    def test_at_exit(self):
+        db = Database()
+        db.addMinimum(1., np.random.random(6))
+        self.assertNotIn(db, _databases_pending)
+        self.db.addMinimum(1., np.random.random(6))
+        self.assertIn(self.db, _databases_pending)
+        _commit_at_exit()
+        self.assertEqual(self.count_committed(), 1)
+        # the set does not keep the databases alive
+        n = len(_databases_pending)
+        db = Database(batch_size=10)
+        db.addMinimum(1., np.random.random(6))
+        self.assertEqual(len(_databases_pending), n + 1)
+        del db
+        import gc
+        gc.collect()
+        self.assertEqual(len(_databases_pending), n)
+
+class TestBulkRead(unittest.TestCase):
+    def setUp(self):
+        self.db = Database()
+        for e in np.random.uniform(-1, 0, 20):
+            self.db.addMinimum(e, np.random.random(6))
+        minima = self.db.minima()
+        for i in range(10):
+            self.db.addTransitionState(float(i), np.random.random(6), minima[i], minima[i+5])
+        self.db.addTransitionState(10., None, minima[0], minima[1], commit=False)
+    
+    def test_minima(self):
+        minima = self.db.minima()
+        ids, energies, coords = self.db.minima_arrays(with_coords=True)
+        self.assertEqual(list(ids), [m._id for m in minima])
+        self.assertEqual(list(energies), [m.energy for m in minima])
+        for m, x in zip(minima, coords):
+            self.assertTrue(np.all(m.coords == x))
+        ids, energies = self.db.minima_arrays(order_energy=False)
+        self.assertEqual(len(ids), len(minima))
+    
+    def test_transition_states(self):
+        tslist = self.db.transition_states()
+        ids, energies, pairs, coords = self.db.transition_state_arrays(with_coords=True)
+        self.assertEqual(len(ids), 11)
+        for ts, id_, e, pair, x in zip(tslist, ids, energies, pairs, coords):
+            self.assertEqual(ts._id, id_)
+            self.assertEqual(ts.energy, e)
+            self.assertEqual(tuple(pair), (ts.minimum1._id, ts.minimum2._id))
+            if ts.coords is None:
+                self.assertTrue(np.all(np.isnan(x)))
+            else:
+                self.assertTrue(np.all(ts.coords == x))
+
+class TestDatabaseCoordsStore(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = self.tmpdir + "/test.sqlite"
+        self.db = Database(self.fname)
+        self.m0 = self.db.addMinimum(-1., np.random.random(6))
+        self.db = Database(self.fname, coords_store=self.tmpdir + "/test.coords")
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+    
+    def test_store(self):
+        coords = np.random.random((5,6))
+        minima = [self.db.addMinimum(float(i), x) for i, x in enumerate(coords)]
+        for m, x in zip(minima, coords):
+            self.assertTrue(np.all(m.coords == x))
+            self.assertIn(m._id, self.db.coords_store)
+        # only the minima which were added before are in sql
+        table = Minimum.__table__
+        nsql = self.db.connection.execute(select([sqlalchemy.func.count()]).
+                  where(table.c.coords != None)).scalar()
+        self.assertEqual(nsql, 1)
+        
+        ids, energies, allcoords = self.db.minima_arrays(with_coords=True)
+        self.assertTrue(np.all(allcoords[1:] == coords))
+        self.assertTrue(np.all(allcoords[0] == self.db.getMinimum(self.m0._id).coords))
+        
+        self.db.removeMinimum(minima[2])
+        self.assertNotIn(minima[2]._id, self.db.coords_store)
+        
+        db2 = Database(self.fname, coords_store=self.tmpdir + "/test.coords")
+        self.assertTrue(np.all(db2.getMinimum(minima[3]._id).coords == coords[3]))
+    
+    def test_store_before_commit(self):
+        """the coordinates are in the store when the minimum is committed"""
+        session = self.db.session
+        session_commit = session.commit
+        stored = []
+        def commit():
+            maxid = session.query(sqlalchemy.func.max(Minimum._id)).scalar()
+            stored.append(maxid in self.db.coords_store)
+            session_commit()
+        session.commit = commit
+        for i in range(3):
+            self.db.addMinimum(float(i), np.random.random(6))
+        self.assertEqual(stored, [True] * 3)
+
+class TestArrayType(unittest.TestCase):
+    def setUp(self):
+        self.db = Database()
+        self.coords = np.random.uniform(-1, 1, 30)
+    
+    def tearDown(self):
+        set_array_storage()
+    
+    def reload(self, m):
+        self.db.session.commit()
+        self.db.session.expire_all()
+        return self.db.session.query(Minimum).get(m._id).coords
+    
+    def test_roundtrip(self):
+        m1 = self.db.addMinimum(1., self.coords)
+        m2 = self.db.addMinimum(2., self.coords)
+        ts = self.db.addTransitionState(1.5, self.coords, m1, m2)
+        coords = self.reload(m1)
+        self.assertTrue(np.all(coords == self.coords))
+        coords[0] = 0. # must be writable
+        self.assertIs(ts.eigenvec, None)
+    
+    def test_formats(self):
+        for compress in [False, True]:
+            set_array_storage(np.float32, compress)
+            m = self.db.addMinimum(np.random.rand(), self.coords)
+            coords = self.reload(m)
+            self.assertEqual(coords.dtype, np.float64)
+            self.assertLess(np.abs(coords - self.coords).max(), 1e-6)
+        set_array_storage(np.float64, True)
+        m = self.db.addMinimum(-1., self.coords.reshape(-1,3))
+        coords = self.reload(m)
+        self.assertEqual(coords.shape, (10,3))
+        self.assertTrue(np.all(coords == self.coords.reshape(-1,3)))
+    
+    def test_convert_pickled(self):
+        # write the coordinates the way PickleType did
+        table = Minimum.__table__
+        blob = cPickle.dumps(self.coords, cPickle.HIGHEST_PROTOCOL)
+        self.db.connection.execute(table.insert().values(energy=1.,
+                                   coords=sqlalchemy.type_coerce(blob, LargeBinary)))
+        m = self.db.minima()[0]
+        # pickles are only read when converting with allow_pickle
+        self.assertRaises(ValueError, getattr, m, "coords")
+        self.assertRaises(ValueError, convert_array_storage, self.db, vacuum=False)
+        n = convert_array_storage(self.db, vacuum=False, allow_pickle=True)
+        self.assertEqual(n, 1)
+        raw = self.db.connection.execute(select([sqlalchemy.type_coerce(table.c.coords, LargeBinary)])).scalar()
+        self.assertTrue(str(raw).startswith(_ARRAY_MAGIC))
+        self.assertTrue(np.all(self.reload(m) == self.coords))
+    
+    def test_non_numeric(self):
+        self.assertRaises(TypeError, _encode_array, np.array(["a", "b"]))
+        self.assertRaises(TypeError, _encode_array, np.array([{}, None]))
+        self.assertIs(_encode_array(np.copy(None)), None)
 
 
 if __name__ == "__main__":    
@@ -0,0 +1,378 @@
+"""access to one database file from many processes"""
+import os
+import threading
+import Queue
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+from pygmin.storage.database import Database, TransitionState
+
+__all__ = ["DatabaseServer", "DatabaseClient"]
+
+
+def _enable_wal(db):
+    """switch a sqlite database to write ahead logging.
+
+    With WAL readers don't block the writer and the writer doesn't block
+    readers.  The setting is stored in the database file.
+    """
+    if db.engine.dialect.name == "sqlite":
+        db.connection.execute("PRAGMA journal_mode=WAL")
+
+def _handle_request(db, request):
+    """do one request in the writer process and return the reply"""
+    name = request[0]
+    if name == "addMinimum":
+        E, coords = request[1:]
+        return db.addMinimum(E, coords, commit=False)._id
+    elif name == "addTransitionState":
+        E, coords, id1, id2, eigenval, eigenvec = request[1:]
+        ts = db.addTransitionState(E, coords, db.getMinimum(id1), db.getMinimum(id2),
+                                   commit=False, eigenval=eigenval, eigenvec=eigenvec)
+        db.session.flush()
+        return ts._id
+    elif name == "setDistanceBulk":
+        values = [{'id1':min(id1, id2), 'id2':max(id1, id2), 'dist':dist}
+                  for id1, id2, dist in request[1]]
+        if len(values) > 0:
+            # on the session, self.connection can't write while it holds a transaction
+            db.session.execute(db._sql_set_dist, values)
+        return None
+    else:
+        raise ValueError("unknown database request " + str(name))
+
+def _serve(dbfile, db_kwargs, authkey, pipe):
+    """the main loop of the writer process
+
+    A thread per client receives the requests and puts them in a queue.
+    The main thread does all the requests waiting in the queue, commits
+    them in one transaction and only then sends the replies.  So a client
+    can read what it wrote as soon as it has the reply.  If a reply can't
+    be sent, e.g. because the client process was killed, that connection
+    is dropped and the server carries on with the others.
+    """
+    db = Database(dbfile, **db_kwargs)
+    _enable_wal(db)
+    requests = Queue.Queue()
+    listener = Listener(family="AF_UNIX", authkey=authkey)
+
+    def receive(conn):
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, IOError):
+                return
+            requests.put((conn, request))
+
+    def accept():
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception:
+                return
+            t = threading.Thread(target=receive, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    t = threading.Thread(target=accept)
+    t.daemon = True
+    t.start()
+    pipe.send(listener.address)
+
+    dead = set()
+    stop = False
+    while not stop:
+        batch = [requests.get()]
+        while True:
+            try:
+                batch.append(requests.get_nowait())
+            except Queue.Empty:
+                break
+        replies = []
+        for conn, request in batch:
+            if request[0] == "stop":
+                stop = True
+                replies.append((conn, None))
+                continue
+            try:
+                replies.append((conn, _handle_request(db, request)))
+            except Exception, e:
+                # the requests of this batch that were not committed are lost
+                db.session.rollback()
+                db.invalidate_energy_cache()
+                lost = RuntimeError("database transaction rolled back because of an error in another request")
+                replies = [(c, lost) for c, r in replies] + [(conn, e)]
+        db.commit()
+        for conn, reply in replies:
+            if conn in dead:
+                continue
+            try:
+                conn.send(reply)
+            except (IOError, EOFError):
+                # the client has gone, its requests are committed anyway
+                dead.add(conn)
+                conn.close()
+    listener.close()
+
+
+class DatabaseServer(object):
+    """a process which does all the writing to a database file
+
+    Any number of processes can use the database through a DatabaseClient.
+    All additions of minima and transition states are sent to the server,
+    which checks for duplicates exactly as Database does and returns the
+    id.  Everything else is read directly from the database file by the
+    client processes.  The file is switched to sqlite's write ahead
+    logging, so reading never waits for writing.
+
+    Parameters
+    ----------
+    dbfile : str
+        the database file
+    kwargs :
+        passed to the Database in the server process, e.g. accuracy,
+        compareMinima or coords_store.  They are not pickled, the server is
+        started with fork.
+
+    Examples
+    --------
+    >>> server = DatabaseServer("landscape.sqlite", accuracy=1e-4)
+    >>> server.start()
+    >>> client = server.client()
+    >>> #in any process, e.g. a basin hopping worker
+    >>> bh = system.get_basinhopping(database=client)
+    >>> ...
+    >>> server.stop()
+
+    Notes
+    -----
+    The server commits the requests it receives together, so the more
+    clients write at the same time the fewer commits are needed.
+
+    See Also
+    --------
+    DatabaseClient, Database
+    """
+    def __init__(self, dbfile, **kwargs):
+        self.dbfile = dbfile
+        self.kwargs = kwargs
+        self.process = None
+        self.address = None
+        self.authkey = None
+
+    def start(self):
+        """start the server process"""
+        self.authkey = os.urandom(20)
+        parent, child = mp.Pipe()
+        self.process = mp.Process(target=_serve, args=(self.dbfile, self.kwargs, self.authkey, child))
+        self.process.daemon = True
+        self.process.start()
+        self.address = parent.recv()
+
+    def client(self):
+        """return a DatabaseClient.  It can be passed to other processes"""
+        coords_store = self.kwargs.get("coords_store")
+        if coords_store is not None and not isinstance(coords_store, basestring):
+            coords_store = coords_store.fname
+        return DatabaseClient(self.dbfile, self.address, self.authkey,
+                              coords_store=coords_store,
+                              accuracy=self.kwargs.get("accuracy", 1e-3))
+
+    def stop(self):
+        """commit everything and stop the server process"""
+        if self.process is None:
+            return
+        conn = Client(self.address, authkey=self.authkey)
+        conn.send(("stop",))
+        conn.recv()
+        conn.close()
+        self.process.join()
+        self.process = None
+
+
+class _MinimumAdder(object):
+    """the client version of Database.minimum_adder"""
+    def __init__(self, client, Ecut):
+        self.client = client
+        self.Ecut = Ecut
+
+    def __call__(self, E, coords):
+        if self.Ecut is not None and E > self.Ecut:
+            return None
+        # the Minimum is not needed, so don't read it back
+        self.client._request("addMinimum", E, np.array(coords))
+
+
+class DatabaseClient(object):
+    """the access to a database served by a DatabaseServer
+
+    This can be used in place of a Database.  Minima and transition states
+    are added by the server, all other methods are those of a Database
+    which is opened on the file in each process (see reader).  The client
+    can be pickled and passed to other processes.  Each process opens its
+    own connection to the server and to the database file.
+
+    Parameters
+    ----------
+    dbfile : str
+    address, authkey :
+        the address and key of the server
+    coords_store : str, optional
+        the CoordsStore file of the database.  It is opened read only.
+    accuracy : float
+        the accuracy of the database
+
+    See Also
+    --------
+    DatabaseServer
+    """
+    def __init__(self, dbfile, address, authkey, coords_store=None, accuracy=1e-3):
+        self.dbfile = dbfile
+        self.address = address
+        self.authkey = authkey
+        self.coords_store = coords_store
+        self.accuracy = accuracy
+        self._pid = None
+        self._conn = None
+        self._reader = None
+
+    def __getstate__(self):
+        ddict = self.__dict__.copy()
+        ddict["_pid"] = None
+        ddict["_conn"] = None
+        ddict["_reader"] = None
+        return ddict
+
+    def __setstate__(self, ddict):
+        self.__dict__.update(ddict)
+
+    def _check_process(self):
+        # connections can't be shared with a forked process
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._conn = None
+            self._reader = None
+
+    @property
+    def reader(self):
+        """the Database used for reading in this process"""
+        self._check_process()
+        if self._reader is None:
+            coords_store = None
+            if self.coords_store is not None:
+                from pygmin.storage.coords_store import CoordsStore
+                coords_store = CoordsStore(self.coords_store, readonly=True)
+            # other processes add minima, so the energy cache would go stale
+            self._reader = Database(self.dbfile, accuracy=self.accuracy,
+                                    energy_cache=False, coords_store=coords_store)
+        return self._reader
+
+    def _request(self, *request):
+        self._check_process()
+        if self._conn is None:
+            self._conn = Client(self.address, authkey=self.authkey)
+        self._conn.send(request)
+        reply = self._conn.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def __getattr__(self, name):
+        # everything that isn't defined here is read from the database
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.reader, name)
+
+    def addMinimum(self, E, coords, commit=True):
+        """add a minimum through the server, see Database.addMinimum
+
+        commit is ignored, the server decides when to commit
+        """
+        id_ = self._request("addMinimum", E, np.array(coords))
+        return self.reader.getMinimum(id_)
+
+    def addTransitionState(self, energy, coords, min1, min2, commit=True,
+                           eigenval=None, eigenvec=None):
+        """add a transition state through the server, see
+        Database.addTransitionState"""
+        if coords is not None:
+            coords = np.array(coords)
+        if eigenvec is not None:
+            eigenvec = np.array(eigenvec)
+        id_ = self._request("addTransitionState", energy, coords, min1._id, min2._id,
+                            eigenval, eigenvec)
+        return self.reader.session.query(TransitionState).get(id_)
+
+    def setDistance(self, dist, min1, min2):
+        self.setDistanceBulk([((min1, min2), dist)])
+
+    def setDistanceBulk(self, values):
+        """set multiple distances through the server
+
+        Parameters
+        -----------
+        values : iterable of tuples of form ((min1, min2), dist)
+        """
+        self._request("setDistanceBulk", [(m1._id, m2._id, dist) for (m1, m2), dist in values])
+
+    def minimum_adder(self, Ecut=None):
+        """return a callable which adds minima, see Database.minimum_adder"""
+        return _MinimumAdder(self, Ecut)
+
+
+import unittest
+def _add_minima_worker(client, energies):
+    for E in energies:
+        client.addMinimum(E, np.ones(6) * E)
+    m1 = client.addMinimum(energies[0], np.zeros(6))
+    m2 = client.addMinimum(energies[1], np.zeros(6))
+    client.addTransitionState(energies[0] + energies[1], np.zeros(6), m1, m2)
+
+class TestDatabaseServer(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, "test.sqlite")
+        self.server = DatabaseServer(self.fname, coords_store=self.fname + ".coords")
+        self.server.start()
+
+    def tearDown(self):
+        import shutil
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_workers(self):
+        client = self.server.client()
+        energies = [float(i) for i in range(10)]
+        workers = [mp.Process(target=_add_minima_worker, args=(client, energies[i:] + energies[:i]))
+                   for i in range(4)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+            self.assertEqual(w.exitcode, 0)
+        minima = client.minima()
+        self.assertEqual([m.energy for m in minima], energies)
+        self.assertTrue(np.all(minima[3].coords == 3.))
+        self.assertEqual(len(client.transition_states()), 4)
+
+        m = client.addMinimum(20., np.zeros(6))
+        self.assertEqual(m.energy, 20.)
+        self.assertEqual(client.addMinimum(20., np.ones(6)), m)
+        client.setDistance(1.5, minima[0], m)
+        self.assertEqual(client.getDistance(minima[0], m), 1.5)
+
+    def test_client_gone(self):
+        """a client which disconnects before its replies are sent doesn't 
+        stop the server"""
+        conn = Client(self.server.address, authkey=self.server.authkey)
+        for i in range(20):
+            conn.send(("addMinimum", float(i), np.ones(6) * i))
+        conn.close()
+        client = self.server.client()
+        m = client.addMinimum(100., np.zeros(6))
+        self.assertEqual(m.energy, 100.)
+        self.assertEqual(client.addMinimum(101., np.zeros(6)).energy, 101.)
+        self.assertTrue(self.server.process.is_alive())
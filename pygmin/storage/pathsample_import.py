@@ -0,0 +1,217 @@
+"""import the minima and transition states of an OPTIM / PATHSAMPLE run"""
+import os
+import time
+from itertools import islice
+
+import numpy as np
+from sqlalchemy.sql import select, func
+
+from pygmin.storage.database import Minimum, TransitionState
+
+__all__ = ["import_pathsample"]
+
+
+def _read_table(fname, ncols, chunksize):
+    """iterate over the whitespace separated numbers in fname in blocks of
+    at most chunksize lines.  Each block is returned as a 2d array"""
+    with open(fname, "r") as fin:
+        while True:
+            lines = list(islice(fin, chunksize))
+            if len(lines) == 0:
+                break
+            data = np.fromstring("".join(lines), sep=" ")
+            if data.size != len(lines) * ncols:
+                raise ValueError("%s: expected %d columns per line" % (fname, ncols))
+            yield data.reshape(-1, ncols)
+
+def _count_lines(fname):
+    with open(fname, "r") as fin:
+        return sum(1 for line in fin)
+
+def _read_points(fname, nrecords):
+    """memory map the coordinates in a fortran direct access file
+
+    points.min and points.ts have one record of 3*natoms doubles for each
+    line of min.data and ts.data.  The record length is found from the size
+    of the file.
+    """
+    if nrecords == 0:
+        return None
+    nbytes = os.path.getsize(fname)
+    if nbytes % (8 * nrecords) != 0:
+        raise ValueError("%s: the size of the file does not match %d records" % (fname, nrecords))
+    ndof = nbytes // (8 * nrecords)
+    return np.memmap(fname, dtype=np.float64, mode="r", shape=(nrecords, ndof))
+
+def _next_id(connection, table):
+    maxid = connection.execute(select([func.max(table.c._id)])).scalar()
+    if maxid is None:
+        return 1
+    return maxid + 1
+
+def _report(name, n, t0):
+    dt = max(time.time() - t0, 1e-10)
+    print "%s: %d rows in %.1f seconds, %.0f rows per second" % (name, n, dt, n / dt)
+
+def import_pathsample(database, mindata="min.data", tsdata="ts.data",
+                      pointsmin="points.min", pointsts="points.ts",
+                      chunksize=10000, verbose=True):
+    """add the minima and transition states of a PATHSAMPLE database
+
+    The minima and transition states are inserted as they are, without
+    checking for duplicates, so this should be used to fill a new database.
+    The coordinates are read from memory mapped files and the data files are
+    parsed in blocks, so the memory use does not grow with the size of the
+    database.  All the rows are inserted in one transaction with bulk
+    inserts.  If the database has a CoordsStore, the coordinates of the 
+    minima are written there.
+
+    Parameters
+    ----------
+    database : Database
+    mindata, tsdata : str
+        the PATHSAMPLE files with the energies of the minima and the
+        energies and minima of the transition states.  If tsdata is None
+        only the minima are imported.
+    pointsmin, pointsts : str
+        the binary files with the coordinates.  If None, or if the file
+        doesn't exist, the coordinates are not stored.
+    chunksize : int
+        the number of rows parsed and inserted at a time
+    verbose : bool
+        print progress and the number of rows inserted per second
+
+    Returns
+    -------
+    minima_ids : int array
+        the database ids of the minima, in the order of mindata
+    ts_ids : int array
+        the database ids of the transition states, in the order of tsdata
+    """
+    database.commit()
+    conn = database.connection
+    store = database.coords_store
+    mintable = Minimum.__table__
+    tstable = TransitionState.__table__
+
+    nmin = _count_lines(mindata)
+    coords = None
+    if pointsmin is not None and os.path.isfile(pointsmin):
+        coords = _read_points(pointsmin, nmin)
+
+    trans = conn.begin()
+    try:
+        # minimum i in min.data (counting from 1) gets the id offset + i
+        offset = _next_id(conn, mintable) - 1
+        minima_ids = np.arange(offset + 1, offset + nmin + 1)
+        t0 = time.time()
+        i = 0
+        for data in _read_table(mindata, 6, chunksize):
+            if store is not None and coords is not None:
+                store.set_block(offset + i + 1, coords[i:i+len(data)])
+            rows = []
+            for energy in data[:,0]:
+                x = None
+                if coords is not None and store is None:
+                    x = coords[i]
+                rows.append(dict(_id=offset + i + 1, energy=energy, coords=x))
+                i += 1
+            conn.execute(mintable.insert(), rows)
+            if verbose:
+                _report(mindata, i, t0)
+
+        ts_ids = np.zeros(0, dtype=np.int64)
+        if tsdata is not None:
+            nts = _count_lines(tsdata)
+            coords = None
+            if pointsts is not None and os.path.isfile(pointsts):
+                coords = _read_points(pointsts, nts)
+            tsoffset = _next_id(conn, tstable) - 1
+            ts_ids = np.arange(tsoffset + 1, tsoffset + nts + 1)
+            t0 = time.time()
+            i = 0
+            for data in _read_table(tsdata, 8, chunksize):
+                mins = data[:,3:5].astype(np.int64)
+                if mins.min() < 1 or mins.max() > nmin:
+                    raise ValueError("%s: transition state connects to a minimum not in %s" % (tsdata, mindata))
+                # the database requires minimum1._id < minimum2._id
+                mins.sort(axis=1)
+                mins += offset
+                rows = []
+                for energy, (m1, m2) in zip(data[:,0], mins):
+                    x = None
+                    if coords is not None:
+                        x = coords[i]
+                    rows.append(dict(_id=tsoffset + i + 1, energy=energy, coords=x,
+                                     _minimum1_id=int(m1), _minimum2_id=int(m2)))
+                    i += 1
+                conn.execute(tstable.insert(), rows)
+                if verbose:
+                    _report(tsdata, i, t0)
+        trans.commit()
+    except:
+        trans.rollback()
+        raise
+
+    # the energy cache doesn't know about the new minima
+    database.invalidate_energy_cache()
+    return minima_ids, ts_ids
+
+
+import unittest
+class TestImportPathsample(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from pygmin.storage.database import Database
+        self.tmpdir = tempfile.mkdtemp()
+        self.nmin, self.nts, self.ndof = 20, 15, 9
+        self.energies = -0.5 * np.random.permutation(self.nmin) - np.random.random()
+        self.tsenergies = np.random.uniform(0, 1, self.nts)
+        self.mins = np.random.randint(1, self.nmin + 1, (self.nts, 2))
+        self.coords = np.random.random((self.nmin, self.ndof))
+        self.tscoords = np.random.random((self.nts, self.ndof))
+        with open(self.fname("min.data"), "w") as fout:
+            for e in self.energies:
+                fout.write("%.17g 10.5 1 1.0 2.0 3.0\n" % e)
+        with open(self.fname("ts.data"), "w") as fout:
+            for e, (m1, m2) in zip(self.tsenergies, self.mins):
+                fout.write("%.17g 10.5 1 %d %d 1.0 2.0 3.0\n" % (e, m1, m2))
+        self.coords.tofile(self.fname("points.min"))
+        self.tscoords.tofile(self.fname("points.ts"))
+        self.db = Database()
+        self.db.addMinimum(100., np.zeros(self.ndof))
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def fname(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def test_import(self):
+        minima_ids, ts_ids = import_pathsample(self.db, self.fname("min.data"), self.fname("ts.data"),
+                                               self.fname("points.min"), self.fname("points.ts"),
+                                               chunksize=7, verbose=False)
+        self.assertEqual(len(self.db.minima()), self.nmin + 1)
+        for i, mid in enumerate(minima_ids):
+            m = self.db.getMinimum(mid)
+            self.assertEqual(m.energy, self.energies[i])
+            self.assertTrue(np.all(m.coords == self.coords[i]))
+        ids, energies, pairs = self.db.transition_state_arrays()
+        self.assertEqual(list(ids), list(ts_ids))
+        self.assertTrue(np.all(energies == self.tsenergies))
+        expected = minima_ids[np.sort(self.mins, axis=1) - 1]
+        self.assertTrue(np.all(pairs == expected))
+        ts = self.db.transition_states()[3]
+        self.assertTrue(np.all(ts.coords == self.tscoords[3]))
+        # the energy cache is rebuilt with the new minima
+        m = self.db.addMinimum(self.energies[5], np.zeros(self.ndof))
+        self.assertEqual(m._id, minima_ids[5])
+
+    def test_no_coords(self):
+        minima_ids, ts_ids = import_pathsample(self.db, self.fname("min.data"), None,
+                                               pointsmin=None, verbose=False)
+        ids, energies = self.db.minima_arrays()
+        self.assertEqual(len(ids), self.nmin + 1)
+        self.assertEqual(len(ts_ids), 0)
+        self.assertIs(self.db.getMinimum(minima_ids[-1]).coords, None)
@@ -2,7 +2,9 @@ import tempfile
 
 from pygmin.landscape import DoubleEndedConnect, DoubleEndedConnectPar
 from pygmin import basinhopping
+from pygmin.basinhopping_parallel import ParallelBasinHopping
 from pygmin.storage import Database
+from pygmin.potentials import CachingPotential
 from pygmin.takestep import RandomDisplacement, AdaptiveStepsizeTemperature
 from pygmin.utils.xyz import write_xyz
 
@@ -43,6 +45,7 @@ class Parameters(BaseParameters):
     """Define the parameter tree for use with BaseSystem class"""
     def __init__(self):
         self["database"] = BaseParameters()
+        self["potential"] = BaseParameters()
         self["basinhopping"] = BaseParameters()
         self["takestep"] = BaseParameters()
         
@@ -99,6 +102,11 @@ class BaseSystem(object):
     additionally, it's a very good idea to specify the accuracy in the 
     database using self.params.database.accuracy
     
+    For expensive potentials set self.params.potential.cache_size to the
+    number of energy evaluations to remember.  The potential used by 
+    basinhopping and double ended connect is then wrapped in a 
+    CachingPotential, see get_caching_potential().
+    
     See the method documentation for more information and relevant links
     
     """
@@ -113,6 +121,27 @@ class BaseSystem(object):
         pygmin.potentials
         """
         raise NotImplementedError
+    
+    def get_caching_potential(self, maxsize=None):
+        """return the potential wrapped in a CachingPotential
+        
+        maxsize defaults to self.params.potential.cache_size, or 10 if 
+        that is not set.  If self.params.potential.cache_size is set this
+        is used in place of get_potential() by the other get_ routines.
+        
+        See Also
+        --------
+        pygmin.potentials.CachingPotential
+        """
+        if maxsize is None:
+            maxsize = self.params.potential.get("cache_size", 10)
+        return CachingPotential(self.get_potential(), maxsize=maxsize)
+    
+    def _get_potential_for_run(self):
+        """use a CachingPotential if params.potential.cache_size is set"""
+        if self.params.potential.get("cache_size", 0) > 0:
+            return self.get_caching_potential()
+        return self.get_potential()
 
     def get_random_configuration(self):
         """a starting point for basinhopping, etc."""
@@ -182,16 +211,21 @@ class BaseSystem(object):
         tsAdaptive = AdaptiveStepsizeTemperature(takeStep, **kwargs)
         return tsAdaptive
 
-    def get_basinhopping(self, database=None, takestep=None, coords=None, add_minimum=None, **kwargs):
+    def get_basinhopping(self, database=None, takestep=None, coords=None, add_minimum=None,
+                         parallel=False, **kwargs):
         """return the basinhopping object with takestep
         and accept step already implemented
         
+        if parallel is True a ParallelBasinHopping object is returned.  The 
+        number of workers can be passed as ncores
+        
         See Also
         --------
         pygmin.basinhopping
+        pygmin.basinhopping_parallel
         """
         kwargs = dict_copy_update(self.params["basinhopping"], kwargs)
-        pot = self.get_potential()
+        pot = self._get_potential_for_run()
         if coords is None:
             coords = self.get_random_configuration()
         if takestep is None:
@@ -200,7 +234,10 @@ class BaseSystem(object):
             if database is None:
                 database = self.create_database()
             add_minimum = database.minimum_adder()
-        bh = basinhopping.BasinHopping(coords, pot, takestep, storage=add_minimum, **kwargs)
+        if parallel:
+            bh = ParallelBasinHopping(coords, pot, takestep, storage=add_minimum, **kwargs)
+        else:
+            bh = basinhopping.BasinHopping(coords, pot, takestep, storage=add_minimum, **kwargs)
         return bh
 
     def get_mindist(self):
@@ -220,6 +257,16 @@ class BaseSystem(object):
         """
         raise NotImplementedError
     
+    def get_distance_bound(self):
+        """return a cheap lower bound on the distance returned by mindist,
+        or None if there is none for this system.
+        
+        See Also
+        --------
+        pygmin.mindist.RadialDistanceBound
+        """
+        return None
+    
     def get_orthogonalize_to_zero_eigenvectors(self):
         """return a which makes a vector orthogonal to the known zero
         eigenvectors (the eigenvectors with zero eigenvalues.  It should
@@ -241,7 +288,7 @@ class BaseSystem(object):
         pygmin.landscape
         """
         kwargs = dict_copy_update(self.params["double_ended_connect"], kwargs)
-        pot = self.get_potential()
+        pot = self._get_potential_for_run()
         mindist = self.get_mindist()
         
         #attach the function which orthogonalizes to known zero eigenvectors.
@@ -262,6 +309,9 @@ class BaseSystem(object):
             if not "orthogZeroEigs" in tssp:
                 tssp["orthogZeroEigs"] = self.get_orthogonalize_to_zero_eigenvectors()
                 
+        if not "distance_bound" in kwargs:
+            kwargs["distance_bound"] = self.get_distance_bound()
+        
         if parallel:
             return DoubleEndedConnectPar(min1, min2, pot, mindist, database, **kwargs)
         else:
@@ -3,7 +3,7 @@ import numpy as np
 from pygmin.systems import BaseSystem
 from pygmin.potentials import LJ
 from pygmin.transition_states import orthogopt
-from pygmin.mindist import minPermDistStochastic, MinDistWrapper, ExactMatchCluster
+from pygmin.mindist import minPermDistStochastic, MinDistWrapper, ExactMatchCluster, RadialDistanceBound
 from pygmin.landscape import smoothPath
 from pygmin.transition_states import NEB, InterpolatedPathDensity
 
@@ -44,6 +44,11 @@ class AtomicCluster(BaseSystem):
         permlist = self.get_permlist()
         return MinDistWrapper(minPermDistStochastic, permlist=permlist, **kwargs)
         
+    def get_distance_bound(self):
+        """a lower bound on the distance from the sorted distances of the 
+        atoms from the center of mass"""
+        return RadialDistanceBound(self.get_permlist())
+    
     def get_orthogonalize_to_zero_eigenvectors(self):
         """the zero eigenvectors correspond to 3 global translational
         degrees of freedom and 3 global rotational degrees of freedom"""
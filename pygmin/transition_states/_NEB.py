@@ -3,6 +3,7 @@ import os.path
 import copy
 
 import pygmin.defaults as defaults
+from pygmin.potentials.potential import has_energy_gradient_multiple
 from pygmin.transition_states import InterpolatedPath
 
 __all__ = ["NEB",]
@@ -26,6 +27,14 @@ def distance_cart(x1, x2, distance=True, grad=True):
         dist = norm(grad)**2
     return dist, grad
 
+def _rowdot(a, b):
+    """the dot product of each row of a with the same row of b"""
+    return np.einsum("ij,ij->i", a, b)
+
+def _rownorm(a):
+    """the norm of each row of a"""
+    return np.sqrt(_rowdot(a, a))
+
 class NEB(object):
     """Doubly nudged elastic band implementation
 
@@ -49,6 +58,15 @@ class NEB(object):
         over and over again.  
     quenchParams :
         parameters passed to the quench routine.
+    adapt_levels : int, optional
+        if greater than 0 the band is redistributed this many times during
+        optimize().  The steps are divided equally between the levels.  At
+        each level, images are added where the energy is high or the path
+        is bent, and removed where the path is low in energy and straight.
+        See redistribute().  Start with a coarse band to save potential 
+        calls.
+    max_images : int, optional
+        the maximum number of images when the band is redistributed
 
     Notes
     -----
@@ -63,7 +81,8 @@ class NEB(object):
     """
     def __init__(self, path, potential, distance=distance_cart,
                  k=100.0, with_springenergy=False, dneb=True,
-                 copy_potential=False, quenchParams=dict()):
+                 copy_potential=False, quenchParams=dict(),
+                 adapt_levels=0, max_images=None):
         self.distance = distance
         self.potential = potential
         self.k = k
@@ -98,6 +117,10 @@ class NEB(object):
         
         self.dneb = dneb
         self.with_springenergy = with_springenergy
+        
+        self.adapt_levels = adapt_levels
+        self.max_images = max_images
+        self.nadapted = 0 #the number of times the band has been redistributed
 
     def optimize(self, quenchRoutine=None,
                  **kwargs):
@@ -129,6 +152,19 @@ class NEB(object):
         if quenchParams.has_key("iprint"):
             self.iprint = quenchParams["iprint"]
 
+        nlevels = self.adapt_levels - self.nadapted
+        if nlevels > 0:
+            #optimize at each resolution for a part of the steps
+            nsteps = quenchParams["nsteps"]
+            for level in range(nlevels):
+                quenchParams["nsteps"] = max(1, nsteps / (nlevels + 1))
+                self._optimize(quenchRoutine, quenchParams)
+                self.redistribute()
+            quenchParams["nsteps"] = max(1, nsteps - nlevels * (nsteps / (nlevels + 1)))
+        self._optimize(quenchRoutine, quenchParams)
+
+    def _optimize(self, quenchRoutine, quenchParams):
+        """optimize the band with the current images"""
         qres = quenchRoutine(
                     self.active.reshape(self.active.size), self.getEnergyGradient,
                     **quenchParams)
@@ -143,6 +179,102 @@ class NEB(object):
             for i in xrange(0,self.nimages):
                 self.energies[i] = self.potential.getEnergy(self.coords[i,:])
 
+    def _setImages(self, coords, energies, potential_list=None):
+        """replace the images of the band"""
+        self.nimages = len(coords)
+        self.coords = np.array(coords)
+        self.energies = np.array(energies, dtype=np.float64)
+        self.isclimbing = [False for i in xrange(self.nimages)]
+        self.active = self.coords[1:self.nimages-1,:]
+        if self.copy_potential:
+            self.potential_list = potential_list
+
+    def redistribute(self, add_energy=0.5, add_angle=0.5, 
+                     remove_energy=0.2, remove_angle=0.1):
+        """
+        add images where they are needed and remove them where they are not
+        
+        The energies of the images are scaled to the range [0, 1].  An image
+        is added in the middle of a segment if the scaled energy of either
+        end is larger than add_energy, if either end is a maximum, or if the
+        angle between the segments at either end is larger than add_angle.  
+        An image is removed if its scaled energy is smaller than 
+        remove_energy, the angle between its segments is smaller than 
+        remove_angle, neither neighbor is removed and no image is added 
+        next to it.  There are never more than max_images images, the 
+        segments with the highest energy are split first.
+        
+        Parameters
+        ----------
+        add_energy, remove_energy : float
+            thresholds for the scaled energy
+        add_angle, remove_angle : float
+            thresholds for the angle between segments in radians
+        
+        Returns
+        -------
+        nadded, nremoved : int
+            the number of images added and removed
+        """
+        self.nadapted += 1
+        n = self.nimages
+        X = self.coords
+        E = self.energies
+        Erange = E.max() - E.min()
+        if Erange > 0.:
+            Escaled = (E - E.min()) / Erange
+        else:
+            Escaled = np.zeros(n)
+        
+        #the angle between the segments at each image, 0 at the end points
+        segments = X[1:,:] - X[:-1,:]
+        seglen = _rownorm(segments)
+        seglen[seglen == 0.] = 1.
+        cosangle = _rowdot(segments[1:,:], segments[:-1,:]) / (seglen[1:] * seglen[:-1])
+        angle = np.zeros(n)
+        angle[1:-1] = np.arccos(np.clip(cosangle, -1., 1.))
+        ismax = np.zeros(n, dtype=bool)
+        ismax[1:-1] = (E[1:-1] > E[:-2]) & (E[1:-1] > E[2:])
+        
+        needed = (Escaled > add_energy) | (angle > add_angle) | ismax
+        add = needed[:-1] | needed[1:]
+        
+        remove = np.zeros(n, dtype=bool)
+        for i in xrange(1, n-1):
+            if (Escaled[i] < remove_energy and angle[i] < remove_angle 
+                    and not remove[i-1] and not add[i-1] and not add[i]):
+                remove[i] = True
+        #respect max_images, splitting the highest segments first.
+        max_images = self.max_images
+        if max_images is not None:
+            nallowed = max_images - (n - remove.sum())
+            if add.sum() > nallowed:
+                segE = np.maximum(E[:-1], E[1:])
+                candidates = np.where(add)[0]
+                keep = candidates[np.argsort(-segE[candidates], kind="mergesort")[:max(nallowed, 0)]]
+                add[:] = False
+                add[keep] = True
+        
+        coords = []
+        energies = []
+        potential_list = [] if self.copy_potential else None
+        for i in xrange(n):
+            if not remove[i]:
+                coords.append(X[i,:])
+                energies.append(E[i])
+                if self.copy_potential:
+                    potential_list.append(self.potential_list[i])
+            if i < n-1 and add[i]:
+                x = 0.5 * (X[i,:] + X[i+1,:])
+                coords.append(x)
+                energies.append(self.potential.getEnergy(x))
+                if self.copy_potential:
+                    potential_list.append(copy.deepcopy(self.potential))
+        self._setImages(coords, energies, potential_list)
+        nadded, nremoved = add.sum(), remove.sum()
+        print "    NEB: added", nadded, "and removed", nremoved, "images, now", self.nimages
+        return nadded, nremoved
+
     def _getRealEnergyGradient(self, coordsall):
         # calculate real energy and gradient along the band. energy is needed for tangent
         # construction
@@ -151,6 +283,11 @@ class NEB(object):
             for i in xrange(1, self.nimages-1):
                 pot = self.potential_list[i]
                 self.energies[i], realgrad[i,:] = pot.getEnergyGradient(coordsall[i,:])
+        elif has_energy_gradient_multiple(self.potential):
+            #evaluate all the active images with one call to the potential
+            energies, grads = self.potential.getEnergyGradientMultiple(coordsall[1:self.nimages-1,:])
+            self.energies[1:self.nimages-1] = energies
+            realgrad[1:self.nimages-1,:] = grads
         else:
             for i in xrange(1, self.nimages-1):
                 self.energies[i], realgrad[i,:] = self.potential.getEnergyGradient(coordsall[i,:])
@@ -164,9 +301,10 @@ class NEB(object):
             coordinates of the whole neb active images (no end points)
         """
         # make array access a bit simpler, create array which contains end images
-        tmp = self.coords.copy()
+        tmp = np.empty(self.coords.shape)
+        tmp[0,:] = self.coords[0,:]
+        tmp[-1,:] = self.coords[-1,:]
         tmp[1:self.nimages-1,:] = coords1d.reshape(self.active.shape)
-        grad = np.zeros(self.active.shape)
 
         # calculate real energy and gradient along the band. energy is needed for tangent
         # construction
@@ -175,17 +313,8 @@ class NEB(object):
         #print "Spring forces"
         # the total energy of images, band is neglected
         E = sum(self.energies)
-        Eneb = 0
         # build forces for all images
-        for i in xrange(1, self.nimages-1):
-            En, grad[i-1,:] = self.NEBForce(
-                    self.isclimbing[i],
-                    [self.energies[i],tmp[i, :]],
-                    [self.energies[i-1],tmp[i-1, :]],
-                    [self.energies[i+1],tmp[i+1, :]],
-                    realgrad[i,:]
-                    )
-            Eneb += En
+        Eneb, grad = self.NEBForces(tmp, self.energies, realgrad)
         if self.iprint > 0:
             if self.getEnergyCount % self.iprint == 0:
                 self.printState()
@@ -194,6 +323,116 @@ class NEB(object):
         return E+Eneb, grad.reshape(grad.size)
         #return 0., grad.reshape(grad.size)
 
+    def NEBForces(self, coords, energies, realgrad):
+        """
+        Calculate the NEB force for all the images at once.
+
+        This does the same as NEBForce for each image, but with operations
+        on the whole band.  The results agree with NEBForce up to the 
+        rounding in the dot products.
+
+        Parameters
+        ----------
+        coords : 2d array
+            the coordinates of all images, including the end points
+        energies : array
+            the energies of all images
+        realgrad : 2d array
+            the gradient of the potential for each image
+
+        Returns
+        -------
+        Eneb : float
+            the sum of the spring energies (0 if with_springenergy is False)
+        grad : 2d array
+            the NEB gradient of the active images
+        """
+        nimages = self.nimages
+        central = coords[1:nimages-1,:]
+        greal = realgrad[1:nimages-1,:]
+        # construct tangent vectors
+        if self.distance is distance_cart:
+            g_left = central - coords[:nimages-2,:]
+            g_right = central - coords[2:,:]
+            if self.with_springenergy:
+                d_left = _rownorm(g_left)**2
+                d_right = _rownorm(g_right)**2
+        else:
+            g_left = np.zeros(central.shape)
+            g_right = np.zeros(central.shape)
+            d_left = np.zeros(nimages-2)
+            d_right = np.zeros(nimages-2)
+            for i in xrange(1, nimages-1):
+                d_left[i-1], g_left[i-1,:] = self.distance(coords[i,:], coords[i-1,:], distance=self.with_springenergy)
+                d_right[i-1], g_right[i-1,:] = self.distance(coords[i,:], coords[i+1,:], distance=self.with_springenergy)
+
+        t = self.tangents(energies[1:nimages-1], energies[:nimages-2], energies[2:], 
+                          g_left, g_right)
+
+        if self.dneb:
+            g_spring = self.k*(g_left + g_right)
+        else:
+            g_spring = (self.k*(_rownorm(g_left) - _rownorm(g_right)))[:,np.newaxis]*t
+
+        # project out parallel part
+        gperp = greal - _rowdot(greal, t)[:,np.newaxis] * t
+        # the parallel part of the spring
+        gs_par = _rowdot(g_spring,t)[:,np.newaxis]*t
+        g_tot = gperp + gs_par
+
+        if(self.dneb):
+            # perpendicular part of spring
+            gs_perp = g_spring - gs_par
+            # double nudging
+            g_tot += gs_perp - _rowdot(gs_perp,gperp)[:,np.newaxis]*gperp/_rowdot(gperp,gperp)[:,np.newaxis]
+
+        if(self.with_springenergy):
+            En = 0.5 / self.k * (d_left **2 + d_right**2)
+        else:
+            En = np.zeros(nimages-2)
+
+        # climbing images feel the inverted parallel force and no spring
+        climbing = np.array(self.isclimbing[1:nimages-1], dtype=bool)
+        if np.any(climbing):
+            gclimb = greal - (2.*_rowdot(greal, t))[:,np.newaxis] * t
+            g_tot[climbing] = gclimb[climbing]
+            En[climbing] = 0.
+
+        # add up in the same order as the images
+        Eneb = 0
+        for e in En:
+            Eneb += e
+        return Eneb, g_tot
+
+    def tangents(self, central, left, right, gleft, gright):
+        """
+        the uphill tangents of all images, see tangent()
+
+        Parameters
+        ----------
+        central, left, right : arrays
+            the energies of the images and of their left and right neighbors
+        gleft, gright : 2d arrays
+            the gradients to the left and right neighbors of each image
+        """
+        dleft = np.abs(central - left)
+        dright = np.abs(central - right)
+        vmax = np.maximum(dleft, dright)
+        vmin = np.minimum(dleft, dright)
+
+        # special interpolation treatment for maxima/minima
+        extremum = ((central >= left) & (central >= right)) | ((central <= left) & (central <= right))
+        swap = central <= left
+        vmax, vmin = np.where(swap, vmin, vmax), np.where(swap, vmax, vmin)
+        leftbig = left > right
+        cleft = np.where(leftbig, vmax, vmin)[:,np.newaxis]
+        cright = np.where(leftbig, vmin, vmax)[:,np.newaxis]
+        tmix = cleft * gleft + cright * (-gright)
+        # otherwise take the higher neighbor
+        t = np.where(extremum[:,np.newaxis], tmix,
+                     np.where(leftbig[:,np.newaxis], gleft, -gright))
+        return t / _rownorm(t)[:,np.newaxis]
+
     def tangent_old(self, central, left, right, gleft, gright):
         """
         Old tangent construction based on average of neighbouring images
@@ -272,7 +511,7 @@ class NEB(object):
         
         t = self.tangent(image[0],left[0],right[0], g_left, g_right)
         if(isclimbing):
-            return greal - 2.*np.dot(greal, t) * t
+            return 0., greal - 2.*np.dot(greal, t) * t
 
         if self.dneb:
             g_spring = self.k*(g_left + g_right)
@@ -374,6 +613,69 @@ class NEB(object):
 # only testing stuff below here
 #
 
+import unittest
+class TestNEBForces(unittest.TestCase):
+    def setUp(self):
+        from pygmin.potentials.lj import LJ
+        from pygmin.optimize import mylbfgs
+        self.pot = LJ()
+        natoms = 13
+        x1 = mylbfgs(np.random.uniform(-1, 1, 3*natoms), self.pot.getEnergyGradient)[0]
+        x2 = mylbfgs(np.random.uniform(-1, 1, 3*natoms), self.pot.getEnergyGradient)[0]
+        self.path = InterpolatedPath(x1, x2, 12)
+
+    def check_same(self, **kwargs):
+        """the band force must be the same as from NEBForce for each image"""
+        neb = NEB(self.path, self.pot, **kwargs)
+        neb.isclimbing[5] = True
+        x = neb.active.reshape(-1) + np.random.uniform(-0.01, 0.01, neb.active.size)
+        E, grad = neb.getEnergyGradient(x)
+        coords = neb.coords.copy()
+        coords[1:-1] = x.reshape(neb.active.shape)
+        grad = grad.reshape(neb.active.shape)
+        realgrad = neb._getRealEnergyGradient(coords)
+        Eneb = 0
+        for i in xrange(1, neb.nimages-1):
+            En, gneb = neb.NEBForce(neb.isclimbing[i], [neb.energies[i], coords[i]],
+                                    [neb.energies[i-1], coords[i-1]],
+                                    [neb.energies[i+1], coords[i+1]], realgrad[i])
+            Eneb += En
+            scale = np.abs(gneb).max()
+            self.assertLess(np.abs(gneb - grad[i-1]).max(), 1e-12 * scale)
+        self.assertAlmostEqual(E, sum(neb.energies) + Eneb, 8)
+
+    def test_dneb(self):
+        self.check_same()
+
+    def test_no_dneb(self):
+        self.check_same(dneb=False, with_springenergy=True)
+
+    def test_distance(self):
+        def distance(x1, x2, distance=True, grad=True):
+            return distance_cart(x1, x2, distance=distance, grad=grad)
+        self.check_same(distance=distance, with_springenergy=True)
+
+    def test_adaptive(self):
+        from pygmin.transition_states import create_NEB
+        x1, x2 = self.path[0], self.path[len(self.path)-1]
+        neb = create_NEB(self.pot, x1, x2, adaptive=2, max_images=20, 
+                         NEBquenchParams=dict(nsteps=60))
+        nimages0 = neb.nimages
+        neb.optimize()
+        self.assertEqual(neb.nadapted, 2)
+        self.assertNotEqual(neb.nimages, nimages0)
+        self.assertLessEqual(neb.nimages, 20)
+        self.assertEqual(len(neb.isclimbing), neb.nimages)
+        self.assertTrue(np.all(neb.coords[0] == x1))
+        self.assertTrue(np.all(neb.coords[-1] == x2))
+        for x, e in zip(neb.coords, neb.energies):
+            self.assertAlmostEqual(e, self.pot.getEnergy(x), 6)
+        #the band is not redistributed again
+        nimages = neb.nimages
+        neb.optimize(nsteps=5)
+        self.assertEqual(neb.nimages, nimages)
+
+
 import nebtesting as test
 
 def nebtest(MyNEB=NEB, nimages=22):
@@ -4,96 +4,223 @@ import multiprocessing as mp
 
 from pygmin.transition_states import NEB
 
-__all__ = ["NEBPar"]
+__all__ = ["NEBPar", "PotentialPool"]
 
-class _PotentialProcess(mp.Process):
+def _potentialWorker(pot, conn, coords_buf, energies_buf, grads_buf, copy_potential):
     """
-    this class defines the worker object to be run as a separate process
-    
+    the main loop of a worker process of PotentialPool
+
+    The messages are::
+
+        ("energy gradient", start, stop, ndof) : evaluate the rows start to 
+            stop of the shared coordinates and write the energies and 
+            gradients to the shared buffers.  The reply is None.
+        ("call", func, arg) : reply with func(pot, arg)
+        ("kill",) : stop
+
+    an exception is sent back as the reply
+    """
+    potlist = dict()
+    while True:
+        message = conn.recv()
+        if message[0] == "kill":
+            return
+        try:
+            if message[0] == "energy gradient":
+                start, stop, ndof = message[1:]
+                coords = np.frombuffer(coords_buf)[:stop*ndof].reshape(-1, ndof)
+                grads = np.frombuffer(grads_buf)[:stop*ndof].reshape(-1, ndof)
+                energies = np.frombuffer(energies_buf)
+                for i in xrange(start, stop):
+                    if copy_potential:
+                        #keep a separate copy of the potential for each image 
+                        #so neighbor lists are not rebuilt over and over again.
+                        if i not in potlist:
+                            potlist[i] = copy.deepcopy(pot)
+                        p = potlist[i]
+                    else:
+                        p = pot
+                    energies[i], grads[i,:] = p.getEnergyGradient(coords[i,:])
+                reply = None
+            elif message[0] == "call":
+                func, arg = message[1:]
+                reply = func(pot, arg)
+            else:
+                reply = ValueError("unknown message: " + str(message[0]))
+        except Exception, e:
+            reply = e
+        conn.send(reply)
+
+
+class PotentialPool(object):
+    """
+    a pool of processes which evaluate a potential in parallel
+
+    The processes are started the first time they are needed and stay
+    alive until close() is called, so one pool can be used for many NEB 
+    runs and transition state searches.  The potential is not pickled, the
+    processes are forked from the current one.  The coordinates, energies
+    and gradients are passed through shared memory, only the image indices
+    are sent through the pipes.
+
+    The pool can be used in place of the potential, 
+    getEnergyGradientMultiple is done in parallel.  getEnergy and
+    getEnergyGradient are done in the current process.
+
     Parameters
     ----------
-    pot : 
-        the potential object
-    conn : 
-        the communications pipe
-    copy_potential : integer
-        if copy_potential > 1 then the copy_potential deep copies of the potential
-        will be made and each one used for a different item in coordslist.  This
-        is useful to minimize rebuilding of neighborlists.
-
-    Notes
-    -----
-    attributes:
-    
-    start():
-        start the process.  The proceess will sit idle waiting for instructions
-        sent through the pipe conn
-    join():
-        wait until the process has finished it's task.  (Send message "kill" to stop 
-        the process waiting for the next task)
-    terminate():
-        kill the process
-    
-    
-    Examples
-    ---------
-    example usage::
-    
-    >>> parent_conn, child_conn = mp.Pipe()
-    >>> worker = _PotentialProcess( potential, child_conn)
-    >>> worker.start()
-    
-    >>> X1 = np.random.rand(3*10)
-    >>> X2 = np.random.rand(3*10)
-    >>> parent_conn.send(("calculate energy gradient", [X1, X2]))
-    >>> eglist = parent_conn.recv()
-    >>> print "energies", eglist[0][0], eglist[1][0]
-    
-    >>> parent_conn.send(("kill",))
-    >>> worker.join()
-    >>> worker.terminate() 
+    pot :
+        the potential.  The workers have a copy of the potential as it is
+        when they are started.
+    ncores : int
+        the number of worker processes
+    copy_potential : bool
+        if True each worker keeps a separate copy of the potential for each 
+        image it evaluates.  This can be used to keep neighbor lists from 
+        being rebuilt over and over again.
 
+    Examples
+    --------
+    >>> pool = PotentialPool(pot, ncores=4)
+    >>> try:
+    >>>     for coords1, coords2 in pairs:
+    >>>         neb = NEBPar(InterpolatedPath(coords1, coords2, 20), pot, pool=pool)
+    >>>         neb.optimize()
+    >>> finally:
+    >>>     pool.close()
 
-    
-    once this process is started (start()) it will be waiting for a message for what to do
+    See Also
+    --------
+    NEBPar
     """
-    def __init__(self, pot, conn, copy_potential=0):
-        mp.Process.__init__(self)
-        self.conn = conn
-        self.copy_potential = int(copy_potential)
-        if self.copy_potential > 1:
-            self.potlist = [copy.deepcopy(pot) for i in range(self.copy_potential)] 
-        else:
-            self.pot = pot
-    
+    def __init__(self, pot, ncores=4, copy_potential=False):
+        self.pot = pot
+        self.ncores = ncores
+        self.copy_potential = copy_potential
+        self.workerlist = []
+        self.connlist = []
+        self.capacity = 0 #the size of the shared coordinates buffer
+        self.maxrows = 0 #the size of the shared energies buffer
+
+    def _start(self, maxrows, capacity):
+        """start the workers with shared buffers of at least the given size"""
+        self.close()
+        self.maxrows = max(maxrows, 1)
+        self.capacity = max(capacity, 1)
+        self._coords_buf = mp.RawArray("d", self.capacity)
+        self._grads_buf = mp.RawArray("d", self.capacity)
+        self._energies_buf = mp.RawArray("d", self.maxrows)
+        self.coords = np.frombuffer(self._coords_buf)
+        self.grads = np.frombuffer(self._grads_buf)
+        self.energies = np.frombuffer(self._energies_buf)
+        for i in range(self.ncores):
+            parent_conn, child_conn = mp.Pipe()
+            worker = mp.Process(target=_potentialWorker, 
+                                args=(self.pot, child_conn, self._coords_buf,
+                                      self._energies_buf, self._grads_buf, 
+                                      self.copy_potential))
+            worker.daemon = True
+            worker.start()
+            self.workerlist.append(worker)
+            self.connlist.append(parent_conn)
+
+    def close(self):
+        """stop the worker processes"""
+        for conn, worker in zip(self.connlist, self.workerlist):
+            try:
+                conn.send(("kill",))
+            except IOError:
+                pass
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self.workerlist = []
+        self.connlist = []
+
+    def terminate(self):
+        """kill the worker processes without waiting for them to finish"""
+        for worker in self.workerlist:
+            worker.terminate()
+            worker.join()
+        self.workerlist = []
+        self.connlist = []
+
+    def getEnergy(self, coords):
+        return self.pot.getEnergy(coords)
+
+    def getEnergyGradient(self, coords):
+        return self.pot.getEnergyGradient(coords)
+
+    def _recv(self, conn):
+        reply = conn.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
     def getEnergyGradientMultiple(self, coordslist):
-        eglist = []
-        if self.copy_potential > 1:
-            assert len(coordslist) == self.copy_potential
-            for i, coords in enumerate(coordslist):
-                eglist.append( self.potlist[i].getEnergyGradient(coords) )
-        else:
-            for coords in coordslist:
-                eglist.append( self.pot.getEnergyGradient(coords) )
-        return eglist
-
-    def run(self):
-        #this redefines mp.Process.run
-        while 1:
-            message = self.conn.recv()
-            #print "message", message
-            if message[0] == "kill":
-                #print "terminating", self.name
-                return
-            elif message[0] == "calculate energy gradient":
-                #print "received message: calculating gradient"
-                coordslist = message[1]
-                eglist = self.getEnergyGradientMultiple(coordslist)
-                self.conn.send(eglist)
-            else:
-                print "unknown message:", self.name
-                print message
-                
+        """return the energies and gradients of the rows of coordslist, 
+        calculated in parallel"""
+        coordslist = np.asarray(coordslist)
+        nrows, ndof = coordslist.shape
+        if len(self.workerlist) == 0 or nrows > self.maxrows or nrows * ndof > self.capacity:
+            self._start(max(nrows, 2 * self.maxrows), max(nrows * ndof, 2 * self.capacity))
+        self.coords[:nrows*ndof] = coordslist.reshape(-1)
+        
+        #distribute the images over the workers.  If there are 5 images and
+        #3 workers, worker 1 has images 0, 1, worker 2 has 2, 3 and worker 3 has 4
+        nall, nextra = divmod(nrows, self.ncores)
+        start = 0
+        used = []
+        for i, conn in enumerate(self.connlist):
+            stop = start + nall + (1 if i < nextra else 0)
+            if stop > start:
+                conn.send(("energy gradient", start, stop, ndof))
+                used.append(conn)
+            start = stop
+        errors = []
+        for conn in used:
+            try:
+                self._recv(conn)
+            except Exception, e:
+                errors.append(e)
+        if len(errors) > 0:
+            raise errors[0]
+        return self.energies[:nrows].copy(), self.grads[:nrows*ndof].reshape(nrows, ndof).copy()
+
+    def map(self, func, arglist):
+        """
+        return [func(pot, arg) for arg in arglist] calculated by the workers
+
+        func and the arguments are pickled and sent to the workers, the 
+        potential is not.  Each worker uses its own copy of the potential.
+        """
+        if len(self.workerlist) == 0:
+            self._start(self.maxrows, self.capacity)
+        results = [None] * len(arglist)
+        pending = list(enumerate(arglist))
+        pending.reverse()
+        busy = dict() #maps worker number to the index of its task
+        errors = []
+        while len(pending) > 0 or len(busy) > 0:
+            for i, conn in enumerate(self.connlist):
+                if i not in busy and len(pending) > 0 and len(errors) == 0:
+                    index, arg = pending.pop()
+                    conn.send(("call", func, arg))
+                    busy[i] = index
+            if len(errors) > 0:
+                pending = []
+            for i, index in busy.items():
+                if self.connlist[i].poll(0.001):
+                    del busy[i]
+                    try:
+                        results[index] = self._recv(self.connlist[i])
+                    except Exception, e:
+                        errors.append(e)
+        if len(errors) > 0:
+            raise errors[0]
+        return results
+
                 
 class NEBPar(NEB):
     """
@@ -105,10 +232,17 @@ class NEBPar(NEB):
         all required and optional parameters from NEB are accepted
     ncores : 
         the number of cores to use
+    pool : PotentialPool, optional
+        the pool of processes which evaluate the potential.  A pool can
+        be shared by many NEBs, it is not closed at the end of optimize().  
+        If not given, a pool with ncores processes is made and closed at 
+        the end of optimize().  The pool must have been made with the 
+        same copy_potential as is passed to NEBPar.
     
     See Also
     --------
     NEB : base class
+    PotentialPool : the processes which evaluate the potential
     pygmin.landscape.LocalConnectPar : were this class is used
     """
     def __init__(self, *args, **kwargs):
@@ -124,99 +258,96 @@ class NEBPar(NEB):
         except KeyError:
             self.par_copy_potential = False
         kwargs["copy_potential"] = False 
+        self.pool = kwargs.pop("pool", None)
             
         ret = super(NEBPar, self).__init__(*args, **kwargs)
 
-        #we need to distribute self.nimages potential calculations over self.ncores processors
-        #if there are 5 jobs and 3 processors it will be distributed like this
-        #core1 will have images 1,2 
-        #core2 will have images 3,4 
-        #core3 will have image  5 
-        self.par_images = [] #a list of lists of which images are on which cores
-        nall = int(self.nimages / self.ncores) #all cores have at least this many images
-        nextra = self.nimages - nall * self.ncores
-        count = 0
-        for i in range(self.ncores):
-            if i < nextra:
-                #this core has nall+1 images
-                self.par_images.append( np.array(range(count,count+nall+1)))
-                count += nall + 1
-            else:
-                #this core has nall images
-                self.par_images.append( np.array(range(count,count+nall)))
-                count += nall
-        #print self.par_images        
-        
-        #initialize the parallel workers with the potential
-        self.workerlist = []
-        self.connlist = []
-        for i in range(self.ncores):
-            parent_conn, child_conn = mp.Pipe()
-            worker_nimages = len(self.par_images[i])
-            if not self.par_copy_potential:
-                worker_nimages = 0
-            worker = _PotentialProcess( self.potential, child_conn, copy_potential=worker_nimages)
-            self.workerlist.append( worker )
-            self.connlist.append( parent_conn )
-            #worker.start()
-
+        self.own_pool = self.pool is None
+        if self.own_pool:
+            self.pool = PotentialPool(self.potential, self.ncores, 
+                                      copy_potential=self.par_copy_potential)
+        else:
+            if self.pool.copy_potential != self.par_copy_potential:
+                raise ValueError("copy_potential is %s, but the pool was made with copy_potential=%s" 
+                                 % (self.par_copy_potential, self.pool.copy_potential))
+            self.ncores = self.pool.ncores
         return ret
 
     def _getRealEnergyGradient(self, coordsall):
         """
         override the function from NEB to calculate the energies in parallel
         """
-        #start all workers 
-        for i in range(self.ncores):
-            coordslist = coordsall[self.par_images[i],:]
-            self.connlist[i].send(("calculate energy gradient", coordslist))
-        
-        #receive energies and gradients from all workers
         realgrad = np.zeros(coordsall.shape)
-        for i in range(self.ncores):
-            eglist = self.connlist[i].recv()
-            imagelist = self.par_images[i]
-            for j in range(len(imagelist)):
-                image = imagelist[j]
-                self.energies[image] = eglist[j][0]
-                realgrad[image,:]  = eglist[j][1]
-            
+        energies, grads = self.pool.getEnergyGradientMultiple(coordsall[1:self.nimages-1,:])
+        self.energies[1:self.nimages-1] = energies
+        realgrad[1:self.nimages-1,:] = grads
         return realgrad   
-    
-    def _killWorkers(self):
-        for i, worker in enumerate(self.workerlist):
-            #print "killing"
-            #tell the worker to stop waiting for messages
-            self.connlist[i].send(("kill",))
-            #print "joining"
-            #wait for the worker to finish what it's doing
-            worker.join()
-            #kill the worker process
-            worker.terminate()
-            worker.join()
-            #print "is alive?", worker.is_alive()
-
 
     def optimize(self, *args, **kwargs):
         """
-        wrap the optimize routine of NEB so the workers can be started
-        and, importantly, stopped, even if an exception is raised.
+        wrap the optimize routine of NEB so the workers are stopped, 
+        even if an exception is raised.
         """
         try:
-            for worker in self.workerlist:
-                worker.start()
             print "running NEB in parallel with", self.ncores, "cores"
             ret = super(NEBPar, self).optimize(*args, **kwargs)
-            self._killWorkers()
-            return ret
         except:
             print "exception raised while doing NEB in parallel, terminating child processes"
-            for worker in self.workerlist:
-                worker.terminate()
-                worker.join()
-            #self._killWorkers()
+            if self.own_pool:
+                self.pool.terminate()
             raise
+        if self.own_pool:
+            self.pool.close()
+        return ret
     
+import unittest
+def _energy(pot, coords):
+    return pot.getEnergy(coords)
+
+class TestPotentialPool(unittest.TestCase):
+    def setUp(self):
+        from pygmin.potentials.lj import LJ
+        self.pot = LJ()
+        self.pool = PotentialPool(self.pot, ncores=3)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_energy_gradient(self):
+        for nimages in [2, 7, 20]:
+            coordslist = np.random.uniform(-1, 1, (nimages, 3*13))
+            energies, grads = self.pool.getEnergyGradientMultiple(coordslist)
+            for x, e, g in zip(coordslist, energies, grads):
+                e0, g0 = self.pot.getEnergyGradient(x)
+                self.assertAlmostEqual(e, e0, 10)
+                self.assertLess(np.abs(g - g0).max(), 1e-10 * np.abs(g0).max())
+        workers = list(self.pool.workerlist)
+        #the workers are kept for smaller bands
+        self.pool.getEnergyGradientMultiple(coordslist[:5])
+        self.assertEqual(workers, self.pool.workerlist)
+        self.assertRaises(Exception, self.pool.getEnergyGradientMultiple, np.zeros((4, 5)))
+
+    def test_map(self):
+        coordslist = list(np.random.uniform(-1, 1, (10, 3*13)))
+        energies = self.pool.map(_energy, coordslist)
+        self.assertEqual(energies, [self.pot.getEnergy(x) for x in coordslist])
+
+    def test_neb(self):
+        from pygmin.transition_states import InterpolatedPath
+        x1 = np.random.uniform(-1, 1, 3*13)
+        x2 = np.random.uniform(-1, 1, 3*13)
+        path = InterpolatedPath(x1, x2, 10)
+        neb = NEB(path, self.pot)
+        nebpar = NEBPar(path, self.pot, pool=self.pool)
+        x = neb.active.reshape(-1)
+        E, g = neb.getEnergyGradient(x)
+        Epar, gpar = nebpar.getEnergyGradient(x)
+        self.assertLess(abs(E - Epar), 1e-10 * abs(E))
+        self.assertLess(np.abs(g - gpar).max(), 1e-8 * np.abs(g).max())
+        #the pool does not copy the potential
+        self.assertRaises(ValueError, NEBPar, path, self.pot, pool=self.pool, 
+                          copy_potential=True)
+
 if __name__ == "__main__":
     from pygmin.transition_states._NEB import nebtest
     nebtest(NEBPar)
@@ -7,7 +7,8 @@ __all__ = ["create_NEB"]
 def create_NEB(pot, coords1, coords2, image_density=10, max_images=40,
                 iter_density=15, 
                 NEBquenchParams=dict(), 
-                verbose=False, factor=1, parallel=False, ncores=4, **NEBparams):
+                verbose=False, factor=1, parallel=False, ncores=4, pool=None,
+                adaptive=0, **NEBparams):
     """
     a wrapper function to do the interpolation and set up the nudged elastic band object
     
@@ -34,6 +35,16 @@ def create_NEB(pot, coords1, coords2, image_density=10, max_images=40,
         if True, then use class NEBPar to evaluate the image potentials in parallel
     ncores : int
         the number of cores to use.  Ignored if parallel is False
+    pool : PotentialPool, optional
+        the processes which evaluate the potential in parallel.  If not
+        given NEBPar starts ncores new processes.  Ignored if parallel is
+        False
+    adaptive : int
+        if greater than 0 the band starts with a factor 2**adaptive fewer
+        images (at least 4) and is redistributed adaptive times during the
+        optimization, adding images near the high energy and bent segments
+        and removing them in flat regions, up to max_images.
+        See NEB.redistribute()
     
     Returns
     -------
@@ -65,13 +76,20 @@ def create_NEB(pot, coords1, coords2, image_density=10, max_images=40,
         NEBquenchParams["nsteps"] = niter
 
     
+    if adaptive > 0:
+        #start with a coarse band
+        nimages = max(4, nimages / 2**adaptive)
+        NEBparams = dict(NEBparams.items() + [("adapt_levels", adaptive), 
+                                              ("max_images", max_images)])
+
     if verbose:    
         print "    NEB: nimages", nimages
         print "    NEB: nsteps ", niter
 
     if parallel:
         return NEBPar(InterpolatedPath(coords1, coords2, nimages), 
-                   pot, quenchParams=NEBquenchParams, ncores=ncores, **NEBparams)
+                   pot, quenchParams=NEBquenchParams, ncores=ncores, pool=pool,
+                   **NEBparams)
     else:
         return NEB(InterpolatedPath(coords1, coords2, nimages), 
                    pot, quenchParams=NEBquenchParams, **NEBparams)
@@ -24,6 +24,7 @@ Lowest eigenvalue search
    :toctree: generated/
 
     findLowestEigenVector
+    findLowestEigenVectorHessian
 
 Nudged Elastic Band
 +++++++++++++++++++
@@ -33,6 +34,7 @@ Nudged Elastic Band
     
     NEB
     NEBPar
+    PotentialPool
     create_NEB
     InterpolatedPath
     InterpolatedPathDensity
@@ -1,6 +1,7 @@
 import numpy as np
 from pygmin.optimize import fire, lbfgs_py
 from pygmin.transition_states import gramm_schmidt
+from pygmin.potentials.potential import has_hessian_vector_product
 
 __all__ = ["findTransitionState_dimer", "DimerSearch"]
 
@@ -48,6 +49,8 @@ class DimerSearch(object):
         self.theta_cut = theta_cut
         # callback to calculate zero eigenvectors
         self.zeroEigenVecs = zeroEigenVecs
+        # use analytic Hessian vector products in place of the dimer image
+        self.use_hessian_vector_product = has_hessian_vector_product(potential)
         # searches starting in this direction have already been performed
         self.tau_done=[]
         # current list of eigenvectors to projected out
@@ -72,9 +75,12 @@ class DimerSearch(object):
         #print "step",np.linalg.norm(x0-self.x0),E
         self.updateRotation(x0, E, g)
         
-        x1 = x0 + self.tau*self.delta
-        E,grad1 = self.potential.getEnergyGradient(x1)            
-        C = np.dot((grad1 - g), self.tau)/self.delta
+        if self.use_hessian_vector_product:
+            C = np.dot(self.potential.getHessianVectorProduct(x0, self.tau), self.tau)
+        else:
+            x1 = x0 + self.tau*self.delta
+            E,grad1 = self.potential.getEnergyGradient(x1)            
+            C = np.dot((grad1 - g), self.tau)/self.delta
         
         self.tau_ignore[:] = [t for t in self.tau_ignore if np.abs(t[1]) < np.abs(C) + 1.] 
                              
@@ -98,6 +104,19 @@ class DimerSearch(object):
         self.orthogonalize(g, eigenvecs)
         return g
     
+    def getGradientDifference(self, x0, grad0, tau, evecs):
+        """
+        return the gradient at the dimer image x0 + delta*tau minus grad0,
+        with the components along evecs removed.  If the potential has
+        analytic Hessian vector products this is delta * H tau and the
+        gradient at the image is not needed.
+        """
+        if self.use_hessian_vector_product:
+            dg = self.delta * self.potential.getHessianVectorProduct(x0, tau)
+            self.orthogonalize(dg, evecs)
+            return dg
+        return self.getOrthogonalGradient(x0 + tau*self.delta, evecs) - grad0
+    
     def get_eigenvecs(self, x0):
         zev = []
         if(self.zeroEigenVecs):
@@ -126,6 +145,9 @@ class DimerSearch(object):
         #print gramm_schmidt(zev)
         # update ignore list for eigenvalues
         for t in self.tau_ignore:
+            if self.use_hessian_vector_product:
+                t[1] = np.dot(self.potential.getHessianVectorProduct(x0, t[0]), t[0])
+                continue
             E,grad1 = self.potential.getEnergyGradient(x0 + t[0]*self.delta)
             #grad1 = self.getOrthogonalGradient(x0 + t[1]*self.delta, zev)
             t[1] = np.dot((grad1 - grad0), t[0])/self.delta
@@ -138,19 +160,18 @@ class DimerSearch(object):
             self.orthogonalize(self.tau, evecs)
             self.tau /= np.linalg.norm(self.tau)
             
-            x1 = x0 + self.tau*self.delta
-            grad1 = self.getOrthogonalGradient(x1, evecs)
+            dg = self.getGradientDifference(x0, grad0, self.tau, evecs)
             
             # calculate the rotational force of dimer
-            F_rot = -2.*(grad1 - grad0) + 2.*np.dot(grad1 - grad0, self.tau)*self.tau
+            F_rot = -2.*dg + 2.*np.dot(dg, self.tau)*self.tau
             
             # For now just use steepest descent search direction for rotation.
             # Replace this by LBFGS
             Theta = F_rot / np.linalg.norm(F_rot)
             
             # calculate curvature C and derivative of curvature
-            C = np.dot((grad1 - grad0), self.tau)/self.delta
-            dC = 2.*np.dot((grad1 - grad0), Theta)/self.delta
+            C = np.dot(dg, self.tau)/self.delta
+            dC = 2.*np.dot(dg, Theta)/self.delta
             #print C,self.tau
             # calculate estimated rotation angle
             theta1=-0.5*np.arctan(dC/(2.*np.abs(C)))
@@ -165,14 +186,11 @@ class DimerSearch(object):
             self.orthogonalize(taup, evecs)
             taup /= np.linalg.norm(taup)
             
-            x1p = x0 + self.delta * taup
-            
             # get the new energy and gradient at trial conviguration
-            grad1p = self.getOrthogonalGradient(x1p, evecs)
+            dgp = self.getGradientDifference(x0, grad0, taup, evecs)
 
-            #grad1p = -grad1p
             # get curvature for trial point
-            Cp = np.dot((grad1p - grad0), taup)/self.delta
+            Cp = np.dot(dgp, taup)/self.delta
             
             # calculate optimum rotation angle theta_min and taumin
             b1 = 0.5*dC
@@ -1,15 +1,18 @@
+import warnings
+
 import numpy as np
 
 from pygmin.optimize import Result
 
 from pygmin.transition_states import orthogopt
 from pygmin.potentials.potential import potential as basepot
+from pygmin.potentials.potential import hessian_vector_product, has_hessian_vector_product
 import pygmin.defaults as defaults
 #from pygmin.optimize.lbfgs_py import LBFGS
 from pygmin.optimize import MYLBFGS
 import pygmin.utils.rotations as rotations
 
-__all__ = ["findLowestEigenVector"]
+__all__ = ["findLowestEigenVector", "findLowestEigenVectorHessian"]
 
 class LowestEigPot(basepot):
     """
@@ -32,7 +35,9 @@ class LowestEigPot(basepot):
             eigenvectors with zero eigenvalues.  The default assumes global
             translational and rotational symmetry
         dx: float
-            the local curvature is approximated using 3 points separated by dx
+            the local curvature is approximated using 3 points separated by dx.
+            This is not used if the potential computes Hessian vector
+            products itself (see BasePotential.getHessianVectorProduct)
         """
         self.coords = np.copy(coords)
         self.pot = pot
@@ -59,15 +64,13 @@ class LowestEigPot(basepot):
             vec_in /= np.linalg.norm(vec_in)
 
         vec = vec_in / np.linalg.norm(vec_in)
-        coordsnew = self.coords - self.diff * vec
-        Eminus, Gminus = self.pot.getEnergyGradient(coordsnew)
-        
-        coordsnew = self.coords + self.diff * vec
-        Eplus, Gplus = self.pot.getEnergyGradient(coordsnew)
+        #the central difference (Gplus - Gminus) / (2 diff) unless the
+        #potential has an analytic Hessian vector product
+        hv = hessian_vector_product(self.pot, self.coords, vec, self.diff)
         
         #diag = (Eplus + Eminus -2.0 * self.E) / (self.diff**2, vecl)
         
-        diag2 = np.sum((Gplus - Gminus) * vec) / (2.0 * self.diff)
+        diag2 = np.sum(hv * vec)
         
         """
         DIAG3=2*(DIAG-DIAG2/2)
@@ -76,7 +79,7 @@ class LowestEigPot(basepot):
         """
         
         #GL(J1)=(GRAD1(J1)-GRAD2(J1))/(ZETA*VECL**2)-2.0D0*DIAG2*LOCALV(J1)/VECL**2
-        grad = (Gplus - Gminus) / (self.diff*vecl**2) - 2.0 * diag2 * vec / vecl**2
+        grad = 2.0 * hv / vecl**2 - 2.0 * diag2 * vec / vecl**2
         if self.orthogZeroEigs is not None:
             grad = self.orthogZeroEigs(grad, self.coords)
         """
@@ -87,7 +90,160 @@ class LowestEigPot(basepot):
         
         return diag2, grad
 
-def findLowestEigenVector(coords, pot, eigenvec0=None, H0=None, orthogZeroEigs=0, **kwargs):
+# the potential classes whose getEnergyGradientHessian failed with an 
+# ImportError, e.g. because the fortran module is not compiled.  They are not 
+# tried again
+_no_hessian_module = set()
+
+def _getHessianMatvec(coords, pot, max_dense=300):
+    """
+    return a function which multiplies a vector by the Hessian at coords and the
+    number of potential calls each product costs.  Return None if the potential
+    doesn't provide second derivatives.
+    
+    Analytic Hessian vector products are used if the potential has them.
+    Otherwise the dense Hessian is used, but only for up to max_dense 
+    degrees of freedom.
+    """
+    if has_hessian_vector_product(pot):
+        return (lambda v: pot.getHessianVectorProduct(coords, v)), 1
+    if (hasattr(pot, "getEnergyGradientHessian") and coords.size <= max_dense
+            and type(pot) not in _no_hessian_module):
+        try:
+            e, g, hess = pot.getEnergyGradientHessian(coords)
+        except ImportError:
+            _no_hessian_module.add(type(pot))
+            hess = None
+        except NotImplementedError:
+            #e.g. not implemented for periodic systems
+            hess = None
+        if hess is not None:
+            hess = np.asarray(hess).reshape(coords.size, coords.size)
+            return (lambda v: np.dot(hess, v)), 0
+    return None
+
+def _hasHessian(pot):
+    """return True if findLowestEigenVectorHessian can be used with pot"""
+    if not (hasattr(pot, "getEnergyGradientHessian") or
+            has_hessian_vector_product(pot)):
+        return False
+    try:
+        import scipy.sparse.linalg
+    except ImportError:
+        return False
+    return True
+
+def findLowestEigenVectorHessian(coords, pot, eigenvec0=None, orthogZeroEigs=0,
+                                 tol=1e-6, maxiter=None, max_dense=300):
+    """
+    find the lowest eigenvector with a Lanczos (ARPACK) solve using the Hessian
+    
+    The Hessian is used through pot.getHessianVectorProduct(coords, v) if the
+    potential overloads it, otherwise directly if pot has 
+    getEnergyGradientHessian and the system is small.  The zero eigenvectors
+    are projected out with orthogZeroEigs, so the Lanczos iterations work on
+    
+        P H P + shift * (1 - P)
+    
+    where P is the projection.  The shift is zero unless the lowest
+    eigenvalue is positive, in which case the zero eigenvectors are moved
+    above the top of the spectrum and the solve is repeated.
+
+    Parameters
+    ----------
+    coords, pot, eigenvec0, orthogZeroEigs :
+        see findLowestEigenVector
+    tol : float
+        the relative accuracy of the eigenvalue passed to
+        scipy.sparse.linalg.eigsh.  0 means machine precision
+    maxiter : int, optional
+        the maximum number of Arnoldi update iterations
+    max_dense : int
+        the dense Hessian is only computed for up to max_dense degrees of
+        freedom
+
+    Returns
+    -------
+    res : Result
+        with the same attributes as the result of findLowestEigenVector.  nfev
+        is the number of potential calls, rms is the rms residual of the
+        eigenvalue equation
+    
+    Raises
+    ------
+    NotImplementedError if the potential provides neither Hessian vector 
+    products nor, for small systems, Hessians
+    """
+    from scipy.sparse.linalg import LinearOperator, eigsh, ArpackNoConvergence
+    coords = np.asarray(coords, dtype=np.float64)
+    n = coords.size
+    hessian = _getHessianMatvec(coords, pot, max_dense)
+    if hessian is None:
+        raise NotImplementedError("the potential provides neither getHessianVectorProduct nor, for this system size, getEnergyGradientHessian")
+    hessian_matvec, cost = hessian
+    nfev = [1 - cost]
+    def matvec(v):
+        nfev[0] += cost
+        return hessian_matvec(v)
+
+    if orthogZeroEigs == 0:
+        orthogZeroEigs = orthogopt
+    if orthogZeroEigs is None:
+        project = lambda v: v
+    else:
+        #orthogopt works in place
+        project = lambda v: orthogZeroEigs(np.array(v, dtype=np.float64).reshape(-1), coords)
+
+    def solve(shift):
+        def op(v):
+            v = np.asarray(v).reshape(-1)
+            pv = project(v)
+            hv = project(matvec(pv))
+            if shift != 0.:
+                hv += shift * (v - pv)
+            return hv
+        A = LinearOperator((n, n), matvec=op, dtype=np.float64)
+        if eigenvec0 is None:
+            v0 = rotations.vec_random_ndim(coords.shape)
+        else:
+            v0 = np.array(eigenvec0, dtype=np.float64).reshape(-1)
+        v0 = project(v0)
+        if np.linalg.norm(v0) < 1e-10:
+            v0 = project(rotations.vec_random_ndim(coords.shape))
+        try:
+            vals, vecs = eigsh(A, k=1, which="SA", v0=v0, tol=tol, maxiter=maxiter)
+            success = True
+        except ArpackNoConvergence, e:
+            if len(e.eigenvalues) == 0:
+                raise
+            vals, vecs = e.eigenvalues, e.eigenvectors
+            success = False
+        return vals[0], vecs[:,0], success, op
+
+    eigenval, eigenvec, success, op = solve(0.)
+    if orthogZeroEigs is not None and np.linalg.norm(project(eigenvec)) < 0.5:
+        #all non zero eigenvalues are positive and eigsh found a zero eigenvector.
+        #move the zero eigenvalues above the largest eigenvalue and try again
+        A = LinearOperator((n, n), matvec=op, dtype=np.float64)
+        vmax = eigsh(A, k=1, which="LA", tol=1e-2, return_eigenvectors=False)[0]
+        eigenval, eigenvec, success, op = solve(2. * abs(vmax) + 1.)
+    
+    eigenvec = project(eigenvec)
+    eigenvec /= np.linalg.norm(eigenvec)
+    if eigenvec0 is not None and np.dot(eigenvec, np.reshape(eigenvec0, -1)) < 0.:
+        eigenvec *= -1.
+    residual = op(eigenvec) - eigenval * eigenvec
+
+    res = Result()
+    res.eigenval = eigenval
+    res.eigenvec = eigenvec.reshape(coords.shape)
+    res.rms = np.linalg.norm(residual) / np.sqrt(n)
+    res.nfev = nfev[0]
+    res.success = success
+    return res
+
+def findLowestEigenVector(coords, pot, eigenvec0=None, H0=None, orthogZeroEigs=0, 
+                          use_hessian=True, **kwargs):
     """
     find the eigenvector corresponding to the lowest eigenvalue using
     LowestEigPot and the LBFGS minimizer
@@ -112,6 +268,16 @@ def findLowestEigenVector(coords, pot, eigenvec0=None, H0=None, orthogZeroEigs=0
             orthogZeroEigs=0  : default behavior, assume translational and
                                 rotational symmetry
             orthogZeroEigs=None : the vector is unchanged
+    use_hessian : bool
+        if the potential provides the Hessian (getEnergyGradientHessian) 
+        or Hessian vector products (getHessianVectorProduct) find the 
+        eigenvector with findLowestEigenVectorHessian instead.  This is 
+        much faster than the minimization, which needs two gradient
+        evaluations per iteration.  The Lanczos solve only understands two
+        of the minimizer keyword arguments: tol is passed on as the relative
+        accuracy of the eigenvalue and nsteps as maxiter.  Any other keyword
+        argument (e.g. iprint or M) is ignored with a warning.  Pass 
+        use_hessian=False to always use the minimizer.
 
     kwargs : 
         any additional keyword arguments are passed to the minimizer
@@ -119,7 +285,28 @@ def findLowestEigenVector(coords, pot, eigenvec0=None, H0=None, orthogZeroEigs=0
     See Also
     --------
     FindTransitionState : uses this class
+    findLowestEigenVectorHessian : the Lanczos solve
     """
+    if use_hessian and _hasHessian(pot):
+        hessian_kwargs = dict()
+        if "tol" in kwargs:
+            hessian_kwargs["tol"] = kwargs["tol"]
+        if "nsteps" in kwargs:
+            hessian_kwargs["maxiter"] = kwargs["nsteps"]
+        try:
+            res = findLowestEigenVectorHessian(coords, pot, eigenvec0=eigenvec0, 
+                                               orthogZeroEigs=orthogZeroEigs,
+                                               **hessian_kwargs)
+        except NotImplementedError:
+            res = None
+        if res is not None:
+            unused = sorted(set(kwargs.keys()) - set(["tol", "nsteps"]))
+            if unused:
+                warnings.warn("findLowestEigenVector: the Hessian eigenvector search ignores the keyword arguments %s" % ", ".join(unused))
+            #pass H0 on unchanged for the next minimization
+            res.H0 = H0
+            return res
+
     #combine kwargs with defaults.lowestEigenvectorQuenchParams
     kwargs = dict(defaults.lowestEigenvectorQuenchParams.items() + 
                   kwargs.items())
@@ -313,6 +500,118 @@ def testpot3():
 
 
 
+import unittest
+class _HessianLJ(object):
+    """LJ with a finite difference Hessian, for testing"""
+    def __init__(self):
+        from pygmin.potentials.lj import LJ
+        self.lj = LJ()
+    def getEnergyGradient(self, coords):
+        return self.lj.getEnergyGradient(coords)
+    def getEnergyGradientHessian(self, coords):
+        e, g = self.lj.getEnergyGradient(coords)
+        hess = np.array([(self.lj.getGradient(coords + 1e-5 * d) - 
+                          self.lj.getGradient(coords - 1e-5 * d)) / 2e-5 
+                         for d in np.eye(coords.size)])
+        return e, g, (hess + hess.transpose()) / 2.
+
+class TestFindLowestEigenVectorHessian(unittest.TestCase):
+    def setUp(self):
+        from pygmin.optimize import mylbfgs
+        np.random.seed(0)
+        self.pot = _HessianLJ()
+        coords = np.random.uniform(-1, 1, 3*13) * 1.5
+        self.xmin = mylbfgs(coords, self.pot.getEnergyGradient, tol=1e-8)[0]
+
+    def check(self, coords):
+        res = findLowestEigenVector(coords, self.pot)
+        res2 = findLowestEigenVector(coords, self.pot, use_hessian=False)
+        self.assertTrue(res.success)
+        self.assertEqual(res.nfev, 1)
+        self.assertAlmostEqual(res.eigenval, res2.eigenval, delta=1e-3 * abs(res2.eigenval))
+        overlap = np.dot(res.eigenvec, res2.eigenvec) / np.linalg.norm(res2.eigenvec)
+        self.assertAlmostEqual(abs(overlap), 1., 4)
+        #the eigenvector is orthogonal to the zero eigenvectors
+        v = orthogopt(res.eigenvec.copy(), coords)
+        self.assertAlmostEqual(np.linalg.norm(v - res.eigenvec), 0., 6)
+        
+    def test_minimum(self):
+        #all non zero eigenvalues are positive
+        self.check(self.xmin)
+
+    def test_negative(self):
+        self.check(self.xmin + np.random.normal(0, 0.1, self.xmin.size))
+
+    def test_hessian_vector_product(self):
+        #LJ has analytic Hessian vector products
+        coords = self.xmin + np.random.normal(0, 0.1, self.xmin.size)
+        res = findLowestEigenVectorHessian(coords, self.pot.lj, tol=0.)
+        res2 = findLowestEigenVectorHessian(coords, self.pot)
+        self.assertGreater(res.nfev, 1)
+        self.assertAlmostEqual(res.eigenval, res2.eigenval, delta=1e-4 * abs(res2.eigenval))
+        #the minimization uses the products too
+        res3 = findLowestEigenVector(coords, self.pot.lj, use_hessian=False)
+        self.assertAlmostEqual(res.eigenval, res3.eigenval, delta=1e-3 * abs(res.eigenval))
+
+    def test_no_hessian(self):
+        #only the finite difference products of BasePotential
+        from pygmin.potentials import BasePotential
+        pot = BasePotential()
+        pot.getEnergyGradient = self.pot.getEnergyGradient
+        self.assertRaises(NotImplementedError, findLowestEigenVectorHessian, 
+                          self.xmin, pot)
+        res = findLowestEigenVector(self.xmin, pot)
+        self.assertGreater(res.eigenval, 0.)
+
+    def test_choice(self):
+        """Hessian vector products are preferred, the dense Hessian is only 
+        used for small systems, and only import errors are ignored"""
+        calls = []
+        class Pot(_HessianLJ):
+            def getEnergyGradientHessian(self, coords):
+                calls.append(1)
+                return _HessianLJ.getEnergyGradientHessian(self, coords)
+        pot = Pot()
+        pot.getHessianVectorProduct = pot.lj.getHessianVectorProduct
+        self.assertEqual(_getHessianMatvec(self.xmin, pot)[1], 1)
+        self.assertEqual(calls, [])
+        pot = Pot()
+        self.assertEqual(_getHessianMatvec(self.xmin, pot)[1], 0)
+        self.assertIs(_getHessianMatvec(self.xmin, pot, max_dense=10), None)
+        self.assertEqual(len(calls), 1)
+        
+        class NoModule(_HessianLJ):
+            def getEnergyGradientHessian(self, coords):
+                calls.append(1)
+                raise ImportError("not compiled")
+        del calls[:]
+        for i in range(2):
+            self.assertIs(_getHessianMatvec(self.xmin, NoModule()), None)
+        self.assertEqual(len(calls), 1)
+        _no_hessian_module.discard(NoModule)
+        
+        class Broken(_HessianLJ):
+            def getEnergyGradientHessian(self, coords):
+                raise ValueError
+        self.assertRaises(ValueError, _getHessianMatvec, self.xmin, Broken())
+
+    def test_kwargs(self):
+        """tol and nsteps reach the Lanczos solve, other minimizer options 
+        are ignored with a warning"""
+        coords = self.xmin + np.random.normal(0, 0.1, self.xmin.size)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            res = findLowestEigenVector(coords, self.pot, tol=1e-8, nsteps=1000)
+            self.assertEqual(len(w), 0)
+            res2 = findLowestEigenVector(coords, self.pot, iprint=1, M=4)
+            self.assertEqual(len(w), 1)
+            self.assertIn("M, iprint", str(w[0].message))
+        self.assertAlmostEqual(res.eigenval, res2.eigenval, delta=1e-4 * abs(res.eigenval))
+        #one Arnoldi iteration is too few to converge anything
+        from scipy.sparse.linalg import ArpackNoConvergence
+        self.assertRaises(ArpackNoConvergence, findLowestEigenVector, coords, 
+                          self.pot, nsteps=1, tol=0.)
+
 if __name__ == "__main__":
     #testpot1()
     testpot3()
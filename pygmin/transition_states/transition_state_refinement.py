@@ -96,6 +96,10 @@ class FindTransitionState(object):
     nsteps_tangent1, nsteps_tangent2 : int
         the number of iterations for tangent space minimization before and after
         the eigenvalue is deemed to be converged
+    use_hessian : bool
+        if the potential provides Hessians or Hessian vector products, find the
+        lowest eigenvector with a Lanczos solve instead of the minimization.
+        See findLowestEigenVector.
         
     
     Notes
@@ -149,6 +153,7 @@ class FindTransitionState(object):
                  demand_initial_negative_vec=True,
                  nsteps_tangent1=10,
                  nsteps_tangent2=100,
+                 use_hessian=True,
                  ):
         self.pot = pot
         self.coords = np.copy(coords)
@@ -161,6 +166,7 @@ class FindTransitionState(object):
         self.orthogZeroEigs = orthogZeroEigs
         self.iprint = iprint
         self.lowestEigenvectorQuenchParams = lowestEigenvectorQuenchParams
+        self.use_hessian = use_hessian
         self.max_uphill_step = max_uphill_step
         self.tangent_space_quencher = defaults.tangentSpaceQuenchRoutine
         self.tangent_space_quench_params = dict(defaults.tangentSpaceQuenchParams.items() +
@@ -323,6 +329,7 @@ class FindTransitionState(object):
     def _getLowestEigenVector(self, coords, i):
         res = findLowestEigenVector(coords, self.pot, H0=self.H0_leig, eigenvec0=self.eigenvec, 
                                     orthogZeroEigs=self.orthogZeroEigs,
+                                    use_hessian=self.use_hessian,
                                     **self.lowestEigenvectorQuenchParams)
         self.leig_result = res
         
@@ -20,6 +20,11 @@ benchmarking tool
     :toctree: generated/
 
     pygmin.utils.benchmark.QuenchBenchmark
+    pygmin.utils.benchmark.QuenchBenchmarkSuite
+
+QuenchBenchmarkSuite runs all minimizers on a standard set of systems from
+fixed random seeds and writes the results to a json file, see 
+scripts/benchmark/quench_benchmark.py
 
 Coords Adapter
 --------------    
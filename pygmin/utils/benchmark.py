@@ -6,8 +6,10 @@ Created on 6 Apr 2012
 
 import numpy as np
 import copy
+import time
 
-__all__ = ["QuenchBenchmark"]
+__all__ = ["QuenchBenchmark", "QuenchBenchmarkSuite", "standard_systems",
+           "standard_minimizers"]
 
 class PotentialWrapper(object):
     def __init__(self, potential):
@@ -34,7 +36,21 @@ class PotentialWrapper(object):
         
 class QuenchBenchmark(object):
     '''
-    classdocs
+    compare minimizers on one potential
+    
+    Each call to run() quenches the same starting configuration with every 
+    minimizer and appends one entry per minimizer to self.results.  An entry 
+    is a dict with the keys
+    
+        label, energy, rms, nfev, iterations, time
+    
+    rms is recomputed from the gradient at the final coordinates, because
+    the minimizers do not all report the same quantity.  nfev is counted by
+    wrapping the potential.  The energy of the starting configuration is 
+    evaluated before each minimizer is called, so it is the first entry in 
+    the energies used by plot(), but it is not counted in nfev or time.  
+    iterations is None if it can not be extracted from the return value of 
+    the minimizer (see addMinimizer).
     '''
 
 
@@ -44,21 +60,51 @@ class QuenchBenchmark(object):
         '''
         self.potential=PotentialWrapper(potential)
         self.minimizer=[]
+        self.results=[]
+        
+    def addMinimizer(self, label, minimizer, iterations=None, **kwargs):
+        """
+        add a minimizer to the benchmark
         
-    def addMinimizer(self, label, minimizer):
-        self.minimizer.append([label, minimizer, 0.0, None])
+        Parameters
+        ----------
+        label : string
+        minimizer : callable
+            minimizer(coords, getEnergyGradient, **kwargs)
+        iterations : callable, optional
+            returns the number of iterations from the return value of
+            minimizer.  By default it is taken from the Result object
+            which some minimizers return as the fifth element.
+        kwargs :
+            passed to the minimizer
+        """
+        if iterations is None:
+            iterations = _iterations_from_result
+        self.minimizer.append([label, minimizer, 0.0, None, iterations, kwargs])
         
-    def run(self, Emin,coords):
+    def run(self, Emin,coords, verbose=True):
         for minimizer in self.minimizer:
             self.potential.reset()
-            print "Testing Minimizer " + minimizer[0]
+            if verbose:
+                print "Testing Minimizer " + minimizer[0]
             
             E,grad = self.potential.getEnergyGradient(coords)
-            #self.potential.energies.append(E)
-            x, E, tmp, tmp = minimizer[1](coords, self.potential.getEnergyGradient)
+            t0 = time.time()
+            ret = minimizer[1](coords.copy(), self.potential.getEnergyGradient, **minimizer[5])
+            walltime = time.time() - t0
+            x, E = ret[0], ret[1]
+            nfev = len(self.potential.energies) - 1
             minimizer[2] = E
             minimizer[3] = np.array(self.potential.energies).copy()-Emin
-            print "Minimizer " + minimizer[0] + ": " + str(E)
+            
+            g = self.potential.potential.getEnergyGradient(x)[1]
+            rms = np.linalg.norm(g) / np.sqrt(len(g))
+            self.results.append(dict(label=minimizer[0], energy=float(E),
+                                     rms=float(rms), nfev=nfev,
+                                     iterations=minimizer[4](ret),
+                                     time=walltime))
+            if verbose:
+                print "Minimizer " + minimizer[0] + ": " + str(E)
             
     def plot(self):
         import pylab as pl
@@ -71,6 +117,244 @@ class QuenchBenchmark(object):
         pl.ylabel("energy")
         pl.show()
 
+def _iterations_from_result(ret):
+    try:
+        return int(ret[4].nsteps)
+    except (IndexError, AttributeError):
+        return None
+
+def _fire_iterations(ret):
+    #the fire wrapper returns the number of iterations in place of funcalls
+    return int(ret[3])
+
+#########################################################################
+# the standard benchmark
+#########################################################################
+
+def standard_minimizers(tol=1e-4):
+    """
+    return the list of minimizers used in the standard benchmark
+    
+    each element is (label, minimizer, iterations, kwargs), i.e. the
+    arguments to QuenchBenchmark.addMinimizer
+    """
+    from pygmin.optimize import _quench as quench
+    kwargs = dict(tol=tol)
+    return [("lbfgs_fast", quench.lbfgs_fast, None, kwargs),
+            ("lbfgs_py", quench.lbfgs_py, None, kwargs),
+            ("mylbfgs", quench.mylbfgs, None, kwargs),
+            ("fire", quench.fire, _fire_iterations, kwargs),
+            ("lbfgs_scipy", quench.lbfgs_scipy, None, kwargs),
+            ("cg", quench.cg, None, kwargs),
+            ("bfgs", quench.bfgs, None, kwargs),
+            ]
+
+def _random_cluster(natoms, density=1.):
+    """random atoms in a cube"""
+    return np.random.uniform(-1, 1, 3*natoms) * (float(natoms) / density)**(1./3) / 2
+
+def _random_spins(nspins):
+    from pygmin.potentials.heisenberg_spin import make2dVector
+    from pygmin.utils.rotations import vec_random
+    return np.array([make2dVector(vec_random()) for i in range(nspins)]).reshape(-1)
+
+def standard_systems(seed=0):
+    """
+    return the list of systems used in the standard benchmark
+    
+    each element is (name, potential, get_coords) where get_coords() returns
+    a random starting configuration.  The random parameters of the disordered
+    systems are generated from seed, so they are the same every time.
+    """
+    from pygmin.potentials.lj import LJ
+    from pygmin.potentials.ljpshiftfast import LJpshift
+    from pygmin.potentials.xyspin1d import XYModel
+    from pygmin.potentials.heisenberg_spin import HeisenbergModel
+    from pygmin.utils.neighbor_list import makeBLJNeighborListPot
+    
+    systems = []
+    for natoms in [13, 38, 75]:
+        systems.append(("LJCluster%d" % natoms, LJ(), 
+                        lambda natoms=natoms: _random_cluster(natoms)))
+    
+    natoms = 38
+    systems.append(("BLJCluster%d" % natoms, LJpshift(natoms, int(0.8*natoms)),
+                    lambda natoms=natoms: _random_cluster(natoms)))
+    
+    natoms = 64
+    boxl = (natoms / 1.2)**(1./3)
+    systems.append(("BLJBulk%d" % natoms, 
+                    makeBLJNeighborListPot(natoms, boxl=boxl),
+                    lambda natoms=natoms, boxl=boxl: np.random.uniform(0, boxl, 3*natoms)))
+    
+    np.random.seed(seed)
+    nspins = 32
+    systems.append(("XYModel%d" % nspins, XYModel(nspins),
+                    lambda nspins=nspins: np.random.uniform(-np.pi, np.pi, nspins)))
+    
+    np.random.seed(seed)
+    L = 4
+    systems.append(("HeisenbergModel%dx%d" % (L, L), HeisenbergModel(dim=[L, L]),
+                    lambda L=L: _random_spins(L*L)))
+    return systems
+
+class QuenchBenchmarkSuite(object):
+    """
+    run all minimizers on a set of standard systems
+    
+    For each system nconf random starting configurations are generated from 
+    a fixed seed and quenched with every minimizer, so the results are 
+    comparable between runs and between versions of pygmin.
+    
+    Parameters
+    ----------
+    systems : list, optional
+        see standard_systems()
+    minimizers : list, optional
+        see standard_minimizers()
+    nconf : int
+        the number of starting configurations per system
+    seed : int
+        the seed for the random number generator
+    tol : float
+        the rms gradient tolerance passed to the standard minimizers
+    
+    Examples
+    --------
+    >>> suite = QuenchBenchmarkSuite(nconf=5)
+    >>> suite.run()
+    >>> suite.write("quench_benchmark.json")
+    """
+    def __init__(self, systems=None, minimizers=None, nconf=5, seed=0, tol=1e-4):
+        if systems is None:
+            systems = standard_systems(seed)
+        if minimizers is None:
+            minimizers = standard_minimizers(tol)
+        self.systems = systems
+        self.minimizers = minimizers
+        self.nconf = nconf
+        self.seed = seed
+        self.tol = tol
+        self.results = []
+    
+    def run(self, verbose=True):
+        """run the benchmark.  The results are stored in self.results"""
+        self.results = []
+        for name, potential, get_coords in self.systems:
+            bench = QuenchBenchmark(potential)
+            for label, minimizer, iterations, kwargs in self.minimizers:
+                bench.addMinimizer(label, minimizer, iterations, **kwargs)
+            np.random.seed(self.seed)
+            coordslist = [get_coords() for iconf in range(self.nconf)]
+            for iconf, coords in enumerate(coordslist):
+                bench.results = []
+                bench.run(0., coords, verbose=False)
+                for res in bench.results:
+                    res["system"] = name
+                    res["conf"] = iconf
+                    res["ndof"] = len(coords)
+                self.results += bench.results
+            if verbose:
+                self.print_summary(name)
+        return self.results
+    
+    def summary(self):
+        """
+        return the results averaged over the starting configurations
+        
+        Returns
+        -------
+        summary : list of dicts
+            with keys system, label, time, nfev, iterations, rms, energy.
+            iterations is None if not reported by the minimizer
+        """
+        summary = []
+        keys = []
+        for res in self.results:
+            key = (res["system"], res["label"])
+            if key not in keys:
+                keys.append(key)
+        for system, label in keys:
+            rlist = [r for r in self.results if r["system"] == system and r["label"] == label]
+            entry = dict(system=system, label=label)
+            for k in ["time", "nfev", "rms", "energy"]:
+                entry[k] = float(np.mean([r[k] for r in rlist]))
+            its = [r["iterations"] for r in rlist]
+            if None in its:
+                entry["iterations"] = None
+            else:
+                entry["iterations"] = float(np.mean(its))
+            summary.append(entry)
+        return summary
+    
+    def print_summary(self, system=None):
+        for s in self.summary():
+            if system is not None and s["system"] != system:
+                continue
+            its = s["iterations"]
+            if its is None: its = float("nan")
+            print "%-22s %-12s time %9.4f nfev %9.1f iterations %9.1f rms %9.3g energy %14.6f" % (
+                s["system"], s["label"], s["time"], s["nfev"], its, s["rms"], s["energy"])
+    
+    def write(self, fname):
+        """
+        write the results to fname in json format
+        
+        The file contains the parameters of the benchmark, the result of 
+        every quench and the summary
+        """
+        import json
+        import platform
+        data = dict(date=time.strftime("%Y-%m-%d %H:%M:%S"),
+                    host=platform.node(),
+                    python=platform.python_version(),
+                    numpy=np.__version__,
+                    nconf=self.nconf,
+                    seed=self.seed,
+                    tol=self.tol,
+                    results=self.results,
+                    summary=self.summary())
+        with open(fname, "w") as fout:
+            json.dump(data, fout, indent=1, sort_keys=True)
+
+import unittest
+class TestQuenchBenchmarkSuite(unittest.TestCase):
+    def test_write(self):
+        """a small run of the suite writes the documented json"""
+        import json
+        import os
+        import tempfile
+        suite = QuenchBenchmarkSuite(systems=standard_systems()[:1], nconf=1)
+        suite.run(verbose=False)
+        fd, fname = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            suite.write(fname)
+            with open(fname) as fin:
+                data = json.load(fin)
+        finally:
+            os.remove(fname)
+        for key in ["date", "host", "python", "numpy", "nconf", "seed", "tol", 
+                    "results", "summary"]:
+            self.assertIn(key, data)
+        self.assertEqual(data["nconf"], 1)
+        nmin = len(standard_minimizers())
+        self.assertEqual(len(data["results"]), nmin)
+        self.assertEqual(len(data["summary"]), nmin)
+        for res in data["results"]:
+            self.assertEqual(set(res.keys()), set(["label", "energy", "rms", "nfev", 
+                    "iterations", "time", "system", "conf", "ndof"]))
+            self.assertEqual(res["system"], "LJCluster13")
+            self.assertEqual(res["ndof"], 39)
+            self.assertGreater(res["nfev"], 0)
+        for s in data["summary"]:
+            self.assertEqual(set(s.keys()), set(["system", "label", "time", "nfev", 
+                                                 "iterations", "rms", "energy"]))
+        #the lbfgs minimizers reach the tolerance
+        for res in data["results"]:
+            if res["label"].startswith("lbfgs"):
+                self.assertLess(res["rms"], 1e-3)
+
 if __name__ == "__main__":
     import pygmin.potentials.lj as lj
     import scipy.optimize
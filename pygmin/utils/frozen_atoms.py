@@ -71,6 +71,19 @@ class MultiComponentSystemFreeze(basepot):
             gradtot += grad
         return Etot, gradtot
 
+    @property
+    def buildcount(self):
+        return sum([pot.buildcount for pot in self.potentials])
+    def anchor(self, coords):
+        for pot in self.potentials:
+            pot.anchor(coords)
+    def getState(self):
+        """the frozen-frozen lists never change, so only save the others"""
+        return [pot.getState() for pot in self.potentials]
+    def setState(self, state):
+        for pot, s in zip(self.potentials, state):
+            pot.setState(s)
+
 
 
 def makeBLJNeighborListPotFreeze(natoms, frozenlist, ntypeA = None, rcut = 2.5, boxl=None):
@@ -204,6 +217,16 @@ class FreezePot(basepot):
         grad[self.frozen1d] = 0.
         return e, grad
 
+    @property
+    def buildcount(self):
+        return self.pot.buildcount
+    def anchor(self, coords):
+        self.pot.anchor(coords)
+    def getState(self):
+        return self.pot.getState()
+    def setState(self, state):
+        self.pot.setState(state)
+
 
 #########################################################
 #testing stuff below here
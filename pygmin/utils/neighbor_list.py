@@ -12,7 +12,9 @@ classes to build and maintain neighborlists
     NeighborListSubsetBuild
     NeighborListPotentialBuild
     NeighborListPotentialMulti
+    MarkovStateNeighborLists
     makeBLJNeighborListPot
+    build_neighbor_list_cells
 
     
 """
@@ -27,7 +29,138 @@ import pygmin.potentials.ljpshift as ljpshift
 
 __all__ = ["NeighborList", "NeighborListSubset", "NeighborListPotential", "MultiComponentSystem", 
            "makeBLJNeighborListPot", "NeighborListSubsetBuild", "NeighborListPotentialBuild", 
-           "NeighborListPotentialMulti"]
+           "NeighborListPotentialMulti", "MarkovStateNeighborLists", 
+           "build_neighbor_list_cells"]
+
+def _cell_neighbor_offsets(ncells, periodic, half=False):
+    """
+    return the distinct offsets to the neighboring cells
+    
+    With periodic boundaries and fewer than 3 cells in a dimension the 
+    offsets -1 and +1 refer to the same cell, so they are only used once.
+    If half is True only one of each pair of opposite offsets is returned.
+    This is only possible if there are no such duplicates.
+    """
+    offsets = []
+    for n in ncells:
+        if periodic and n < 3:
+            offsets.append(range(n))
+        else:
+            offsets.append([-1, 0, 1])
+    offsets = [(dx, dy, dz) for dx in offsets[0] for dy in offsets[1] for dz in offsets[2]]
+    if half:
+        offsets = [o for o in offsets if o >= (0, 0, 0)]
+    return offsets
+
+def build_neighbor_list_cells(coords, rlist, Alist, Blist=None, boxl=None):
+    """
+    build a neighbor list using a cell list
+    
+    The atoms are binned into cells with side length at least rlist, so 
+    only atoms in neighboring cells need to be compared.  The cost scales 
+    linearly with the number of atoms rather than quadratically.
+    
+    Parameters
+    ----------
+    coords : array
+        the coordinates of all the atoms
+    rlist : float
+        the atoms closer than rlist are put in the list
+    Alist : list of ints
+        the list of atoms that are interacting
+    Blist : list of ints, optional
+        the list of atoms that are interacting with Alist.  If None then the
+        atoms in Alist interact with each other.
+    boxl : float, optional
+        if not None, then the system is in a periodic box of size boxl
+    
+    Returns
+    -------
+    neib_list : integer array of shape (nlist, 2)
+        the neighbor pairs in no particular order.  If Blist is None the 
+        larger index of each pair is first, otherwise the atom from Alist 
+        is first.
+    """
+    x = np.reshape(coords, [-1,3])
+    rlist2 = rlist**2
+    Alist = np.asarray(Alist, np.int64)
+    if Blist is None:
+        Blist = Alist
+        onelist = True
+    else:
+        Blist = np.asarray(Blist, np.int64)
+        onelist = False
+    periodic = boxl is not None
+    
+    #assign each atom to a cell
+    if periodic:
+        n = max(int(boxl / rlist), 1)
+        ncells = np.array([n, n, n])
+        xw = x - boxl * np.floor(x / boxl)
+        cells = np.minimum((xw * (n / boxl)).astype(np.int64), n - 1)
+    else:
+        xlist = x[np.concatenate([Alist, Blist])]
+        xmin = xlist.min(0)
+        extent = xlist.max(0) - xmin
+        #if the atoms are very spread out use larger cells so that the 
+        #number of empty cells stays bounded
+        cellsize = rlist
+        while np.prod(np.floor(extent / cellsize) + 1) > 8 * len(xlist) + 27:
+            cellsize *= 2.
+        ncells = np.floor(extent / cellsize).astype(np.int64) + 1
+        cells = np.minimum(((x - xmin) / cellsize).astype(np.int64), ncells - 1)
+    cellA = cells[Alist]
+    
+    #sort the B atoms by cell
+    cellidB = np.ravel_multi_index(cells[Blist].T, ncells)
+    order = np.argsort(cellidB, kind="mergesort")
+    Bsorted = Blist[order]
+    counts = np.bincount(cellidB, minlength=np.prod(ncells))
+    starts = np.cumsum(counts) - counts
+    
+    #for a single list, each pair of cells only has to be visited once
+    half = onelist and not (periodic and np.any(ncells < 3))
+    pairs = []
+    for offset in _cell_neighbor_offsets(ncells, periodic, half):
+        ncell = cellA + offset
+        if periodic:
+            ncell %= ncells
+            iA = Alist
+        else:
+            valid = np.all((ncell >= 0) & (ncell < ncells), axis=1)
+            ncell = ncell[valid]
+            iA = Alist[valid]
+        ncellid = np.ravel_multi_index(ncell.T, ncells)
+        
+        #generate all candidate pairs between the A atoms and the B atoms 
+        #in the neighboring cell
+        n = counts[ncellid]
+        ntot = n.sum()
+        if ntot == 0: continue
+        i = np.repeat(iA, n)
+        first = np.cumsum(n) - n
+        within = np.arange(ntot) - np.repeat(first, n)
+        j = Bsorted[np.repeat(starts[ncellid], n) + within]
+        if onelist and (not half or offset == (0, 0, 0)):
+            keep = i > j
+            i = i[keep]
+            j = j[keep]
+        
+        dr = x[i] - x[j]
+        if periodic:
+            dr -= boxl * np.round(dr / boxl)
+        r2 = (dr**2).sum(1)
+        keep = r2 <= rlist2
+        pairs.append(np.column_stack([i[keep], j[keep]]))
+    
+    if len(pairs) == 0:
+        return np.zeros([0,2], np.int64)
+    pairs = np.concatenate(pairs).astype(np.int64)
+    if half:
+        #the pairs from the half shell offsets can have either order
+        pairs = np.column_stack([pairs.max(1), pairs.min(1)])
+    return pairs
+
 
 class NeighborList(object):
     """
@@ -45,48 +178,72 @@ class NeighborList(object):
     boxl : 
         if not None, then the system is in a periodic box of size boxl
 
+    See Also
+    --------
+    build_neighbor_list_cells : the list is built with a cell list
     """
     def __init__(self, natoms, rcut, rskin = 0.5, boxl = None):
         self.buildcount = 0
-        self.oldcoords = np.zeros([natoms,3])
+        self.natoms = natoms
+        self.oldcoords = None
         self.rcut = rcut
         self.rskin = rskin
         self.redo_displacement = self.rskin / 2.
         self.rlist = self.rcut + self.rskin
         self.rlist2 = self.rlist**2
+        self.boxl = boxl
         
-        #natoms = len(coords) / 3
-        self.neib_list = np.array(natoms*(natoms-1), 2)
-        
-        #self.buildList(coords)
+        self.neib_list = np.zeros([0,2], np.int64)
+        self.nlist = 0
     
     def buildList(self, coords):
         """
-        return a list of neighbor pairs
+        rebuild the list of neighbor pairs
         """
         self.buildcount += 1
-        coords = np.reshape(coords, [-1,3])
-        self.oldcoords = np.copy(coords)
-        natoms = len(coords)/3
-        nlist = 0
-        for i in range(natoms):
-            for j in range(i):
-                R2 = sum((coords[i,:] - coords[j,:])**2)
-                if R2 <= self.rlist2:
-                    self.neib_list[nlist,0] = i 
-                    self.neib_list[nlist,1] = j
-                    nlist += 1
-        self.nlist = nlist
+        self.oldcoords = np.copy(np.reshape(coords, [-1,3]))
+        self.neib_list = build_neighbor_list_cells(coords, self.rlist, 
+                                np.arange(self.natoms), boxl=self.boxl)
+        self.nlist = len(self.neib_list)
     
-    def needNewList(self, coords):
+    def needNewList(self, coords, drmax=None):
+        """
+        check if any atom has moved further than drmax (default 
+        redo_displacement) since the list was built
+        """
+        if drmax is None:
+            drmax = self.redo_displacement
+        if self.oldcoords is None:
+            return True
         coords = np.reshape(coords, [-1,3])
-        maxR2 = np.max( ((coords - self.oldcoords)**2).sum(1) )
-        return maxR2 > self.redo_displacement**2
+        dr = coords - self.oldcoords
+        if self.boxl is not None:
+            dr -= self.boxl * np.round(dr / self.boxl)
+        maxR2 = np.max( (dr**2).sum(1) )
+        return maxR2 > drmax**2
 
     def getList(self, coords):
         if self.needNewList(coords):
             self.buildList(coords)
         return self.neib_list[:self.nlist]
+
+    def anchor(self, coords):
+        """
+        rebuild the list at coords unless it was built close to coords
+        
+        After this any atom can move almost redo_displacement/2 away from
+        coords before the list must be rebuilt.
+        """
+        if self.needNewList(coords, self.redo_displacement / 2.):
+            self.buildList(coords)
+
+    def getState(self):
+        """return a snapshot of the list which can be restored with setState"""
+        return self.oldcoords, self.neib_list, self.nlist
+    
+    def setState(self, state):
+        """restore a list saved with getState"""
+        self.oldcoords, self.neib_list, self.nlist = state
                 
             
 class NeighborListSubset(object):
@@ -114,8 +271,17 @@ class NeighborListSubset(object):
         be avoided.
     boxl : 
         if not None, then the system is in a periodic box of size boxl
+    cell_threshold : int
+        if the number of atoms in Alist and Blist is larger than this the
+        list is built with a cell list, which scales linearly with the 
+        number of atoms.  Otherwise all pairs are checked.
+
+    See Also
+    --------
+    build_neighbor_list_cells
     """
-    def __init__(self, natoms, rcut, Alist, Blist = None, rskin = 0.5, boxl = None):
+    def __init__(self, natoms, rcut, Alist, Blist = None, rskin = 0.5, boxl = None,
+                 cell_threshold=3000):
         self.buildcount = 0
         self.count = 0
         self.rcut = rcut
@@ -141,9 +307,15 @@ class NeighborListSubset(object):
 
         if self.onelist:
             listmaxlen = len(self.Alist)*(len(self.Alist)-1)/2
+            self.use_cells = len(self.Alist) > cell_threshold
         else:
             listmaxlen = len(self.Alist)*len(self.Blist)
-        self.neib_list = np.zeros([listmaxlen, 2], np.integer)
+            self.use_cells = len(self.Alist) + len(self.Blist) > cell_threshold
+        if self.use_cells:
+            #the all pairs list would be too large
+            self.neib_list = np.zeros([0, 2], np.int64)
+        else:
+            self.neib_list = np.zeros([listmaxlen, 2], np.integer)
         self.nlistmax = listmaxlen
         self.nlist = 0
         #print "shape neib_list", np.shape(self.neib_list)
@@ -169,6 +341,11 @@ class NeighborListSubset(object):
         self.buildcount += 1
         self.oldcoords = np.copy(np.reshape(coords,[-1,3]))
 #        raw_input("press enter to continue: onelist %d, len(alist)=%d, len(coords)=%d" % (self.onelist, len(self.Alist), len(coords)))
+        if self.use_cells:
+            self.neib_list = build_neighbor_list_cells(coords, self.rlist, 
+                                    self.Alist, self.Blist, boxl=self.boxl)
+            self.nlist = len(self.neib_list)
+            return
         if self.onelist:
             #nlist = _fortran_utils.build_neighbor_list1(
             #        coords, self.Alist, neib_list, self.rlist2)
@@ -237,17 +414,21 @@ class NeighborListSubset(object):
         #    print "nlist not from fortran", nlist, self.neib_list[0,:], self.neib_list[self.nlist-1,:]
 
     
-    def needNewList(self, coords):
+    def needNewList(self, coords, drmax=None):
         """
         check if any atom has moved far enough that we need to redo the neighbor list
+        
+        drmax is the maximum displacement, it defaults to redo_displacement
         """
+        if drmax is None:
+            drmax = self.redo_displacement
         oldcoords = self.oldcoords.reshape(-1)
         boxl = self.boxl
         if boxl is None:
             boxl = 1.
 #        raw_input("press enter to continue: onelist %d, len(atomlist)=%d, len(coords)=%d" % (self.onelist, len(self.atomlist), len(coords)))
         rebuild = _fortran_utils.check_neighbor_lists(oldcoords, coords, self.atomlist,
-                                                      self.redo_displacement, self.periodic, 
+                                                      drmax, self.periodic, 
                                                       boxl)
         rebuild = bool(rebuild)
         if False:
@@ -279,6 +460,29 @@ class NeighborListSubset(object):
             self.buildList(coords)
         return self.neib_list[:self.nlist,:]
 
+    def anchor(self, coords):
+        """
+        rebuild the list at coords unless it was built close to coords
+        
+        After this any atom can move almost redo_displacement/2 away from
+        coords before the list must be rebuilt.
+        """
+        if self.needNewList(coords, self.redo_displacement / 2.):
+            self.buildList(coords)
+
+    def getState(self):
+        """
+        return a snapshot of the list which can be restored with setState
+        
+        The arrays are replaced, not modified, when the list is rebuilt,
+        so no copies are made
+        """
+        return self.oldcoords, self.neib_list, self.nlist
+    
+    def setState(self, state):
+        """restore a list saved with getState"""
+        self.oldcoords, self.neib_list, self.nlist = state
+
 
 class NeighborListPotential(basepot):
     """
@@ -302,6 +506,16 @@ class NeighborListPotential(basepot):
         list = self.neighborList.getList(coords)
         return self.pot.getEnergyGradientList(coords, list)
 
+    @property
+    def buildcount(self):
+        return self.neighborList.buildcount
+    def anchor(self, coords):
+        self.neighborList.anchor(coords)
+    def getState(self):
+        return self.neighborList.getState()
+    def setState(self, state):
+        self.neighborList.setState(state)
+
 
 class NeighborListSubsetBuild(basepot):
     """
@@ -333,8 +547,12 @@ class NeighborListSubsetBuild(basepot):
         be avoided.
     boxl : 
         if not None, then the system is in a periodic box of size boxl
+    cell_threshold : int
+        if the number of atoms in Alist and Blist is larger than this the
+        list is built with a cell list.  See NeighborListSubset
     """
-    def __init__(self, natoms, rcut, Alist, Blist = None, rskin = 0.5, boxl = None):
+    def __init__(self, natoms, rcut, Alist, Blist = None, rskin = 0.5, boxl = None,
+                 cell_threshold=3000):
         self.natoms = natoms
         self.buildcount = 0
         self.count = 0
@@ -360,8 +578,10 @@ class NeighborListSubsetBuild(basepot):
 
         if self.onelist:
             listmaxlen = len(self.Alist)*(len(self.Alist)-1)/2
+            self.use_cells = len(self.Alist) > cell_threshold
         else:
             listmaxlen = len(self.Alist)*len(self.Blist)
+            self.use_cells = len(self.Alist) + len(self.Blist) > cell_threshold
         #self.neib_list = np.zeros([listmaxlen, 2], np.integer)
         self.nlistmax = listmaxlen
         #self.nlist = 0
@@ -377,6 +597,9 @@ class NeighborListSubsetBuild(basepot):
     def buildList(self, coords):
         #neib_list = np.reshape(self.neib_list, -1)
         self.buildcount += 1
+        if self.use_cells:
+            return build_neighbor_list_cells(coords, self.rlist, self.Alist, 
+                                             self.Blist, boxl=self.boxl)
         if self.onelist:
             #nlist = _fortran_utils.build_neighbor_list1(
             #        coords, self.Alist, neib_list, self.rlist2)
@@ -425,6 +648,15 @@ class NeighborListPotentialBuild(basepot):
     def getEnergyGradient(self, coords):
         return self.pot.getEnergyGradientList(coords, self.list)
 
+    @property
+    def buildcount(self):
+        return self.neighborList.buildcount
+    def getState(self):
+        return getattr(self, "list", None)
+    def setState(self, state):
+        if state is not None:
+            self.list = state
+
 
 class NeighborListPotentialMulti(basepot):
     """
@@ -472,27 +704,46 @@ class NeighborListPotentialMulti(basepot):
         self.count = 0
 
     
-    def needNewList(self, coords):
+    def needNewList(self, coords, drmax=None):
+        if drmax is None:
+            drmax = self.redo_displacement
         coords = np.reshape(coords, [-1,3])
         if self.periodic:
             #only check periodic boundary conditions for the atoms that fail the normal test
-            indices = np.where( ((coords - self.oldcoords)**2).sum(1) > self.redo_displacement**2 )[0]
+            indices = np.where( ((coords - self.oldcoords)**2).sum(1) > drmax**2 )[0]
             if len(indices) == 0:
                 return False
             dr = coords[indices,:] - self.oldcoords[indices,:]
             dr -= self.boxl * np.round(dr / self.boxl)
-            return np.any( dr.sum(1) > self.redo_displacement**2 ) 
+            return np.any( (dr**2).sum(1) > drmax**2 ) 
         else:
-            return np.any( ((coords - self.oldcoords)**2).sum(1) > self.redo_displacement**2 )
+            return np.any( ((coords - self.oldcoords)**2).sum(1) > drmax**2 )
 
+    def _rebuild(self, coords):
+        self.buildcount += 1
+        self.oldcoords = np.copy(coords).reshape([-1,3])
+        for pot in self.potentials:
+            pot.buildList(coords)
     
     def update(self, coords):
         self.count += 1
         if self.needNewList(coords):
-            self.buildcount += 1
-            self.oldcoords = np.copy(coords).reshape([-1,3])
-            for pot in self.potentials:
-                pot.buildList(coords)
+            self._rebuild(coords)
+    
+    def anchor(self, coords):
+        """rebuild the lists at coords unless they were built close to coords"""
+        if self.needNewList(coords, self.redo_displacement / 2.):
+            self._rebuild(coords)
+    
+    def getState(self):
+        """return a snapshot of the lists which can be restored with setState"""
+        return self.oldcoords, [pot.getState() for pot in self.potentials]
+    
+    def setState(self, state):
+        """restore the lists saved with getState"""
+        self.oldcoords, states = state
+        for pot, s in zip(self.potentials, states):
+            pot.setState(s)
     
     def getEnergy(self, coords):
         self.update(coords)
@@ -532,6 +783,25 @@ class MultiComponentSystem(basepot):
         for pot in self.potentials:
             E += pot.getEnergy(coords)
         return E
+
+    @property
+    def buildcount(self):
+        """the total number of times the neighbor lists have been rebuilt"""
+        return sum([getattr(pot, "buildcount", 0) for pot in self.potentials])
+    def anchor(self, coords):
+        """rebuild the neighbor lists at coords if they were built far from coords"""
+        for pot in self.potentials:
+            if hasattr(pot, "anchor"):
+                pot.anchor(coords)
+    def getState(self):
+        """return a snapshot of the neighbor lists of all potentials"""
+        return [pot.getState() if hasattr(pot, "getState") else None 
+                for pot in self.potentials]
+    def setState(self, state):
+        """restore the neighbor lists saved with getState"""
+        for pot, s in zip(self.potentials, state):
+            if s is not None:
+                pot.setState(s)
     def getEnergyGradient(self, coords):
         Etot = 0.
         gradtot = np.zeros(np.shape(coords))
@@ -541,6 +811,65 @@ class MultiComponentSystem(basepot):
             gradtot += grad
         return Etot, gradtot
 
+class MarkovStateNeighborLists(object):
+    """
+    keep the neighbor lists of the Markov state in basin hopping
+    
+    Each basin hopping step starts from a small perturbation of the current
+    Markov state, but after a rejected step the neighbor lists refer to the 
+    rejected trial minimum and often have to be rebuilt.  When a step is 
+    accepted this class makes sure the lists are centered on the new Markov 
+    state (see anchor()) and saves a snapshot of them.  When a step is
+    rejected the snapshot is restored.  As long as the step size is small
+    compared to the skin, steps from the Markov state then need no 
+    rebuild.  The lists still check whether they are valid for the 
+    coordinates they are used with, so this never changes the energies.
+    
+    Use it as an event after each step, e.g.::
+    
+        pot = makeBLJNeighborListPot(natoms, boxl=boxl)
+        bh = BasinHopping(coords, pot, takestep)
+        nlevent = MarkovStateNeighborLists(pot)
+        bh.addEventAfterStep(nlevent)
+    
+    Parameters
+    ----------
+    pot :
+        the potential.  It must implement getState() and setState(state), 
+        and should implement anchor(coords) and have the attribute buildcount,
+        as the neighbor list potentials in this module do.
+    anchor : bool
+        if False the lists are not rebuilt at the Markov state when a step
+        is accepted.  The snapshot is taken as is.
+    
+    Attributes
+    ----------
+    buildcounts : list
+        the number of neighbor list rebuilds in each step
+    nrestored : int
+        the number of times the lists of the Markov state were restored
+    """
+    def __init__(self, pot, anchor=True):
+        self.pot = pot
+        self.anchor = anchor and hasattr(pot, "anchor")
+        self.state = pot.getState()
+        self.buildcounts = []
+        self.nrestored = 0
+        self._lastcount = getattr(pot, "buildcount", 0)
+
+    def __call__(self, energy, coords, acceptstep):
+        if acceptstep:
+            if self.anchor:
+                self.pot.anchor(coords)
+            self.state = self.pot.getState()
+        else:
+            self.pot.setState(self.state)
+            self.nrestored += 1
+        count = getattr(self.pot, "buildcount", 0)
+        self.buildcounts.append(count - self._lastcount)
+        self._lastcount = count
+
+
 def makeBLJNeighborListPot(natoms, ntypeA = None, rcut = 2.5, boxl=None):
     """
     recreate the binary lj with atom typea A,B from 3 interaction lists AA, BB, AB
@@ -575,6 +904,131 @@ def makeBLJNeighborListPot(natoms, ntypeA = None, rcut = 2.5, boxl=None):
 
 
 
+import unittest
+def _neighbor_pairs_all(coords, rlist, Alist, Blist=None, boxl=None):
+    """the set of neighbor pairs found by checking every pair"""
+    x = np.reshape(coords, [-1,3])
+    if Blist is None:
+        candidates = [(i, j) for i in Alist for j in Alist if i > j]
+    else:
+        candidates = [(i, j) for i in Alist for j in Blist]
+    pairs = set()
+    for i, j in candidates:
+        dr = x[i] - x[j]
+        if boxl is not None:
+            dr -= boxl * np.round(dr / boxl)
+        if (dr**2).sum() <= rlist**2:
+            pairs.add((i, j))
+    return pairs
+
+class TestNeighborListCells(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.natoms = 150
+        self.boxl = 6.
+        self.rlist = 1.7
+        self.coords = np.random.uniform(0, self.boxl, 3*self.natoms)
+        self.Alist = range(0, self.natoms, 2)
+        self.Blist = range(1, self.natoms, 2)
+
+    def check(self, pairs, Blist=None, boxl=None):
+        ref = _neighbor_pairs_all(self.coords, self.rlist, self.Alist, Blist, boxl)
+        plist = [tuple(p) for p in pairs]
+        self.assertEqual(len(plist), len(set(plist)))
+        self.assertEqual(set(plist), ref)
+
+    def test_cells(self):
+        for boxl in [None, self.boxl, 2.5 * self.rlist]:
+            pairs = build_neighbor_list_cells(self.coords, self.rlist, 
+                                              self.Alist, boxl=boxl)
+            self.check(pairs, boxl=boxl)
+            #the larger index is first
+            self.assertTrue(np.all(pairs[:,0] > pairs[:,1]))
+            pairs = build_neighbor_list_cells(self.coords, self.rlist, 
+                                              self.Alist, self.Blist, boxl=boxl)
+            self.check(pairs, Blist=self.Blist, boxl=boxl)
+            self.assertTrue(np.all(pairs[:,0] % 2 == 0))
+
+    def test_subset(self):
+        """the all pairs builder and the cell list give the same lists"""
+        rcut = self.rlist - 0.5
+        for boxl in [None, self.boxl]:
+            for Blist in [None, self.Blist]:
+                nlall = NeighborListSubset(self.natoms, rcut, self.Alist, 
+                                           Blist, boxl=boxl)
+                nlcells = NeighborListSubset(self.natoms, rcut, self.Alist, 
+                                             Blist, boxl=boxl, cell_threshold=10)
+                self.assertFalse(nlall.use_cells)
+                self.assertTrue(nlcells.use_cells)
+                pall = nlall.getList(self.coords)
+                pcells = nlcells.getList(self.coords)
+                self.check(pall, Blist=Blist, boxl=boxl)
+                self.check(pcells, Blist=Blist, boxl=boxl)
+
+                nlbuild = NeighborListSubsetBuild(self.natoms, rcut, self.Alist, 
+                                                  Blist, boxl=boxl, cell_threshold=10)
+                self.assertTrue(nlbuild.use_cells)
+                self.check(nlbuild.buildList(self.coords), Blist=Blist, boxl=boxl)
+
+class TestMarkovStateNeighborLists(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.natoms = 40
+        self.boxl = 4.5
+        self.pot = makeBLJNeighborListPot(self.natoms, boxl=self.boxl)
+        self.coords = np.random.uniform(0, self.boxl, 3*self.natoms)
+
+    def test_state(self):
+        """setState restores the lists saved by getState"""
+        pot = self.pot
+        pot.getEnergy(self.coords)
+        state = pot.getState()
+        lists = [np.copy(p.neighborList.getList(self.coords)) for p in pot.potentials]
+        pot.getEnergy(self.coords + 1.)
+        pot.setState(state)
+        count = pot.buildcount
+        for p, nlist in zip(pot.potentials, lists):
+            self.assertTrue(np.all(p.neighborList.neib_list[:p.neighborList.nlist] == nlist))
+        pot.getEnergy(self.coords)
+        self.assertEqual(pot.buildcount, count)
+
+    def test_reject(self):
+        """after a rejected step the lists of the Markov state are used"""
+        pot = self.pot
+        event = MarkovStateNeighborLists(pot)
+        e0 = pot.getEnergy(self.coords)
+        event(e0, self.coords, True)
+        #a trial minimum far from the Markov state
+        trial = self.coords + np.random.uniform(-1, 1, self.coords.shape)
+        pot.getEnergy(trial)
+        event(0., trial, False)
+        self.assertEqual(event.nrestored, 1)
+        count = pot.buildcount
+        #a small step from the Markov state needs no rebuild
+        step = self.coords + np.random.uniform(-0.05, 0.05, self.coords.shape)
+        e = pot.getEnergy(step)
+        self.assertEqual(pot.buildcount, count)
+        blj = ljpshift.LJpshift(self.natoms, int(self.natoms * 0.8), boxl=self.boxl)
+        self.assertAlmostEqual(e, blj.getEnergy(step), 7)
+
+class TestNeighborListPotentialMulti(unittest.TestCase):
+    def test_needNewList(self):
+        """a displacement with components of opposite sign is detected"""
+        natoms = 10
+        boxl = 5.
+        nl = NeighborListSubsetBuild(natoms, 1.5, range(natoms), boxl=boxl)
+        lj = LJ(rcut=1.5, boxl=boxl)
+        pot = NeighborListPotentialMulti([NeighborListPotentialBuild(nl, lj)],
+                                         natoms, 1.5, boxl=boxl)
+        coords = np.random.uniform(0, boxl, 3*natoms)
+        pot.update(coords)
+        new = coords.copy().reshape(-1,3)
+        new[0,:] += [pot.redo_displacement, -pot.redo_displacement, 0.]
+        self.assertTrue(pot.needNewList(new.reshape(-1)))
+        new[0,:] = coords[:3] + [boxl, -boxl, 0]
+        self.assertFalse(pot.needNewList(new.reshape(-1)))
+
+
 def test(natoms = 40, boxl=None):
     import pygmin.potentials.ljpshiftfast as ljpshift
     import pygmin.defaults as defaults
@@ -0,0 +1,43 @@
+"""
+run the standard quench benchmark and write the results to a json file
+
+usage: python quench_benchmark.py [-n nconf] [-s seed] [-t tol] [outfile]
+
+the default outfile is quench_benchmark.json
+"""
+import sys
+import getopt
+
+from pygmin.utils.benchmark import QuenchBenchmarkSuite
+
+def usage():
+    print __doc__
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:s:t:")
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+    nconf = 5
+    seed = 0
+    tol = 1e-4
+    for o, a in opts:
+        if o == "-h":
+            usage()
+            sys.exit()
+        elif o == "-n":
+            nconf = int(a)
+        elif o == "-s":
+            seed = int(a)
+        elif o == "-t":
+            tol = float(a)
+    outfile = "quench_benchmark.json"
+    if len(args) > 0:
+        outfile = args[0]
+
+    suite = QuenchBenchmarkSuite(nconf=nconf, seed=seed, tol=tol)
+    suite.run()
+    suite.write(outfile)
+    print "results written to", outfile
@@ -5,8 +5,9 @@ import getopt
 
 
 def printEnergies(database):
-    for min1 in database.minima():
-        print "energy ", min1.energy, min1._id
+    ids, energies = database.minima_arrays()
+    for id, energy in zip(ids, energies):
+        print "energy ", energy, id
 
 def printTS(database):
     for ts in database.transition_states():
@@ -25,11 +26,7 @@ def printDist(database):
         #print "ts ", ts.energy, "eigenvalue", ts.eigenval, "connects", m1._id, m2._id, "energies", m1.energy, m2.energy, "distance", dist
 
 def printCoords(id, database):
-    min1 = None
-    for m in database.minima():
-        if m._id == id:
-            min1=m
-            break
+    min1 = database.getMinimum(id)
     if min1 is None:
         return
     print "#energy", min1.energy
@@ -0,0 +1,53 @@
+"""
+rewrite the coordinates and eigenvectors stored in a database
+
+Databases written by older versions of pygmin stored the arrays with
+PickleType.  They can only be read after they are converted, which needs
+--allow-pickle.  Unpickling can execute arbitrary code, so only convert
+files you trust.  Converting also makes reading faster, and with --float32 
+or --compress the file smaller.
+"""
+import os
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+def main():
+    parser = OptionParser(usage = "usage: %prog [options] storage")
+    parser.add_option("--float32",
+                      dest="float32", action="store_true",
+                      help="store the arrays in single precision")
+    parser.add_option("--compress",
+                      dest="compress", action="store_true",
+                      help="compress the arrays with zlib")
+    parser.add_option("--allow-pickle",
+                      dest="allow_pickle", action="store_true",
+                      help="convert the arrays pickled by older versions of pygmin")
+    parser.add_option("--no-vacuum",
+                      dest="vacuum", action="store_false", default=True,
+                      help="don't run VACUUM after the conversion")
+    
+    (options, args) = parser.parse_args()
+    
+    if(len(args) != 1):
+        parser.print_help()
+        exit(-1)
+    
+    from pygmin.storage.database import Database, convert_array_storage
+    
+    dtype = np.float64
+    if options.float32:
+        dtype = np.float32
+    
+    size = os.path.getsize(args[0])
+    db = Database(db=args[0])
+    t0 = time.time()
+    n = convert_array_storage(db, dtype=dtype, compress=bool(options.compress),
+                              vacuum=options.vacuum, 
+                              allow_pickle=bool(options.allow_pickle))
+    print "converted %d arrays in %.1f seconds" % (n, time.time() - t0)
+    print "file size %d -> %d bytes" % (size, os.path.getsize(args[0]))
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,40 @@
-from pygmin.storage.database import Database, Minimum, TransitionState
-import time
-import numpy as np
-from pygmin.potentials.lj import LJ
-
-natoms = 38
-pot = LJ()
-# open database
-db = Database(db="storage.sqlite")
-
-def read_coords(file):
-    coords = np.zeros(3*natoms)
-    for i in xrange(natoms):
-        x = file.readline().split()
-        coords[i*3:i*3+3] = [float(y) for y in x]
-    return coords 
-
-
-# counter to keep track of added minima
-mini=1
-minima={}
-
-# for timing
-tt = t0 = time.time()
-
-# open coordinate file
-fcoords = open("extractedmin")
-
-print "Reading minima"
-# loop over all lines in min
-for line in open("min.data"):
-    coords = read_coords(fcoords) 
-    energy, frequency, pgorder, itx, ity, itz = line.split()    
-    min1 = Minimum(float(energy), coords)    
-    db.session.add(min1)
-    minima[mini]=min1
-    if(mini%10000 == 0):
-        print "commiting the next 10000 minima, %d in total"%(mini)
-        db.session.commit()
-    mini+=1
-           
-
-print "%.1f seconds"%(time.time() - tt)
-tt = time.time()
-print "Commiting changes to database"
-db.session.commit()
-print "%.1f seconds"%(time.time() - tt)
-tt = time.time()
-
-
-print "Reading transition states"
-fcoords = open("extractedts")
-tsi=1
-for line in open("ts.data"):
-    coords = read_coords(fcoords) 
-    energy, frequency, pgorder, min1, min2, itx, ity, itz = line.split()
-    ts = TransitionState(float(energy), coords, minima[int(min1)], minima[int(min2)])
-    db.session.add(ts)
-    #db.addTransitionState(float(energy), None, minima[int(min1)], minima[int(min2)], commit=False)
-    if(tsi%10000 == 0):
-        print "commiting the next 10000 transition states, %d in total"%(tsi)
-        db.session.commit()
-    tsi+=1
-print "%.1f seconds"%(time.time() - tt)
-tt = time.time()
-print "Commiting changes to database"
-db.session.commit()
-print "%.1f seconds"%(time.time() - tt)
-print "Done after %.1f seconds"%(time.time() - t0)
+"""
+convert an OPTIM / PATHSAMPLE database into a pygmin database
+
+min.data and ts.data are read from the current directory, the coordinates
+from points.min and points.ts if they exist.
+"""
+from optparse import OptionParser
+
+from pygmin.storage.database import Database
+from pygmin.storage.pathsample_import import import_pathsample
+
+def main():
+    parser = OptionParser(usage = "usage: %prog [options] storage")
+    parser.add_option("--mindata", dest="mindata", default="min.data",
+                      help="the file with the minima, default min.data")
+    parser.add_option("--tsdata", dest="tsdata", default="ts.data",
+                      help="the file with the transition states, default ts.data")
+    parser.add_option("--pointsmin", dest="pointsmin", default="points.min",
+                      help="the coordinates of the minima, default points.min")
+    parser.add_option("--pointsts", dest="pointsts", default="points.ts",
+                      help="the coordinates of the transition states, default points.ts")
+    parser.add_option("--no-coords", dest="coords", action="store_false", default=True,
+                      help="don't store the coordinates")
+    
+    (options, args) = parser.parse_args()
+    
+    storage = "storage.sqlite"
+    if len(args) > 0:
+        storage = args[0]
+    
+    pointsmin, pointsts = options.pointsmin, options.pointsts
+    if not options.coords:
+        pointsmin = pointsts = None
+    
+    db = Database(db=storage)
+    import_pathsample(db, mindata=options.mindata, tsdata=options.tsdata,
+                      pointsmin=pointsmin, pointsts=pointsts)
+
+if __name__ == "__main__":
+    main()
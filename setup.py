@@ -24,6 +24,7 @@ fmodules.add_module("pygmin/mindist/overlap.f90")
 fmodules.add_module("pygmin/mindist/minperm.f90")
 fmodules.add_module("pygmin/optimize/mylbfgs_fort.f90")
 fmodules.add_module("pygmin/optimize/mylbfgs_updatestep.f90")
+fmodules.add_module("pygmin/optimize/_lbfgs_engine.f90")
 fmodules.add_module("pygmin/potentials/fortran/AT.f")
 fmodules.add_module("pygmin/potentials/fortran/ljpshiftfort.f")
 fmodules.add_module("pygmin/potentials/fortran/lj.f90")